@@ -1,21 +1,98 @@
 # backend/app.py
-from fastapi import FastAPI, HTTPException, Header, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from datetime import datetime
-from typing import Optional
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Union
+from zoneinfo import ZoneInfo
 import os
+import uuid
 import uvicorn
 
 # Load environment variables from .env
 load_dotenv()
 
 # Import your existing Python logic
-from scripts.manager_daily import DailyBatch
+import worker
+from worker import JOB_WORKER_MODE
 from scripts.manager_new_activity import NewActivity
+from scripts.manager_rolling import RollingScheduler, DAILY_BATCH_MODE
+from scripts.state_store import OpenRowStore, STATE_STORE_ENABLED
+from scripts.habitat_sensors import SensorStore, METRICS, GRANULARITY_SECONDS
+from scripts.derived_status import DerivedStatus
+from scripts.simulator import Simulator
+from scripts import activity_import, dependencies, reports, rollups
+from utils.supabase_client import get_client
+from utils.job_queue import JobQueue, JobWorker
+from utils import admission, lanes, resilience
+from utils.idempotency import IdempotencyStore, fingerprint
 
-app = FastAPI(title="Plant Dashboard API")
+# ============================================
+# IN-PROCESS STORES
+# ============================================
+# In-process copy of the open rows (see scripts/state_store.py for the STATE_STORE_* settings)
+state_store = OpenRowStore() if STATE_STORE_ENABLED else None
+
+# Read-time severities and status (see scripts/derived_status.py for SEVERITY_MODE and the cache settings)
+derived_status = DerivedStatus(supabase_factory=get_client, state_store=state_store)
+
+# What-if simulations over a cached snapshot of the open factors (see scripts/simulator.py)
+simulator = Simulator(supabase_factory=get_client, state_store=state_store)
+
+# Habitat sensor readings and rollups (see scripts/habitat_sensors.py for the SENSOR_* settings)
+sensor_store = SensorStore()
+
+# ============================================
+# JOB QUEUE
+# ============================================
+def on_job_done(job):
+    """A batch committed by the worker process: refresh the open rows now"""
+    if job["kind"] in ("daily_batch", "activity_import", "lookup_change") and state_store is not None:
+        state_store.request_reconcile()
+    if job["kind"] == "activity_import":
+        derived_status.invalidate((job["result"] or {}).get("plant_ids", []))
+    if job["kind"] == "lookup_change":
+        derived_status.clear()
+
+# Jobs run in a worker process (see worker.py for the JOB_WORKER_* settings)
+job_queue = JobQueue()
+if JOB_WORKER_MODE == "inline":
+    job_worker = JobWorker(job_queue, handlers=worker.handlers(state_store))
+else:
+    # external: only watch for the jobs a standalone `python worker.py` completes
+    job_worker = worker.WorkerProcess(job_queue, on_job_done=on_job_done, spawn=JOB_WORKER_MODE == "process")
+rolling_scheduler = RollingScheduler(job_queue, supabase_factory=get_client)
+# Recalculates the dependents of changed plant types / factor weights (see scripts/dependencies.py)
+lookup_watcher = dependencies.LookupWatcher(job_queue, supabase_factory=get_client)
+
+# ============================================
+# APP
+# ============================================
+# Starts the stores and the job queue services above with the app, stops them on shutdown
+@asynccontextmanager
+async def lifespan(app):
+    # Restore the open rows snapshot, then reconcile with the database in the background
+    if state_store is not None:
+        state_store.start(supabase_factory=get_client)
+    sensor_store.start(supabase_factory=get_client)
+    # Jobs left behind by a previous process are picked up again once their lease expires
+    job_worker.start()
+    if DAILY_BATCH_MODE == "rolling":
+        rolling_scheduler.start()
+    lookup_watcher.start()
+    yield
+    lookup_watcher.stop()
+    rolling_scheduler.stop()
+    job_worker.stop(timeout=5)
+    sensor_store.stop(supabase_factory=get_client)
+    if state_store is not None:
+        state_store.stop()
+
+app = FastAPI(title="Plant Dashboard API", lifespan=lifespan)
 
 origins = [
     "http://127.0.0.1:5501",            # local dev
@@ -38,6 +115,15 @@ app.add_middleware(
 # ============================================
 CRON_SECRET = os.getenv("CRON_SECRET")
 
+# Admission control (see utils/admission.py for the ADMISSION_* settings)
+new_activity_admission = admission.get_controller("new_activity", concurrency=4, queue=16, timeout=10)
+
+# Per-plant execution lanes (see utils/lanes.py for the LANES_* settings)
+plant_lanes = lanes.get_lanes("plant", queue=8, timeout=30)
+
+# Replay cache for Idempotency-Key retries (see utils/idempotency.py for the IDEMPOTENCY_* settings)
+idempotency_store = IdempotencyStore()
+
 # ============================================
 # PYDANTIC MODELS
 # ============================================
@@ -51,6 +137,28 @@ class PlantActivity(BaseModel):
     result: Optional[str] = None
     user_id: str
 
+class SensorReading(BaseModel):
+    metric: str  # "humidity", "temperature", "light"
+    value: float
+    recorded_at: Union[float, str]  # ISO timestamp (naive = UTC) or epoch seconds
+
+class HabitatReadings(BaseModel):
+    habitat_id: str
+    readings: List[SensorReading]
+
+class LookupChange(BaseModel):
+    # Supabase database webhook payload
+    type: str  # "INSERT", "UPDATE", "DELETE"
+    table: str
+    record: Optional[Dict] = None
+    old_record: Optional[Dict] = None
+
+class Simulation(BaseModel):
+    weights: Dict[str, float] = {}  # factor_code -> candidate factor_lookup weight
+    bands: Dict[str, List[int]] = {}  # factor_code -> days overdue from which severity 1, 2, 3 start
+    today: Optional[str] = None
+    refresh: bool = False  # reload the snapshot of the open factors first
+
 
 # ============================================
 # ENDPOINTS
@@ -61,15 +169,34 @@ class PlantActivity(BaseModel):
 def root():
     return {"message": "Backend is running"}
 
+# Runtime metrics
+@app.get("/api/metrics")
+def runtime_metrics():
+    return {
+        "admission": admission.metrics(),
+        "database": resilience.metrics(),
+        "derived_status": derived_status.metrics(),
+        "idempotency": idempotency_store.metrics(),
+        "jobs": job_queue.counts(),
+        "lanes": lanes.metrics(),
+        "lookup_watcher": lookup_watcher.metrics(),
+        "job_worker": job_worker.metrics() if JOB_WORKER_MODE != "inline" else {"mode": JOB_WORKER_MODE},
+        "sensors": sensor_store.metrics(),
+        "simulator": simulator.metrics(),
+        "state_store": state_store.metrics() if state_store is not None else None
+    }
+
 # Daily Automatic Routine
 @app.post("/cron/daily")
 async def daily_batch(
-    background_tasks: BackgroundTasks,
     authorization: Optional[str] = Header(None)
 ):
     """
     Runs daily scheduled calculations (severity updates, etc.)
     Secured via Authorization header.
+    The batch is queued once per logical run date; repeated triggers return the same job.
+    In rolling mode (DAILY_BATCH_MODE=rolling) it queues one batch per timezone whose
+    local day has started; call it every 15-60 minutes.
     """
 
     # 🔐 Security check
@@ -77,16 +204,25 @@ async def daily_batch(
         raise HTTPException(status_code=403, detail="Forbidden")
 
     try:
-        def run_batch():
-            batch = DailyBatch()
-            batch.run()
+        if DAILY_BATCH_MODE == "rolling":
+            queued = await run_in_threadpool(rolling_scheduler.enqueue_due)
+            return {
+                "status": "started",
+                "message": f"{sum(job['created'] for job in queued)} timezone batches queued",
+                "jobs": queued,
+                "triggered_at": datetime.now().isoformat()
+            }
 
-        # ⚡ Run in background so cron service doesn't timeout
-        background_tasks.add_task(run_batch)
+        run_date = datetime.now(ZoneInfo("America/New_York")).date().isoformat()
+
+        # ⚡ Queue the batch so cron service doesn't timeout
+        job = job_queue.enqueue("daily_batch", payload={"run_date": run_date}, dedupe_key=run_date)
 
         return {
-            "status": "started",
-            "message": "Daily batch execution started",
+            "status": "started" if job["created"] else job["status"],
+            "message": "Daily batch execution started" if job["created"] else "Daily batch already queued for this date",
+            "job_id": job["job_id"],
+            "run_date": run_date,
             "triggered_at": datetime.now().isoformat()
         }
 
@@ -99,46 +235,281 @@ async def daily_batch(
 
 # Daily Routine Manual Trigger
 @app.post("/api/manual-daily-batch")
-async def manual_daily_batch(background_tasks: BackgroundTasks):
+async def manual_daily_batch():
     # This acts as a bridge. It calls your logic directly, 
     # bypassing the need for the JS to know the CRON_SECRET.
+    # Manual runs are never deduped: each click queues a new run.
     try:
-        def run_batch():
-            batch = DailyBatch()
-            batch.run()
-
-        background_tasks.add_task(run_batch)
-        return {"status": "started", "message": "Manual trigger successful"}
+        run_date = datetime.now(ZoneInfo("America/New_York")).date().isoformat()
+        job = job_queue.enqueue("daily_batch", payload={"run_date": run_date})
+        return {"status": "started", "message": "Manual trigger successful", "job_id": job["job_id"]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Background job status
+@app.get("/api/jobs/{job_id}")
+def job_status(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+# Bulk import of historical activity (CSV / NDJSON)
+@app.post("/api/imports/activity")
+async def import_activity(request: Request, user_id: str, format: str = "csv"):
+    """
+    Imports years of activity logs in one job instead of one new activity per row
+    The raw request body (a CSV file with a header row, or NDJSON) is streamed to
+    IMPORT_DIR and imported by the worker; poll GET /api/jobs/{job_id}: while it
+    runs, the job's result holds the import's progress (see scripts/activity_import.py)
+    """
+    if format not in activity_import.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format '{format}'")
+
+    os.makedirs(activity_import.IMPORT_DIR, exist_ok=True)
+    path = os.path.abspath(os.path.join(activity_import.IMPORT_DIR, f"{uuid.uuid4()}.{format}"))
+    size = 0
+    with open(path, "wb") as file:
+        async for chunk in request.stream():
+            file.write(chunk)
+            size += len(chunk)
+    if size == 0:
+        os.remove(path)
+        raise HTTPException(status_code=400, detail="Empty file")
+
+    job = job_queue.enqueue("activity_import", payload={"path": path, "user_id": user_id, "format": format})
+    return {"status": "started", "job_id": job["job_id"], "bytes": size}
+
+
+# Lookup row changed (plant type interval, factor weight): recalculate its dependents
+@app.post("/api/lookups/changes")
+def lookup_changes(
+    lookupChange: LookupChange,
+    authorization: Optional[str] = Header(None)
+):
+    """
+    Receives a database webhook for plant_type_lookup / factor_lookup and queues the
+    recalculation of exactly the dependent plants (the lookup watcher finds the same
+    changes by polling; a change is only queued once)
+    """
+    # 🔐 Security check
+    if CRON_SECRET and authorization != CRON_SECRET:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    change = dependencies.changes(lookupChange.table, lookupChange.old_record, lookupChange.record)
+    if change is None:
+        return {"status": "ignored", "message": "No tracked column changed"}
+    job = lookup_watcher.submit(change)
+    return {"status": "started" if job["created"] else job["status"], "job_id": job["job_id"], "change": change}
+
 
 # New activity endpoint (watering, fertilizing, etc.)
 @app.post("/api/new-activity")
-async def new_activity(activityData: PlantActivity):
+async def new_activity(
+    activityData: PlantActivity,
+    idempotency_key: Optional[str] = Header(None)
+):
     """
     Logs a new activity (watering, fertilizing, etc.) for a plant
     Triggers factor calculations, status updates, and schedule management
+    Activities of the same plant run one at a time, in arrival order (other plants run in parallel)
+    Rejected with 429/503 + Retry-After when too many activities are in progress
+    With an Idempotency-Key header, retries replay the first response instead of logging again
     """
-    try:
+    def process_activity():
         # Create NewActivity instance and run the orchestrator
-        new_activity = NewActivity()
-        stats = new_activity.run(activityData = activityData)
-        
-        return {
-            "status": "success",
-            "message": f"{activityData.activity_type_code.capitalize()} activity logged and processed successfully",
-            "logged_at": datetime.now().isoformat(),
-            "stats": stats,
-            "data": activityData.dict()
+        new_activity = NewActivity(state_store=state_store)
+        try:
+            return new_activity.run(activityData = activityData)
+        finally:
+            derived_status.invalidate([activityData.plant_id])
+
+    async def handle():
+        # Same plant: wait for its lane before taking an admission slot, so a busy plant never holds one
+        async with plant_lanes.lane(activityData.plant_id), new_activity_admission.admit():
+            try:
+                # Run the pandas pipeline off the event loop so waiting requests stay responsive
+                stats = await run_in_threadpool(process_activity)
+
+                return {
+                    "status": "success",
+                    "message": f"{activityData.activity_type_code.capitalize()} activity logged and processed successfully",
+                    "logged_at": datetime.now().isoformat(),
+                    "stats": stats,
+                    "data": activityData.dict()
+                }
+
+            except Exception as e:
+                print(f"Error processing activity: {str(e)}")
+                raise HTTPException(
+                    status_code=500, 
+                    detail=f"Failed to process activity: {str(e)}"
+                )
+
+    if not idempotency_key:
+        return await handle()
+
+    # 🔁 Replay (or wait for) the first request with this key
+    response, replayed = await idempotency_store.run(
+        f"new_activity:{activityData.user_id}:{idempotency_key}",
+        fingerprint(activityData.dict()),
+        handle,
+        should_store=lambda response: response["stats"].get("errors", 0) == 0
+    )
+    return JSONResponse(content=response, headers={"Idempotent-Replayed": "true" if replayed else "false"})
+
+
+# Current severities and status, derived at read time
+@app.get("/api/plants/status")
+def plants_status(plant_ids: str, today: Optional[str] = None):
+    """
+    Schedule severities, factor contribution severities and status of plants
+    (comma separated ids), derived from their open rows for today's date
+    """
+    plant_ids = [plant_id for plant_id in plant_ids.split(",") if plant_id]
+    if not plant_ids:
+        raise HTTPException(status_code=400, detail="No plant_ids given")
+    today = today or datetime.now(ZoneInfo("America/New_York")).date().isoformat()
+    try:
+        today = datetime.fromisoformat(today).date().isoformat()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date '{today}'")
+    return {"today": today, "plants": derived_status.plants(plant_ids, today)}
+
+
+# What-if simulation of factor weights and severity bands
+@app.post("/api/simulate")
+def simulate(simulation: Simulation):
+    """
+    Status distribution of the fleet with candidate weights / severity bands vs the current ones
+    Nothing is written; see scripts/simulator.py
+    """
+    try:
+        return simulator.simulate(simulation.weights, simulation.bands, simulation.today, simulation.refresh)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# Habitat sensor readings endpoint
+@app.post("/api/habitat-readings")
+def habitat_readings(batches: List[HabitatReadings]):
+    """
+    Accepts batches of sensor readings, one batch per habitat
+    Readings are aggregated in memory; hourly / daily rollups are written in bulk
+    every SENSOR_FLUSH_SECONDS, not one row per reading
+    """
+    results = {
+        batch.habitat_id: sensor_store.ingest(batch.habitat_id, [reading.dict() for reading in batch.readings])
+        for batch in batches
+    }
+    return {
+        "status": "success",
+        "accepted": sum(result["accepted"] for result in results.values()),
+        "rejected": sum(result["rejected"] for result in results.values()),
+        "habitats": results
+    }
+
+# Latest sensor aggregates of a habitat
+@app.get("/api/habitat-readings/{habitat_id}/latest")
+def habitat_latest(habitat_id: str, granularity: str = "hour"):
+    if granularity not in GRANULARITY_SECONDS:
+        raise HTTPException(status_code=400, detail=f"Unknown granularity '{granularity}'")
+    return {
+        "habitat_id": habitat_id,
+        "granularity": granularity,
+        "metrics": {
+            metric: sensor_store.latest(habitat_id, metric, granularity)
+            for metric in METRICS
         }
-        
-    except Exception as e:
-        print(f"Error processing activity: {str(e)}")
-        raise HTTPException(
-            status_code=500, 
-            detail=f"Failed to process activity: {str(e)}"
+    }
+
+
+# ============================================
+# REPORTS
+# ============================================
+def check_format(format: str):
+    """Rejects an unknown format before any history is read"""
+    if format not in reports.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format '{format}' (expected csv or ndjson)")
+
+def stream_rows(rows, columns, format: str, filename: str):
+    """Streams report / export rows as CSV or NDJSON without holding them in memory"""
+    if format == "csv":
+        return StreamingResponse(reports.csv_lines(rows, columns), media_type="text/csv",
+                                 headers={"Content-Disposition": f'attachment; filename="{filename}.csv"'})
+    if format == "ndjson":
+        return StreamingResponse(reports.ndjson_lines(rows), media_type="application/x-ndjson")
+    raise HTTPException(status_code=400, detail=f"Unknown format '{format}' (expected csv or ndjson)")
+
+# Watering compliance, lateness and overdue counts
+@app.get("/api/reports/schedule")
+def schedule_report(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    period: str = "month",
+    group_by: str = "habitat,plant_type",
+    factor_code: str = "watering_due",
+    user_id: Optional[str] = None,
+    format: str = "ndjson"
+):
+    """
+    Schedule compliance report, one row per period / habitat / plant type
+    History is paged and aggregated as the response streams (see scripts/reports.py)
+    """
+    check_format(format)
+    try:
+        rows = reports.schedule_report(
+            get_client(), start_date, end_date, period,
+            group_by=[dimension for dimension in group_by.split(",") if dimension],
+            factor_code=factor_code, user_id=user_id
         )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return stream_rows(rows, reports.REPORT_COLUMNS, format, f"schedule_report_{period}")
+
+# Raw history exports (activity, status, schedule)
+@app.get("/api/exports/{name}")
+def history_export(
+    name: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    user_id: Optional[str] = None,
+    format: str = "csv"
+):
+    if name not in reports.EXPORTS:
+        raise HTTPException(status_code=404, detail=f"Unknown export '{name}'")
+    check_format(format)
+    try:
+        rows = reports.export(get_client(), name, start_date, end_date, user_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return stream_rows(rows, reports.EXPORTS[name][3], format, f"{name}_export")
+
+
+# Status history of a plant (daily rollups written by the daily batch)
+@app.get("/api/plants/{plant_id}/status-history")
+def status_history(
+    plant_id: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    granularity: str = "day"
+):
+    """Status, worst severity and overdue days per day / week / month (default: last 90 days)"""
+    end_date = end_date or datetime.now(ZoneInfo("America/New_York")).date().isoformat()
+    try:
+        reports.check_dates(start_date, end_date)
+        start_date = start_date or (datetime.fromisoformat(end_date) - timedelta(days=90)).date().isoformat()
+        series = rollups.history(get_client(), plant_id, start_date, end_date, granularity)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "plant_id": plant_id,
+        "start_date": start_date,
+        "end_date": end_date,
+        "granularity": granularity,
+        "series": series
+    }
 
 
 # ============================================
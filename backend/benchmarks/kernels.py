@@ -0,0 +1,314 @@
+"""
+KERNELS.PY - Microbenchmarks of the calculators
+Times each DataFrame kernel in isolation on seeded inputs of 1k to 1M rows
+(1k, 10k and 100k by default; add 1000000 to --sizes for the 1M runs),
+plus the merge/diff stages of DailyBatch, and fails when one gets slower (or
+allocates more) than the stored baseline by more than a margin.
+
+Kernels:
+    factor.watering_due             factors/watering_due.run
+    contribution.watering_due       factors_contribution/watering_due.run
+    schedule.severity               schedule/severity.run
+    plant_status                    manager_plant_status.run
+    create_schedule                 manager_schedule.create_schedule
+    daily.compact                   DailyBatch._compact
+    daily.schedule_diff             DailyBatch._schedule_severity_updates
+    daily.contribution_diff         DailyBatch._factor_contribution_updates
+    daily.status_diff               DailyBatch._status_updates
+
+For each kernel and size the report has the median / min time of the repeats,
+and (from one extra traced run) the peak traced allocation and the number of
+memory blocks the call left allocated.
+
+Timings depend on the machine: refresh the baseline (--update-baseline) on the
+machine that runs the comparison.
+
+Usage:
+    python -m benchmarks.kernels                              compare with benchmarks/baseline.json
+    python -m benchmarks.kernels --sizes 1000000 --kernels schedule.severity,daily.schedule_diff
+    python -m benchmarks.kernels --update-baseline
+"""
+import os
+import gc
+import sys
+import json
+import time
+import uuid
+import argparse
+import platform
+import statistics
+import tracemalloc
+from contextlib import redirect_stdout
+from typing import Callable, Dict, List
+import numpy as np
+import pandas as pd
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_SIZES = "1000,10000,100000"
+TODAY = pd.Timestamp("2026-03-04")
+FACTOR_CODES = ["watering_due", "fertilizing_due", "light", "humidity"]
+
+KERNELS = (
+    "factor.watering_due", "contribution.watering_due", "schedule.severity", "plant_status", "create_schedule",
+    "daily.compact", "daily.schedule_diff", "daily.contribution_diff", "daily.status_diff"
+)
+
+# Differences below these are noise, whatever the margin says
+MIN_SECONDS_DELTA = 0.002
+MIN_MB_DELTA = 1.0
+
+
+# ============================================
+# SEEDED INPUTS
+# ============================================
+def _uuids(rng: np.random.Generator, n: int) -> np.ndarray:
+    high = rng.integers(0, 2**63, size=n, dtype=np.int64).astype(np.uint64)
+    low = rng.integers(0, 2**63, size=n, dtype=np.int64).astype(np.uint64)
+    return np.array([str(uuid.UUID(int=(int(h) << 64) | int(l))) for h, l in zip(high, low)], dtype=object)
+
+
+def _days(rng: np.random.Generator, n: int, low: int, high: int) -> pd.Series:
+    return pd.Series(TODAY + pd.to_timedelta(rng.integers(low, high, size=n), unit="D"))
+
+
+def make_inputs(rows: int, seed: int = 42) -> Dict[str, pd.DataFrame]:
+    """Seeded frames with `rows` rows in each kernel's main input"""
+    rng = np.random.default_rng(seed)
+    n_plants = max(1, rows // 8)
+    plant_ids = _uuids(rng, n_plants)
+    plant_types = _uuids(rng, 16)
+    user_ids = _uuids(rng, 4)
+
+    plants = pd.DataFrame({
+        "plant_id": plant_ids,
+        "plant_type_id": rng.choice(plant_types, n_plants),
+        "acquisition_date": _days(rng, n_plants, -700, -30),
+        "watering_interval_days": rng.integers(3, 15, size=n_plants)
+    })
+    activity = pd.DataFrame({
+        "plant_id": rng.choice(plant_ids, rows),
+        "activity_date": _days(rng, rows, -365, 0),
+        "quantifier": np.nan
+    })
+
+    factor_rows = rows
+    factor_plants = rng.choice(plant_ids, factor_rows)
+    plant_factor_ids = _uuids(rng, factor_rows)
+    factor_codes = rng.choice(FACTOR_CODES, factor_rows)
+    plant_factor = pd.DataFrame({
+        "plant_factor_id": plant_factor_ids,
+        "plant_id": factor_plants,
+        "factor_code": np.where(rng.random(factor_rows) < 0.5, "watering_due", factor_codes),
+        "factor_date": _days(rng, factor_rows, -14, 8),
+        "factor_float": np.nan,
+        "confidence_score": rng.random(factor_rows).round(2)
+    })
+    contribution = pd.DataFrame({
+        "plant_factor_contribution_id": _uuids(rng, factor_rows),
+        "plant_factor_id": plant_factor_ids,
+        "plant_id": factor_plants,
+        "factor_code": plant_factor["factor_code"],
+        "severity": rng.integers(0, 4, size=factor_rows)
+    })
+    schedule = pd.DataFrame({
+        "schedule_id": _uuids(rng, rows),
+        "plant_id": rng.choice(plant_ids, rows),
+        "schedule_date": _days(rng, rows, -14, 8).dt.strftime("%Y-%m-%d"),
+        "schedule_severity": rng.integers(0, 4, size=rows),
+        "user_id": rng.choice(user_ids, rows)
+    })
+    status = pd.DataFrame({
+        "plant_status_id": _uuids(rng, n_plants),
+        "plant_id": plant_ids,
+        "status_code": rng.integers(0, 4, size=n_plants),
+        "user_id": rng.choice(user_ids, n_plants)
+    })
+    factor_lookup = pd.DataFrame({
+        "factor_code": FACTOR_CODES,
+        "weight": [0.4, 0.2, 0.2, 0.2],
+        "factor_category": ["Water", "Fertilize", "Light", "Humidity"]
+    })
+    return {
+        "plants": plants,
+        "activity": activity,
+        "plant_factor": plant_factor,
+        "plant_factor_contribution": contribution,
+        "schedule": schedule,
+        "plant_status": status,
+        "factor_lookup": factor_lookup
+    }
+
+
+# ============================================
+# KERNELS
+# ============================================
+def kernels(inputs: Dict[str, pd.DataFrame]) -> Dict[str, Callable[[], object]]:
+    """{ name: zero-argument call } over one set of inputs"""
+    from scripts.factors import registry as factor_registry
+    from scripts.factors_contribution import registry as factor_contribution_registry
+    from scripts.schedule.severity import run as schedule_severity
+    from scripts.manager_plant_status import run as plant_status
+    from scripts.manager_schedule import create_schedule
+    from scripts.manager_daily import DailyBatch
+
+    batch = DailyBatch(run_date=TODAY.date().isoformat(), offline=True)
+    schedule_df, factor_df, contribution_df, status_df = batch._compact(
+        inputs["schedule"].copy(), inputs["plant_factor"].copy(),
+        inputs["plant_factor_contribution"].copy(), inputs["plant_status"].copy()
+    )
+    _, contribution_calculated_df = batch._factor_contribution_updates(factor_df, contribution_df)
+    contribution_calculated_df = contribution_calculated_df.dropna(subset=["severity"])
+    severity_input = inputs["plant_factor_contribution"][["plant_id", "factor_code", "severity"]].astype({"severity": "float64"})
+
+    return {
+        "factor.watering_due": lambda: factor_registry["watering_due"].run(
+            inputs["plants"], inputs["activity"], run_id="bench"),
+        "contribution.watering_due": lambda: factor_contribution_registry["watering_due"].run(
+            inputs["plant_factor"], today=TODAY, run_id="bench"),
+        "schedule.severity": lambda: schedule_severity(inputs["schedule"], TODAY, run_id="bench"),
+        "plant_status": lambda: plant_status(
+            severity_input, run_id="bench", supabase=None, factor_lookup_df=inputs["factor_lookup"]),
+        "create_schedule": lambda: create_schedule(
+            inputs["plant_factor"], today_date=TODAY, run_id="bench", supabase=None,
+            factor_lookup_df=inputs["factor_lookup"]),
+        "daily.compact": lambda: batch._compact(
+            inputs["schedule"].copy(), inputs["plant_factor"].copy(),
+            inputs["plant_factor_contribution"].copy(), inputs["plant_status"].copy()),
+        "daily.schedule_diff": lambda: batch._schedule_severity_updates(schedule_df),
+        "daily.contribution_diff": lambda: batch._factor_contribution_updates(factor_df, contribution_df),
+        "daily.status_diff": lambda: batch._status_updates(contribution_calculated_df, status_df, inputs["factor_lookup"])
+    }
+
+
+# ============================================
+# MEASURE
+# ============================================
+def measure(fn: Callable[[], object], repeat: int, track_alloc: bool = True) -> Dict:
+    """Median / min seconds of `repeat` calls, plus allocations of one traced call"""
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    result = {
+        "median_s": round(statistics.median(times), 5),
+        "min_s": round(min(times), 5),
+        "repeat": repeat
+    }
+    if track_alloc:
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        kept = fn()
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["alloc_peak_mb"] = round(peak / (1024 * 1024), 2)
+        result["alloc_blocks"] = sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+        del kept
+    return result
+
+
+def run_benchmarks(sizes: List[int], names: List[str], repeat: int, seed: int, track_alloc: bool) -> Dict:
+    results: Dict[str, Dict[str, Dict]] = {}
+    for size in sizes:
+        print(f"  Generating {size} rows...", file=sys.stderr)
+        inputs = make_inputs(size, seed)
+        with redirect_stdout(open(os.devnull, "w")):
+            calls = kernels(inputs)
+        # Fewer repeats for the largest inputs
+        size_repeat = max(1, repeat if size <= 100_000 else repeat // 3)
+        for name in names:
+            print(f"  {name} @ {size}", file=sys.stderr)
+            with redirect_stdout(open(os.devnull, "w")):
+                results.setdefault(name, {})[str(size)] = measure(calls[name], size_repeat, track_alloc)
+    return results
+
+
+def compare(results: Dict, baseline: Dict, margin: float, alloc_margin: float) -> List[Dict]:
+    """Kernels that got slower / allocate more than the baseline by more than the margin"""
+    regressions = []
+    for name, sizes in results.items():
+        for size, current in sizes.items():
+            reference = baseline.get("results", {}).get(name, {}).get(size)
+            if reference is None:
+                continue
+            slower = current["median_s"] - reference["median_s"]
+            if slower > MIN_SECONDS_DELTA and current["median_s"] > reference["median_s"] * (1 + margin):
+                regressions.append({"kernel": name, "rows": int(size), "metric": "median_s",
+                                    "baseline": reference["median_s"], "current": current["median_s"]})
+            if "alloc_peak_mb" in current and "alloc_peak_mb" in reference:
+                more = current["alloc_peak_mb"] - reference["alloc_peak_mb"]
+                if more > MIN_MB_DELTA and current["alloc_peak_mb"] > reference["alloc_peak_mb"] * (1 + alloc_margin):
+                    regressions.append({"kernel": name, "rows": int(size), "metric": "alloc_peak_mb",
+                                        "baseline": reference["alloc_peak_mb"], "current": current["alloc_peak_mb"]})
+    return regressions
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(description="Calculator microbenchmarks")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help="comma separated row counts")
+    parser.add_argument('--kernels', help="comma separated kernel names (default: all)")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--margin', type=float, default=0.25, help="allowed slowdown (0.25 = 25%%)")
+    parser.add_argument('--alloc-margin', type=float, default=0.10, help="allowed growth of the peak allocation")
+    parser.add_argument('--no-alloc', action='store_true', help="skip the traced allocation run")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true', help="store these results as the baseline")
+    parser.add_argument('--output', help="write the report to this file")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    names = args.kernels.split(',') if args.kernels else list(KERNELS)
+    unknown = sorted(set(names) - set(KERNELS))
+    if unknown:
+        parser.error(f"unknown kernels {unknown} (expected {list(KERNELS)})")
+
+    results = run_benchmarks(sizes, names, args.repeat, args.seed, not args.no_alloc)
+    report = {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "machine": f"{platform.system()} {platform.machine()} ({os.cpu_count()} cpus)",
+            "seed": args.seed
+        },
+        "results": results
+    }
+
+    if args.update_baseline:
+        baseline = {"meta": report["meta"], "results": {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline["results"] = json.load(f).get("results", {})
+        for name, by_size in results.items():
+            baseline["results"].setdefault(name, {}).update(by_size)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"✓ Baseline written to {args.baseline}", file=sys.stderr)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report["baseline"] = baseline.get("meta")
+        report["regressions"] = compare(results, baseline, args.margin, args.alloc_margin)
+    else:
+        print(f"Warning: no baseline at {args.baseline} (run with --update-baseline)", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+
+    if report.get("regressions"):
+        print(f"❌ {len(report['regressions'])} regressions over the baseline", file=sys.stderr)
+        sys.exit(1)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
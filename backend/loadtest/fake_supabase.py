@@ -0,0 +1,222 @@
+"""
+FAKE_SUPABASE.PY - Local stand-in for the Supabase REST/RPC surface
+A small threaded HTTP server that answers the PostgREST calls the backend
+makes (GET /rest/v1/<table> with select / eq / is / in / order filters, and
+POST /rest/v1/rpc/<name>) from seeded in-memory tables, after an injected
+latency. Point SUPABASE_URL at it and the real supabase client works unchanged.
+
+RPC calls are recorded and answered with null; they do not change the tables.
+"""
+import json
+import time
+import random
+import threading
+import uuid
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+
+def seed_tables(n_plants: int = 500, seed: int = 1, today: Optional[date] = None) -> Dict[str, List[Dict]]:
+    """Seeded tables with the open rows of n_plants active plants"""
+    rng = random.Random(seed)
+    new_uuid = lambda: str(uuid.UUID(int=rng.getrandbits(128), version=4))
+    today = today or date.today()
+    user_id = new_uuid()
+
+    plant_types = [
+        {'plant_type_id': new_uuid(), 'watering_interval_days': rng.randint(3, 14), 'is_active': True}
+        for _ in range(8)
+    ]
+    tables = {
+        'plant': [], 'plant_type_lookup': plant_types, 'plant_activity_history': [],
+        'plant_factor': [], 'plant_factor_contribution': [], 'plant_status': [], 'schedule': [],
+        'batch': [],
+        'factor_lookup': [{'factor_code': 'watering_due', 'weight': 1.0, 'factor_category': 'Water', 'is_active': True}]
+    }
+    timezones = ['America/New_York', 'America/Los_Angeles', 'Europe/London', 'Asia/Tokyo']
+
+    for _ in range(n_plants):
+        plant_id = new_uuid()
+        tables['plant'].append({
+            'plant_id': plant_id,
+            'plant_type_id': rng.choice(plant_types)['plant_type_id'],
+            'habitat_id': new_uuid(),
+            'acquisition_date': (today - timedelta(days=rng.randint(30, 700))).isoformat(),
+            'user_timezone': rng.choice(timezones),
+            'is_active': True,
+            'user_id': user_id
+        })
+        for k in range(rng.randint(0, 12)):
+            tables['plant_activity_history'].append({
+                'activity_id': str(uuid.uuid5(uuid.UUID(plant_id), str(k))),
+                'plant_id': plant_id,
+                'activity_type_code': 'watering',
+                'activity_date': (today - timedelta(days=rng.randint(1, 180))).isoformat(),
+                'quantifier': None
+            })
+        plant_factor_id = new_uuid()
+        factor_date = (today + timedelta(days=rng.randint(-12, 7))).isoformat()
+        tables['plant_factor'].append({
+            'plant_factor_id': plant_factor_id, 'plant_id': plant_id, 'factor_code': 'watering_due',
+            'factor_date': factor_date, 'factor_float': None, 'confidence_score': 0.5, 'end_date': None
+        })
+        tables['plant_factor_contribution'].append({
+            'plant_factor_contribution_id': new_uuid(), 'plant_factor_id': plant_factor_id, 'plant_id': plant_id,
+            'factor_code': 'watering_due', 'severity': rng.randint(0, 3), 'end_date': None
+        })
+        tables['schedule'].append({
+            'schedule_id': new_uuid(), 'plant_id': plant_id, 'plant_factor_id': plant_factor_id,
+            'factor_code': 'watering_due', 'schedule_date': factor_date, 'schedule_label': 'Water',
+            'schedule_severity': rng.randint(0, 3), 'user_id': user_id, 'end_date': None
+        })
+        tables['plant_status'].append({
+            'plant_status_id': new_uuid(), 'plant_id': plant_id, 'status_code': rng.randint(0, 3),
+            'user_id': user_id, 'end_date': None
+        })
+    return tables
+
+
+def _matches(row: Dict, column: str, condition: str) -> bool:
+    """One PostgREST filter (eq / neq / is / in / gte / lte) against a row"""
+    operator, _, operand = condition.partition('.')
+    value = row.get(column)
+    text = lambda v: str(v).lower() if isinstance(v, bool) else str(v)
+    if operator == 'eq':
+        return value is not None and text(value) == operand
+    if operator == 'neq':
+        return value is None or text(value) != operand
+    if operator == 'is':
+        return (value is None) if operand == 'null' else text(value) == operand
+    if operator == 'in':
+        options = [option.strip().strip('"') for option in operand.strip('()').split(',')]
+        return value is not None and text(value) in options
+    if operator in ('gte', 'lte', 'gt', 'lt'):
+        if value is None:
+            return False
+        left, right = str(value), operand
+        return {'gte': left >= right, 'lte': left <= right, 'gt': left > right, 'lt': left < right}[operator]
+    return True
+
+
+class FakeSupabase:
+    """Threaded fake PostgREST server"""
+
+    def __init__(self, tables: Dict[str, List[Dict]], latency_ms: float = 0, jitter_ms: float = 0, seed: int = 1):
+        self.tables = tables
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self.stats = {"requests": 0, "by_table": {}, "rpc": {}}
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _delay(self):
+        with self._lock:
+            jitter = self._rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0
+        delay = max(0.0, self.latency_ms + jitter) / 1000
+        if delay:
+            time.sleep(delay)
+
+    def _count(self, kind: str, name: str):
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats[kind][name] = self.stats[kind].get(name, 0) + 1
+
+    def select(self, table: str, params: List) -> List[Dict]:
+        """Rows of a table for the query parameters of a GET"""
+        rows = self.tables.get(table, [])
+        select, order, limit = '*', None, None
+        for key, value in params:
+            if key == 'select':
+                select = value
+            elif key == 'order':
+                order = value
+            elif key == 'limit':
+                limit = int(value)
+            else:
+                rows = [row for row in rows if _matches(row, key, value)]
+        if order:
+            for term in reversed(order.split(',')):
+                column, _, direction = term.partition('.')
+                rows = sorted(rows, key=lambda row: (row.get(column) is None, str(row.get(column))),
+                              reverse=direction.startswith('desc'))
+        if limit is not None:
+            rows = rows[:limit]
+        if select != '*':
+            columns = [column.strip() for column in select.split(',')]
+            rows = [{column: row.get(column) for column in columns} for row in rows]
+        return [dict(row) for row in rows]
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> "FakeSupabase":
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                table = parts.path.rsplit('/', 1)[-1]
+                fake._count("by_table", table)
+                fake._delay()
+                self._send(200, fake.select(table, parse_qsl(parts.query, keep_blank_values=True)))
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(length)
+                name = urlsplit(self.path).path.rsplit('/', 1)[-1]
+                fake._count("rpc", name)
+                fake._delay()
+                self._send(200, None)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="fake-supabase", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+def main():
+    """Serves the fake on its own, for a backend started separately (uvicorn app:app)"""
+    import argparse
+    parser = argparse.ArgumentParser(description="Local Supabase stand-in")
+    parser.add_argument('--port', type=int, default=54321)
+    parser.add_argument('--plants', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    args = parser.parse_args()
+
+    fake = FakeSupabase(seed_tables(args.plants, args.seed), args.latency_ms, args.jitter_ms, args.seed)
+    fake.start(port=args.port)
+    print(f"✓ Fake Supabase on {fake.url} ({args.plants} plants, {args.latency_ms} ms latency)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
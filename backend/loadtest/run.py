@@ -0,0 +1,334 @@
+"""
+RUN.PY - Load generator for the FastAPI endpoints
+Drives backend/app.py against the local Supabase stand-in (fake_supabase.py)
+with a seeded mix of routes and reports throughput and latency percentiles per
+route as JSON.
+
+Transports:
+    asgi    the app runs in this process, called through httpx's ASGI transport
+    http    the app runs under uvicorn on localhost, in a thread of this process
+    --url   an app that is already running (start it against
+            `python -m loadtest.fake_supabase` with the same --plants / --seed)
+
+Load:
+    --concurrency N          closed loop: N clients sending back to back
+    --rate R1,R2,...         open loop: one step per arrival rate (requests/s),
+                             to find the rate where latency starts to degrade
+
+Data, route choices and arrival times are seeded, and the report records the
+git commit and every setting, so two reports of different commits compare
+directly (--baseline adds the change per route against an earlier report).
+
+Usage:
+    python -m loadtest.run --duration 20 --latency-ms 30 --rate 5,10,20,40
+    python -m loadtest.run --mix new_activity=80,cron_daily=5,health=15 --output before.json
+    python -m loadtest.run --baseline before.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from contextlib import asynccontextmanager, contextmanager, redirect_stdout
+from datetime import date
+from typing import Dict, List, Optional
+import httpx
+from loadtest.fake_supabase import FakeSupabase, seed_tables
+
+CRON_SECRET = "loadtest"
+
+# Route name -> (method, path)
+ROUTES = {
+    "new_activity": ("POST", "/api/new-activity"),
+    "cron_daily": ("POST", "/cron/daily"),
+    "manual_daily_batch": ("POST", "/api/manual-daily-batch"),
+    "health": ("GET", "/"),
+    "metrics": ("GET", "/api/metrics")
+}
+DEFAULT_MIX = "new_activity=90,cron_daily=2,health=8"
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """'route=weight,...' -> {route: weight}"""
+    weights = {}
+    for item in mix.split(','):
+        route, _, weight = item.partition('=')
+        route = route.strip()
+        if route not in ROUTES:
+            raise ValueError(f"Unknown route '{route}' (expected one of {sorted(ROUTES)})")
+        weights[route] = float(weight or 1)
+    return weights
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(samples: Dict[str, List], elapsed: float) -> Dict:
+    """Per-route throughput, status counts and latency percentiles (ms)"""
+    routes = {}
+    for route, entries in sorted(samples.items()):
+        latencies = [ms for ms, _ in entries]
+        statuses = {}
+        for _, status in entries:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        routes[route] = {
+            "count": len(entries),
+            "ok": sum(1 for _, status in entries if isinstance(status, int) and status < 400),
+            "statuses": statuses,
+            "throughput_rps": round(len(entries) / elapsed, 2) if elapsed else None,
+            "mean_ms": round(sum(latencies) / len(latencies), 2) if latencies else None,
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+            "p99_ms": percentile(latencies, 99),
+            "max_ms": max(latencies) if latencies else None
+        }
+    total = sum(route["count"] for route in routes.values())
+    return {
+        "requests": total,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else None,
+        "routes": routes
+    }
+
+
+class LoadGenerator:
+    """Sends the seeded route mix to one client"""
+
+    def __init__(self, client: httpx.AsyncClient, tables: Dict, mix: Dict[str, float], seed: int):
+        self.client = client
+        self.plants = tables['plant']
+        self.routes = list(mix)
+        self.weights = [mix[route] for route in self.routes]
+        self.seed = seed
+        self.today = date.today().isoformat()
+
+    async def send(self, route: str, rng: random.Random):
+        method, path = ROUTES[route]
+        if route == "new_activity":
+            plant = rng.choice(self.plants)
+            body = {
+                "plant_id": plant['plant_id'],
+                "activity_type_code": "watering",
+                "activity_date": self.today,
+                "user_id": plant['user_id']
+            }
+            return await self.client.post(path, json=body)
+        if route == "cron_daily":
+            return await self.client.post(path, headers={"Authorization": CRON_SECRET})
+        return await self.client.request(method, path)
+
+    async def _one(self, rng: random.Random, samples: Dict[str, List]):
+        route = rng.choices(self.routes, weights=self.weights)[0]
+        started = time.perf_counter()
+        try:
+            response = await self.send(route, rng)
+            status = response.status_code
+        except Exception as e:
+            status = type(e).__name__
+        samples.setdefault(route, []).append((round((time.perf_counter() - started) * 1000, 2), status))
+
+    async def closed_loop(self, concurrency: int, duration: float) -> Dict:
+        """`concurrency` clients, each sending its next request when the last one returns"""
+        samples: Dict[str, List] = {}
+        deadline = time.perf_counter() + duration
+
+        async def client_loop(index: int):
+            rng = random.Random(self.seed * 1000 + index)
+            while time.perf_counter() < deadline:
+                await self._one(rng, samples)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(index) for index in range(concurrency)))
+        return summarize(samples, time.perf_counter() - started)
+
+    async def open_loop(self, rate: float, duration: float) -> Dict:
+        """Requests arrive every 1/rate seconds whether or not earlier ones returned"""
+        samples: Dict[str, List] = {}
+        rng = random.Random(self.seed)
+        tasks = []
+        started = time.perf_counter()
+        for index in range(int(rate * duration)):
+            delay = started + index / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(self._one(random.Random(rng.getrandbits(64)), samples)))
+        await asyncio.gather(*tasks)
+        return summarize(samples, time.perf_counter() - started)
+
+
+def configure_environment(fake: FakeSupabase, workdir: str):
+    """Points the backend at the fake and at throwaway local files (before app is imported)"""
+    os.environ.update({
+        "SUPABASE_URL": fake.url,
+        "SUPABASE_SERVICE_KEY": "loadtest",
+        "CRON_SECRET": CRON_SECRET,
+        "JOB_QUEUE_PATH": os.path.join(workdir, "jobs.sqlite3"),
+        "STATE_STORE_SNAPSHOT_PATH": os.path.join(workdir, "open_rows.json.gz"),
+        "DAILY_BATCH_CHECKPOINT_DIR": os.path.join(workdir, "checkpoints"),
+        "DAILY_BATCH_CAPTURE_DIR": ""
+    })
+
+
+@contextmanager
+def quiet_stdout(verbose: bool):
+    """Sends stdout to stderr (verbose) or nowhere, at the file descriptor level so the
+    worker process the app spawns (JOB_WORKER_MODE=process) inherits it too"""
+    sys.stdout.flush()
+    saved = os.dup(1)
+    target = os.open(os.devnull, os.O_WRONLY) if not verbose else os.dup(2)
+    os.dup2(target, 1)
+    try:
+        with redirect_stdout(sys.stderr if verbose else open(os.devnull, "w")):
+            yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved, 1)
+        os.close(saved)
+        os.close(target)
+
+
+@asynccontextmanager
+async def backend_client(transport: str, timeout: float, url: Optional[str] = None):
+    """httpx client for the backend under test"""
+    if url:
+        async with httpx.AsyncClient(base_url=url, timeout=timeout) as client:
+            yield client
+        return
+
+    import app as backend
+
+    if transport == "asgi":
+        async with backend.app.router.lifespan_context(backend.app):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=backend.app),
+                                         base_url="http://loadtest", timeout=timeout) as client:
+                yield client
+        return
+
+    import socket
+    import uvicorn
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(backend.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="uvicorn", daemon=True)
+    thread.start()
+    while not server.started:
+        await asyncio.sleep(0.05)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=timeout) as client:
+            yield client
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+
+def compare(report: Dict, baseline: Dict) -> List[Dict]:
+    """Change per step and route against a baseline report (% for latency and throughput)"""
+    change = lambda new, old: round((new - old) / old * 100, 1) if new is not None and old else None
+    steps = []
+    for step, old_step in zip(report["steps"], baseline.get("steps", [])):
+        routes = {}
+        for route, stats in step["routes"].items():
+            old = old_step["routes"].get(route)
+            if old is None:
+                continue
+            routes[route] = {
+                f"{metric}_change_pct": change(stats[metric], old[metric])
+                for metric in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms")
+            }
+        steps.append({"step": step["step"], "routes": routes})
+    return steps
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+async def run(args) -> Dict:
+    tables = seed_tables(args.plants, args.seed)
+    mix = parse_mix(args.mix)
+    rates = [float(rate) for rate in args.rate.split(',')] if args.rate else []
+
+    fake = None
+    if not args.url:
+        fake = FakeSupabase(tables, args.latency_ms, args.jitter_ms, args.seed).start()
+        configure_environment(fake, tempfile.mkdtemp(prefix="loadtest-"))
+
+    steps = []
+    # The backend logs every request to stdout; keep stdout for the report
+    with quiet_stdout(args.verbose):
+        async with backend_client(args.transport, args.timeout, args.url) as client:
+            generator = LoadGenerator(client, tables, mix, args.seed)
+            if args.warmup:
+                await generator.closed_loop(1, args.warmup)
+            if rates:
+                for rate in rates:
+                    steps.append({"step": f"rate={rate}", "rate": rate, **await generator.open_loop(rate, args.duration)})
+            else:
+                steps.append({"step": f"concurrency={args.concurrency}", "concurrency": args.concurrency,
+                              **await generator.closed_loop(args.concurrency, args.duration)})
+    if fake is not None:
+        fake.stop()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "settings": {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "verbose")}
+        },
+        "steps": steps,
+        "fake_supabase": fake.stats if fake is not None else None
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["vs_baseline"] = compare(report, json.load(f))
+    return report
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(description="Load test of the backend endpoints")
+    parser.add_argument('--transport', choices=['asgi', 'http'], default='asgi')
+    parser.add_argument('--url', help="already running backend (skips the in-process app and fake)")
+    parser.add_argument('--plants', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--latency-ms', type=float, default=20, help="injected latency of every Supabase call")
+    parser.add_argument('--jitter-ms', type=float, default=5)
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"route weights, e.g. {DEFAULT_MIX}")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--rate', help="comma separated arrival rates (open loop), one step each")
+    parser.add_argument('--duration', type=float, default=15, help="seconds per step")
+    parser.add_argument('--warmup', type=float, default=2, help="seconds of single-client warmup")
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--output', help="write the report to this file")
+    parser.add_argument('--baseline', help="earlier report to compare against")
+    parser.add_argument('--verbose', action='store_true', help="show backend logs on stderr")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
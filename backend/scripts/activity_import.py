@@ -0,0 +1,346 @@
+"""
+ACTIVITY_IMPORT.PY - Bulk import of historical activity logs
+Loads years of activity kept elsewhere without running the new activity
+pipeline once per row:
+
+- Read:       the file is streamed line by line (CSV with a header row, or
+              NDJSON), IMPORT_CHUNK_ROWS rows in memory at a time
+- Validate:   per chunk; the plant must be one of the user's active plants,
+              the activity type an active plant_activity_type_lookup code,
+              activity_date an ISO date not in the future, quantifier a number
+              (required when the type requires one). Invalid rows are counted
+              and skipped; the first IMPORT_MAX_ERRORS are reported with their line
+- Write:      one bulk upsert into plant_activity_history per chunk. activity_id
+              is derived from the row's content, so importing the same file
+              again (or resuming a failed import) adds nothing
+- Recompute:  once, at the end, per affected plant and activity type: the
+              factors of the type (manager_new_activity.ACTIVITY_FACTORS,
+              watering -> watering_due) are recalculated from the full history
+              for IMPORT_RECOMPUTE_PLANTS plants at a time (scripts/recompute.py:
+              vectorized calculate(), written with run_new_activity)
+- Progress:   a callback gets the running stats after every chunk and
+              recompute batch (the job handler stores them on the job)
+
+Usage:
+    python -m scripts.activity_import <file.csv | file.ndjson> --user-id <uuid> [--dry-run]
+
+Columns (CSV header / NDJSON keys):
+    plant_id, activity_type_code, activity_date, quantifier, unit, notes, result
+
+Settings:
+    IMPORT_CHUNK_ROWS           rows validated and written per chunk
+    IMPORT_RECOMPUTE_PLANTS     plants recalculated per run_new_activity call
+    IMPORT_MAX_ERRORS           invalid rows reported (all are counted)
+    IMPORT_DIR                  where uploaded files are kept until their job is done
+"""
+import os
+import sys
+import csv
+import json
+import time
+import uuid
+import argparse
+from datetime import datetime, date
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+import pandas as pd
+from scripts.manager_new_activity import ACTIVITY_FACTORS
+from scripts import recompute
+
+IMPORT_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", 1000))
+IMPORT_RECOMPUTE_PLANTS = int(os.getenv("IMPORT_RECOMPUTE_PLANTS", 200))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", 100))
+IMPORT_DIR = os.getenv("IMPORT_DIR", "local_data/imports")
+
+FORMATS = ("csv", "ndjson")
+COLUMNS = ['plant_id', 'activity_type_code', 'activity_date', 'quantifier', 'unit', 'notes', 'result']
+
+# Namespace of the content-derived activity ids
+ACTIVITY_NAMESPACE = uuid.UUID("6f1c2b8e-3d4a-5b6c-9e7f-0a1b2c3d4e5f")
+
+
+def read_rows(lines: Iterable[str], format: str) -> Iterator[Tuple[int, Optional[Dict], Optional[str]]]:
+    """
+    Rows of a CSV (header row first) or NDJSON stream, one at a time
+
+    Yields:
+        (line number, row or None, parse error or None)
+    """
+    if format not in FORMATS:
+        raise ValueError(f"Unknown format '{format}' (expected one of {', '.join(FORMATS)})")
+    if format == "csv":
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+    for line_no, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_no, None, f"invalid JSON: {str(e)}"
+            continue
+        if isinstance(row, dict):
+            yield line_no, row, None
+        else:
+            yield line_no, None, "expected a JSON object"
+
+
+def _chunks(rows: Iterable, size: int) -> Iterator[List]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _text(value) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def activity_id(record: Dict) -> str:
+    """Content-derived id: the same activity imported twice gets the same id"""
+    key = "|".join(str(record[column]) for column in COLUMNS)
+    return str(uuid.uuid5(ACTIVITY_NAMESPACE, key))
+
+
+class ActivityImport:
+    """Validates, writes and recomputes one user's imported activity history"""
+
+    def __init__(self, user_id: str, supabase, state_store=None, progress: Optional[Callable[[Dict], None]] = None,
+                 chunk_rows: int = IMPORT_CHUNK_ROWS, recompute_plants: int = IMPORT_RECOMPUTE_PLANTS,
+                 max_errors: int = IMPORT_MAX_ERRORS):
+        self.user_id = user_id
+        self.supabase = supabase
+        # Open contributions are read from (and recalculated rows applied to) the state store when it is loaded
+        self.state_store = state_store
+        self.progress = progress
+        self.chunk_rows = chunk_rows
+        self.recompute_plants = recompute_plants
+        self.max_errors = max_errors
+        self.batch_id = str(uuid.uuid4())
+        self.today_date = pd.Timestamp(datetime.now(ZoneInfo("America/New_York")).date())
+
+        # Import stats tracking
+        self.stats = {
+            "phase": "validating",
+            "rows": 0,
+            "invalid": 0,
+            "upserted": 0,
+            "chunks": 0,
+            "plants": 0,
+            "recomputed_plants": 0,
+            "recompute_batches": 0,
+            "errors": 0,
+            "invalid_rows": []
+        }
+
+    # ============================================
+    # LOOKUPS
+    # ============================================
+    def _load_lookups(self):
+        self.plants = {
+            row['plant_id']: row for row in (self.supabase
+                .table('plant')
+                .select(', '.join(recompute.PLANT_COLUMNS))
+                .eq('user_id', self.user_id)
+                .eq('is_active', True)
+                .execute()).data
+        }
+        self.activity_types = {
+            row['activity_type_code']: row for row in (self.supabase
+                .table('plant_activity_type_lookup')
+                .select('activity_type_code, requires_quantifier, default_unit')
+                .eq('is_active', True)
+                .execute()).data
+        }
+
+    # ============================================
+    # VALIDATE / WRITE
+    # ============================================
+    def validate(self, row: Dict) -> Tuple[Optional[Dict], Optional[str]]:
+        """(plant_activity_history record, None) or (None, reason)"""
+        plant_id = _text(row.get('plant_id'))
+        if plant_id not in self.plants:
+            return None, f"unknown or inactive plant '{plant_id}'"
+        activity_type_code = _text(row.get('activity_type_code'))
+        activity_type = self.activity_types.get(activity_type_code)
+        if activity_type is None:
+            return None, f"unknown activity type '{activity_type_code}'"
+        try:
+            activity_date = date.fromisoformat(str(row.get('activity_date') or '').strip()[:10])
+        except ValueError:
+            return None, f"invalid activity_date '{row.get('activity_date')}'"
+        if activity_date > self.today_date.date():
+            return None, f"activity_date {activity_date.isoformat()} is in the future"
+        quantifier = _text(row.get('quantifier'))
+        if quantifier is not None:
+            try:
+                quantifier = float(quantifier)
+            except ValueError:
+                return None, f"invalid quantifier '{quantifier}'"
+        elif activity_type.get('requires_quantifier'):
+            return None, f"{activity_type_code} requires a quantifier"
+
+        record = {
+            'plant_id': plant_id,
+            'activity_type_code': activity_type_code,
+            'activity_date': activity_date.isoformat(),
+            'quantifier': quantifier,
+            'unit': _text(row.get('unit')) or (activity_type.get('default_unit') if quantifier is not None else None),
+            'notes': _text(row.get('notes')),
+            'result': _text(row.get('result'))
+        }
+        return {
+            'activity_id': activity_id(record),
+            **record,
+            'user_id': self.user_id,
+            'user_timezone': self.plants[plant_id].get('user_timezone') or 'America/New_York'
+        }, None
+
+    def _write(self, records: List[Dict]):
+        (self.supabase
+            .table('plant_activity_history')
+            .upsert(records, on_conflict='activity_id', ignore_duplicates=True)
+            .execute())
+
+    def _report(self):
+        if self.progress is not None:
+            self.progress(dict(self.stats))
+
+    # ============================================
+    # RECOMPUTE
+    # ============================================
+    def _recompute(self, plant_ids: List[str], activity_type_code: str):
+        """One calculation and one run_new_activity call for a batch of plants"""
+        recompute.factors(
+            self.supabase,
+            [self.plants[plant_id] for plant_id in plant_ids],
+            recompute.history(self.supabase, plant_ids, activity_type_code),
+            activity_type_code,
+            run_id=self.batch_id,
+            today_date=self.today_date,
+            state_store=self.state_store
+        )
+
+    # ============================================
+    # RUN
+    # ============================================
+    def run(self, lines: Iterable[str], format: str, dry_run: bool = False) -> Dict:
+        """
+        Imports a CSV / NDJSON stream (see the module docstring)
+
+        Args:
+            lines: the file, line by line (an open file object)
+            dry_run: validate only (nothing is written or recomputed)
+        Returns:
+            stats, with 'plant_ids' of the recomputed plants
+        """
+        started = time.time()
+        print(f"\n{'='*60}")
+        print(f"ACTIVITY IMPORT")
+        print(f"Batch ID: {self.batch_id}")
+        print(f"User ID: {self.user_id}")
+        print(f"{'='*60}\n")
+
+        self._load_lookups()
+        # { activity_type_code: plant_ids } of the written rows
+        affected: Dict[str, set] = {}
+
+        for chunk in _chunks(read_rows(lines, format), self.chunk_rows):
+            records = {}
+            for line_no, row, error in chunk:
+                record = None
+                if error is None:
+                    record, error = self.validate(row)
+                if error is not None:
+                    self.stats["invalid"] += 1
+                    if len(self.stats["invalid_rows"]) < self.max_errors:
+                        self.stats["invalid_rows"].append({"line": line_no, "error": error})
+                    continue
+                records[record['activity_id']] = record
+            self.stats["rows"] += len(chunk)
+            self.stats["chunks"] += 1
+
+            if records and not dry_run:
+                self._write(list(records.values()))
+                self.stats["upserted"] += len(records)
+                for record in records.values():
+                    affected.setdefault(record['activity_type_code'], set()).add(record['plant_id'])
+            print(f"  ✓ Chunk {self.stats['chunks']}: {self.stats['rows']} rows read, "
+                  f"{self.stats['upserted']} upserted, {self.stats['invalid']} invalid")
+            self._report()
+
+        # One recalculation per affected plant and activity type, on the whole imported history
+        self.stats["phase"] = "recomputing"
+        plant_ids = sorted(set().union(*affected.values())) if affected else []
+        self.stats["plants"] = len(plant_ids)
+        self._report()
+        for activity_type_code in sorted(affected):
+            if activity_type_code not in ACTIVITY_FACTORS:
+                continue
+            type_plant_ids = sorted(affected[activity_type_code])
+            for start in range(0, len(type_plant_ids), self.recompute_plants):
+                batch = type_plant_ids[start:start + self.recompute_plants]
+                try:
+                    self._recompute(batch, activity_type_code)
+                    self.stats["recomputed_plants"] += len(batch)
+                except Exception as e:
+                    # The rows are written; the plants are recalculated by their next activity
+                    print(f"❌ Error recomputing {len(batch)} plants ({activity_type_code}): {str(e)}")
+                    self.stats["errors"] += 1
+                self.stats["recompute_batches"] += 1
+                self._report()
+
+        self.stats["phase"] = "done"
+        self.stats["seconds"] = round(time.time() - started, 3)
+        print(f"\n{'='*60}")
+        print(f"ACTIVITY IMPORT COMPLETED")
+        print(f"Stats: { {key: value for key, value in self.stats.items() if key != 'invalid_rows'} }")
+        print(f"{'='*60}\n")
+        return {**self.stats, "plant_ids": plant_ids}
+
+
+def detect_format(path: str) -> str:
+    """csv / ndjson from the file extension"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".ndjson", ".jsonl"):
+        return "ndjson"
+    if extension == ".csv":
+        return "csv"
+    raise ValueError(f"Cannot tell the format of '{path}' (use --format)")
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(description="Bulk import of historical activity logs")
+    parser.add_argument('path', help="CSV (with a header row) or NDJSON file")
+    parser.add_argument('--user-id', required=True, help="owner of the plants")
+    parser.add_argument('--format', choices=FORMATS, help="defaults to the file extension")
+    parser.add_argument('--dry-run', action='store_true', help="validate only")
+    args = parser.parse_args()
+
+    try:
+        format = args.format or detect_format(args.path)
+    except ValueError as e:
+        parser.error(str(e))
+
+    from utils.supabase_client import get_client
+    with open(args.path, newline='', encoding='utf-8-sig') as lines:
+        stats = ActivityImport(args.user_id, get_client()).run(lines, format, dry_run=args.dry_run)
+    stats.pop("plant_ids")
+    print(json.dumps(stats, indent=2))
+
+    # Exit with error code if there were errors
+    sys.exit(1 if stats['errors'] > 0 else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+BATCH_CHECKPOINT.PY - Local checkpoints of a daily batch
+The computed changes of DailyBatch (updates stage) are saved to local disk as
+soon as they are ready, keyed by logical date (and timezone in rolling mode)
+and tagged with the batch_id. When the commit fails - typically the final
+run_daily_batch RPC timing out - a retry shortly after sends the same changes
+with the same batch_id and batch timestamp instead of reading and computing
+everything again.
+
+    <checkpoint dir>/<run_date>_<timezone | all>/
+        manifest.json       batch_id, batch_timestamp, completed stages, committed
+        <stage>.pkl         frames of each completed stage
+    <checkpoint dir>/<run_date>_<timezone | all>.lock
+
+A run holds the lock file of its date for as long as it runs (acquire() /
+release()): a second run of the same date (e.g. /api/manual-daily-batch next
+to the cron run, with JOB_CONCURRENCY > 1) does not get it, and runs without
+a checkpoint instead of overwriting or deleting the first run's.
+
+Only a recent checkpoint is resumed: other writes (e.g. /api/new-activity) keep
+changing the open rows, so after DAILY_BATCH_CHECKPOINT_MAX_AGE_MINUTES the
+retry computes from fresh inputs. Even within that window, DailyBatch drops the
+changes whose target row was closed or changed since the checkpoint before
+committing. A committed checkpoint, or one without a completed stage, is not
+resumed: the next run for that date starts a new batch.
+
+Settings:
+    DAILY_BATCH_CHECKPOINT_DIR               checkpoint root (empty = no checkpoints)
+    DAILY_BATCH_CHECKPOINT_MAX_AGE_MINUTES   oldest checkpoint a retry resumes
+"""
+import os
+import json
+import time
+import fcntl
+import shutil
+from typing import Dict, Optional
+import pandas as pd
+
+DAILY_BATCH_CHECKPOINT_DIR = os.getenv("DAILY_BATCH_CHECKPOINT_DIR", "local_data/checkpoints")
+DAILY_BATCH_CHECKPOINT_MAX_AGE_MINUTES = int(os.getenv("DAILY_BATCH_CHECKPOINT_MAX_AGE_MINUTES", 15))
+
+
+class BatchCheckpoint:
+    """Checkpoints of the daily batch of one logical date"""
+
+    def __init__(self, root: str, run_date: str, timezone: Optional[str] = None,
+                 max_age_minutes: int = DAILY_BATCH_CHECKPOINT_MAX_AGE_MINUTES):
+        scope = (timezone or "all").replace("/", "_")
+        self.directory = os.path.join(root, f"{run_date}_{scope}")
+        self.max_age_minutes = max_age_minutes
+        self.manifest: Dict = {}
+        self._lock_file = None
+
+    # ============================================
+    # LOCK
+    # ============================================
+    def acquire(self) -> bool:
+        """Takes the date's lock without waiting; False when another run holds it"""
+        os.makedirs(os.path.dirname(self.directory) or ".", exist_ok=True)
+        lock_file = open(f"{self.directory}.lock", "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def release(self):
+        if self._lock_file is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+
+    # ============================================
+    # MANIFEST
+    # ============================================
+    def _manifest_path(self) -> str:
+        return os.path.join(self.directory, "manifest.json")
+
+    def _write_manifest(self):
+        tmp_path = f"{self._manifest_path()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self._manifest_path())
+
+    def open(self, batch_id: str, batch_timestamp: str) -> bool:
+        """
+        Resumes the incomplete batch of this date, or starts a new checkpoint
+        (call with the lock held, see acquire())
+
+        Returns:
+            True when resuming (self.batch_id / self.batch_timestamp are the
+            resumed batch's), False for a new batch
+        """
+        try:
+            with open(self._manifest_path()) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = None
+
+        if (manifest
+                and not manifest.get("committed")
+                and manifest.get("stages")
+                and time.time() - manifest.get("created_at", 0) <= self.max_age_minutes * 60):
+            self.manifest = manifest
+            return True
+
+        # Nothing to resume: start over
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
+        self.manifest = {
+            "batch_id": batch_id,
+            "batch_timestamp": batch_timestamp,
+            "created_at": time.time(),
+            "stages": {},
+            "committed": False
+        }
+        self._write_manifest()
+        return False
+
+    @property
+    def batch_id(self) -> str:
+        return self.manifest["batch_id"]
+
+    @property
+    def batch_timestamp(self) -> str:
+        return self.manifest["batch_timestamp"]
+
+    # ============================================
+    # STAGES
+    # ============================================
+    def save(self, stage: str, frames: Dict[str, pd.DataFrame]):
+        """Saves the frames of a completed stage"""
+        path = os.path.join(self.directory, f"{stage}.pkl")
+        pd.to_pickle(frames, f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+        self.manifest["stages"][stage] = {"completed_at": time.time()}
+        self._write_manifest()
+
+    def load(self, stage: str) -> Optional[Dict[str, pd.DataFrame]]:
+        """Frames of a completed stage (None when the stage has to run)"""
+        if stage not in self.manifest.get("stages", {}):
+            return None
+        try:
+            return pd.read_pickle(os.path.join(self.directory, f"{stage}.pkl"))
+        except Exception as e:
+            print(f"Warning: could not read {stage} checkpoint: {str(e)}")
+            return None
+
+    def mark_committed(self):
+        """The batch reached the database: drops the stage files, keeps the manifest"""
+        for stage in self.manifest.get("stages", {}):
+            try:
+                os.remove(os.path.join(self.directory, f"{stage}.pkl"))
+            except OSError:
+                pass
+        self.manifest["committed"] = True
+        self.manifest["committed_at"] = time.time()
+        self._write_manifest()
@@ -0,0 +1,199 @@
+"""
+BATCH_SNAPSHOT.PY - Capture and deterministic replay of daily batches
+With DAILY_BATCH_CAPTURE_DIR set, every DailyBatch run writes its input
+frames, today_date, batch_id and outputs to a snapshot directory:
+
+    <capture dir>/<run_date>_<batch_id>/
+        meta.json                       run parameters, frame columns and dtypes
+        <frame>.<column>.npy            one array per column
+        <frame>.<column>.mask.npy       null mask of text columns
+        outputs.json                    the changed rows sent to run_daily_batch
+
+Columns are plain numpy arrays (fixed-width unicode for text, float64 for
+numbers, datetime64[s] for dates), so a replay memory-maps them instead of
+parsing the whole run again.
+
+Replay reruns DailyBatch.compute() offline with seeded IDs and prints the
+per-stage timings and the diff between its outputs and the captured ones.
+
+Usage:
+    python -m scripts.batch_snapshot replay <snapshot dir> [--seed N]
+"""
+import os
+import sys
+import json
+import argparse
+from typing import Dict, List
+import numpy as np
+import pandas as pd
+from utils.ids import seeded_ids
+
+# Key of the rows of each output (to diff a replay against the capture)
+OUTPUT_KEYS = {
+    'schedule_severity': 'schedule_id',
+    'factor_contribution': 'plant_factor_id',
+    'status': 'plant_id'
+}
+
+
+# ============================================
+# COLUMNS
+# ============================================
+def _write_column(directory: str, name: str, values: pd.Series) -> str:
+    """Writes one column as .npy (+ null mask for text); returns its storage kind"""
+    path = os.path.join(directory, name)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        np.save(f"{path}.npy", values.to_numpy().astype('datetime64[s]'))
+        return 'datetime'
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        np.save(f"{path}.npy", pd.to_numeric(values).to_numpy(dtype='float64', na_value=np.nan))
+        return 'number'
+    mask = values.isna().to_numpy()
+    np.save(f"{path}.npy", values.where(~mask, '').astype(str).to_numpy(dtype='U'))
+    np.save(f"{path}.mask.npy", mask)
+    return 'text'
+
+
+def _read_column(directory: str, name: str, kind: str, dtype: str) -> pd.Series:
+    """Reads one column back (memory-mapped) with its original dtype"""
+    path = os.path.join(directory, name)
+    values = np.load(f"{path}.npy", mmap_mode='r')
+    if kind == 'text':
+        mask = np.load(f"{path}.mask.npy", mmap_mode='r')
+        return pd.Series(values, dtype='object').where(~pd.Series(mask), None)
+    series = pd.Series(values)
+    try:
+        return series.astype(dtype)
+    except (TypeError, ValueError):
+        # e.g. int64 columns that have nulls only become float64 again
+        return series
+
+
+# ============================================
+# CAPTURE
+# ============================================
+def write_snapshot(capture_dir: str, batch, inputs: Dict[str, pd.DataFrame],
+                   updates: Dict[str, pd.DataFrame]) -> str:
+    """
+    Writes the inputs and outputs of a DailyBatch run
+
+    Returns:
+        Path of the snapshot directory
+    """
+    run_date = batch.today_date.date().isoformat()
+    directory = os.path.join(capture_dir, f"{run_date}_{batch.batch_id}")
+    os.makedirs(directory, exist_ok=True)
+
+    frames = {}
+    for frame_name, df in inputs.items():
+        frames[frame_name] = [
+            {'name': col, 'kind': _write_column(directory, f"{frame_name}.{col}", df[col]), 'dtype': str(df[col].dtype)}
+            for col in df.columns
+        ]
+
+    meta = {
+        'today_date': run_date,
+        'batch_id': batch.batch_id,
+        'timezone': batch.timezone,
+        'frames': frames
+    }
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    with open(os.path.join(directory, 'outputs.json'), 'w') as f:
+        json.dump(batch.records(updates), f)
+    return directory
+
+
+def load_snapshot(directory: str):
+    """
+    Reads a snapshot directory
+
+    Returns:
+        (meta, inputs, outputs) - inputs as DataFrames, outputs as records
+    """
+    with open(os.path.join(directory, 'meta.json')) as f:
+        meta = json.load(f)
+    inputs = {}
+    for frame_name, columns in meta['frames'].items():
+        inputs[frame_name] = pd.DataFrame({
+            col['name']: _read_column(directory, f"{frame_name}.{col['name']}", col['kind'], col['dtype'])
+            for col in columns
+        }, columns=[col['name'] for col in columns])
+    outputs_path = os.path.join(directory, 'outputs.json')
+    outputs = {}
+    if os.path.exists(outputs_path):
+        with open(outputs_path) as f:
+            outputs = json.load(f)
+    return meta, inputs, outputs
+
+
+# ============================================
+# REPLAY
+# ============================================
+def diff_outputs(expected: Dict[str, List[Dict]], actual: Dict[str, List[Dict]]) -> Dict[str, Dict]:
+    """
+    Row-level diff per output
+
+    Returns:
+        { output: {'added': [keys], 'removed': [keys], 'changed': [keys]} }
+    """
+    diff = {}
+    for name, key in OUTPUT_KEYS.items():
+        before = {row[key]: row for row in expected.get(name, [])}
+        after = {row[key]: row for row in actual.get(name, [])}
+        diff[name] = {
+            'added': sorted(after.keys() - before.keys()),
+            'removed': sorted(before.keys() - after.keys()),
+            'changed': sorted(k for k in before.keys() & after.keys() if before[k] != after[k])
+        }
+    return diff
+
+
+def replay(directory: str, seed: int = 0) -> Dict:
+    """
+    Reruns a captured batch offline
+
+    Returns:
+        {'batch_id', 'today_date', 'timings', 'rows', 'diff', 'matches'}
+    """
+    from scripts.manager_daily import DailyBatch
+
+    meta, inputs, expected = load_snapshot(directory)
+    batch = DailyBatch(run_date=meta['today_date'], timezone=meta['timezone'], offline=True)
+    batch.batch_id = meta['batch_id']
+
+    with seeded_ids(seed):
+        actual = batch.records(batch.compute(inputs))
+
+    diff = diff_outputs(expected, actual)
+    return {
+        'batch_id': meta['batch_id'],
+        'today_date': meta['today_date'],
+        'timings': batch.stats.get('timings', {}),
+        'rows': {name: len(rows) for name, rows in actual.items()},
+        'diff': diff,
+        'matches': not any(rows for changes in diff.values() for rows in changes.values())
+    }
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(description="Daily batch snapshots")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    replay_parser = subparsers.add_parser('replay', help="rerun a captured batch offline")
+    replay_parser.add_argument('directory')
+    replay_parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    # Calculator progress goes to stderr so stdout is only the report
+    stdout, sys.stdout = sys.stdout, sys.stderr
+    try:
+        report = replay(args.directory, seed=args.seed)
+    finally:
+        sys.stdout = stdout
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report['matches'] else 1)
+
+
+if __name__ == "__main__":
+    main()
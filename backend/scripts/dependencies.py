@@ -0,0 +1,298 @@
+"""
+DEPENDENCIES.PY - Targeted recalculation when lookup rows change
+Derived rows depend on lookup columns:
+
+    plant_type_lookup.watering_interval_days
+        -> watering_due factor of the type's plants that have fewer than
+           watering_due.INTERVAL_MIN_WATERINGS waterings (the others use their
+           own average), and from it their contribution, status and schedule
+    factor_lookup.weight / is_active
+        -> status of the plants with an open contribution of the factor
+
+Factor modules declare what they read (LOOKUP_DEPENDENCIES) and which plants
+actually use it (dependents()); status dependencies are declared here.
+
+- changes():        tracked columns that differ between two versions of a
+                    lookup row, and what depends on them
+- LookupWatcher:    polls the lookup tables (they are small) every
+                    LOOKUP_WATCH_SECONDS, diffs them against the last seen
+                    version (kept in LOOKUP_SNAPSHOT_PATH, so changes made while
+                    the API was down are found at startup) and queues one
+                    lookup_change job per changed row
+- recompute():      the job: resolves exactly the dependent plants and
+                    recalculates them DEPENDENTS_BATCH_PLANTS at a time with
+                    scripts/recompute.py (factors from the full history, or
+                    status only; only changed statuses are written)
+
+Changes can also be pushed, e.g. from a Supabase database webhook, to
+POST /api/lookups/changes.
+
+Settings:
+    LOOKUP_WATCH_SECONDS        poll period of the lookup tables (0 disables)
+    LOOKUP_SNAPSHOT_PATH        last seen version of the tracked lookup columns
+    DEPENDENTS_BATCH_PLANTS     plants recalculated per batch
+"""
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from zoneinfo import ZoneInfo
+import pandas as pd
+from scripts.factors import registry as factor_registry
+from scripts.manager_new_activity import ACTIVITY_FACTORS
+from scripts.reports import pages
+from scripts import recompute as recalculate
+
+LOOKUP_WATCH_SECONDS = float(os.getenv("LOOKUP_WATCH_SECONDS", 60))
+LOOKUP_SNAPSHOT_PATH = os.getenv("LOOKUP_SNAPSHOT_PATH", "local_data/lookups.json")
+DEPENDENTS_BATCH_PLANTS = int(os.getenv("DEPENDENTS_BATCH_PLANTS", 200))
+
+# Lookup table -> key column
+LOOKUP_KEYS = {'plant_type_lookup': 'plant_type_id', 'factor_lookup': 'factor_code'}
+# Lookup table -> plant column referencing it
+PLANT_LINKS = {'plant_type_lookup': 'plant_type_id'}
+# Lookup columns read by the status calculator (manager_plant_status.py)
+STATUS_DEPENDENCIES = {'factor_lookup': ['weight', 'is_active']}
+STATUS = 'status'
+
+
+def graph() -> Dict[str, Dict[str, List[str]]]:
+    """{ table: { column: [factor codes, and 'status'] } }"""
+    dependencies = {}
+    for factor, module in sorted(factor_registry.items()):
+        for table, columns in getattr(module, 'LOOKUP_DEPENDENCIES', {}).items():
+            for column in columns:
+                dependencies.setdefault(table, {}).setdefault(column, []).append(factor)
+    for table, columns in STATUS_DEPENDENCIES.items():
+        for column in columns:
+            dependencies.setdefault(table, {}).setdefault(column, []).append(STATUS)
+    return dependencies
+
+
+GRAPH = graph()
+
+
+def changes(table: str, old: Optional[Dict], new: Optional[Dict]) -> Optional[Dict]:
+    """
+    The change of a lookup row, if a tracked column changed
+
+    Args:
+        old / new: the row before / after (None when inserted / deleted)
+    Returns:
+        {'table', 'key', 'columns': changed tracked columns, 'dependents': factor codes / 'status',
+         'values': {column: (old, new)}, 'modified_at'} or None
+    """
+    if table not in GRAPH or (old is None and new is None):
+        return None
+    old, new = old or {}, new or {}
+    columns = sorted(column for column in GRAPH[table] if old.get(column) != new.get(column))
+    if not columns:
+        return None
+    return {
+        'table': table,
+        'key': new.get(LOOKUP_KEYS[table], old.get(LOOKUP_KEYS[table])),
+        'columns': columns,
+        'dependents': sorted({dependent for column in columns for dependent in GRAPH[table][column]}),
+        # Values and modified_at are part of the dedupe key: a later change of the row is queued again
+        'values': {column: (old.get(column), new.get(column)) for column in columns},
+        'modified_at': new.get('modified_at')
+    }
+
+
+# ============================================
+# RECOMPUTE (job)
+# ============================================
+def _batches(items: List, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _factor_activity_type(factor: str) -> Optional[str]:
+    """Activity type whose history a factor is calculated from"""
+    return next((activity_type for activity_type, factors in sorted(ACTIVITY_FACTORS.items()) if factor in factors), None)
+
+
+def recompute(change: Dict, supabase, state_store=None, progress: Optional[Callable[[Dict], None]] = None,
+              batch_plants: int = DEPENDENTS_BATCH_PLANTS) -> Dict:
+    """
+    Recalculates exactly the plants that depend on a changed lookup row
+
+    Returns:
+        stats: plants checked, dependent plants, recalculated batches, changed statuses
+    """
+    run_id = str(uuid.uuid4())
+    today_date = pd.Timestamp(datetime.now(ZoneInfo("America/New_York")).date())
+    table, key = change['table'], change['key']
+    stats = {"run_id": run_id, "checked": 0, "dependents": 0, "batches": 0, "status_changed": 0, "errors": 0}
+
+    print(f"\n▶ Recomputing dependents of {table} {key} ({', '.join(change['columns'])})")
+    factors = [dependent for dependent in change['dependents'] if dependent != STATUS]
+    for factor in factors:
+        activity_type_code = _factor_activity_type(factor)
+        if table not in PLANT_LINKS or activity_type_code is None:
+            print(f"Warning: cannot resolve the plants of {factor} for {table}")
+            stats["errors"] += 1
+            continue
+        plant_pages = pages(supabase, 'plant', 'plant_id', recalculate.PLANT_COLUMNS,
+                            [('eq', PLANT_LINKS[table], key), ('eq', 'is_active', True)], page_size=batch_plants)
+        for plants in plant_pages:
+            plant_ids = [plant['plant_id'] for plant in plants]
+            activity = recalculate.history(supabase, plant_ids, activity_type_code)
+            dependent_ids = set(factor_registry[factor].dependents(
+                pd.DataFrame(plants, columns=recalculate.PLANT_COLUMNS),
+                pd.DataFrame(activity, columns=recalculate.ACTIVITY_COLUMNS),
+                table
+            ))
+            stats["checked"] += len(plants)
+            stats["dependents"] += len(dependent_ids)
+            if dependent_ids:
+                recalculate.factors(
+                    supabase,
+                    [plant for plant in plants if plant['plant_id'] in dependent_ids],
+                    [row for row in activity if row['plant_id'] in dependent_ids],
+                    activity_type_code,
+                    run_id=run_id,
+                    today_date=today_date,
+                    state_store=state_store
+                )
+                stats["batches"] += 1
+            if progress is not None:
+                progress(dict(stats))
+
+    if STATUS in change['dependents']:
+        # Plants with an open contribution of the factor
+        if state_store is not None and state_store.ready:
+            contributions = state_store.select('plant_factor_contribution', ['plant_id', 'factor_code'])
+            plant_ids = sorted({row['plant_id'] for row in contributions if row['factor_code'] == key})
+        else:
+            plant_ids = sorted({
+                row['plant_id']
+                for page in pages(supabase, 'plant_factor_contribution', 'plant_factor_contribution_id',
+                                  ['plant_factor_contribution_id', 'plant_id'],
+                                  [('eq', 'factor_code', key), ('is_', 'end_date', 'null')])
+                for row in page
+            })
+        stats["checked"] += len(plant_ids)
+        stats["dependents"] += len(plant_ids)
+        for batch in _batches(plant_ids, batch_plants):
+            plants = (supabase
+                .table('plant')
+                .select(', '.join(recalculate.PLANT_COLUMNS))
+                .in_('plant_id', batch)
+                .execute()).data
+            stats["status_changed"] += recalculate.statuses(supabase, plants, run_id=run_id, state_store=state_store)
+            stats["batches"] += 1
+            if progress is not None:
+                progress(dict(stats))
+
+    print(f"  ✅ Dependents of {table} {key} recomputed: {stats}")
+    return stats
+
+
+# ============================================
+# WATCHER
+# ============================================
+class LookupWatcher:
+    """Polls the lookup tables and queues a lookup_change job for every changed row"""
+
+    def __init__(self, job_queue, supabase_factory, snapshot_path: str = LOOKUP_SNAPSHOT_PATH):
+        self.job_queue = job_queue
+        # Called lazily so the API can start without database access
+        self.supabase_factory = supabase_factory
+        self.snapshot_path = snapshot_path
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Watcher stats tracking
+        self.stats = {"checks": 0, "changes": 0, "queued": 0, "errors": 0, "checked_at": None}
+
+    def _fetch(self) -> Dict[str, Dict[str, Dict]]:
+        """{ table: { key: tracked columns } } of every lookup row"""
+        supabase = self.supabase_factory()
+        tables = {}
+        for table, columns in GRAPH.items():
+            key = LOOKUP_KEYS[table]
+            rows = (supabase
+                .table(table)
+                .select(', '.join([key] + sorted(columns) + ['modified_at']))
+                .execute()).data
+            tables[table] = {str(row[key]): row for row in rows}
+        return tables
+
+    def _load(self) -> Optional[Dict]:
+        if not os.path.exists(self.snapshot_path):
+            return None
+        with open(self.snapshot_path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save(self, tables: Dict):
+        directory = os.path.dirname(self.snapshot_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(tables, f, default=str)
+        os.replace(tmp_path, self.snapshot_path)
+
+    def submit(self, change: Dict) -> Dict:
+        """Queues the recalculation of a change (the same change is only queued once)"""
+        digest = hashlib.sha1(json.dumps(change, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        job = self.job_queue.enqueue("lookup_change", payload=change, dedupe_key=f"{change['table']}:{change['key']}:{digest}")
+        self.stats["changes"] += 1
+        self.stats["queued"] += int(job["created"])
+        if job["created"]:
+            print(f"  Queued recompute of {change['table']} {change['key']} dependents ({', '.join(change['dependents'])})")
+        return job
+
+    def check(self) -> List[Dict]:
+        """
+        Diffs the lookup tables against the last seen version and queues the changes
+
+        The first check only records the baseline.
+        Returns:
+            List of {change, job_id, created}
+        """
+        tables = self._fetch()
+        previous = self._load()
+        queued = []
+        if previous is not None:
+            for table, rows in tables.items():
+                old_rows = previous.get(table, {})
+                for key in sorted(set(rows) | set(old_rows)):
+                    change = changes(table, old_rows.get(key), rows.get(key))
+                    if change is not None:
+                        job = self.submit(change)
+                        queued.append({"change": change, "job_id": job["job_id"], "created": job["created"]})
+        self._save(tables)
+        self.stats["checks"] += 1
+        self.stats["checked_at"] = time.time()
+        return queued
+
+    def start(self, watch_seconds: float = LOOKUP_WATCH_SECONDS):
+        """Checks in a daemon thread (no-op when watch_seconds is 0)"""
+        if watch_seconds <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.check()
+                except Exception as e:
+                    self.stats["errors"] += 1
+                    print(f"❌ Error checking lookup tables: {str(e)}")
+                self._stop.wait(watch_seconds)
+
+        self._thread = threading.Thread(target=loop, name="lookup-watcher", daemon=True)
+        self._thread.start()
+        print(f"✓ Lookup watcher started (every {watch_seconds:g}s)")
+
+    def stop(self):
+        self._stop.set()
+
+    def metrics(self) -> Dict:
+        return {**self.stats, "tracked": {table: sorted(columns) for table, columns in GRAPH.items()}}
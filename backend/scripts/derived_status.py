@@ -0,0 +1,214 @@
+"""
+DERIVED_STATUS.PY - Read-time schedule severity, contribution severity and status
+Schedule severity and watering due contribution severity only depend on
+schedule_date / factor_date and today, so they can be derived when a plant is
+read instead of rewritten every day by run_daily_batch.
+
+- plants():     severities and status of the requested plants, computed in one
+                vectorized pass over their open rows (schedule/severity.py,
+                factors_contribution/watering_due.py, manager_plant_status.py)
+                and cached per plant and day for DERIVED_STATUS_CACHE_SECONDS
+- invalidate(): drops cached plants whose open rows changed (new activity)
+- clear():      drops every cached plant (a lookup the derivation reads changed)
+
+Modes (SEVERITY_MODE):
+    materialized    the daily batch writes every changed severity and status (default)
+    derived         the daily batch becomes a consistency pass: it still
+                    computes everything and writes changed statuses and the
+                    daily rollup, but no longer rewrites schedule and
+                    contribution severities; clients read them from
+                    /api/plants/status (stored severities go stale between
+                    new activities)
+
+Settings:
+    SEVERITY_MODE                   materialized | derived
+    DERIVED_STATUS_CACHE_SECONDS    how long a derived plant is served from cache
+    DERIVED_STATUS_CACHE_PLANTS     most plants kept in the cache
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from zoneinfo import ZoneInfo
+import pandas as pd
+from scripts.factors_contribution import registry as factor_contribution_registry
+from scripts.schedule.severity import run as schedule_severity_calculator
+from scripts.manager_plant_status import run as status_calculator
+
+SEVERITY_MODE = os.getenv("SEVERITY_MODE", "materialized")
+DERIVED_STATUS_CACHE_SECONDS = float(os.getenv("DERIVED_STATUS_CACHE_SECONDS", 60))
+DERIVED_STATUS_CACHE_PLANTS = int(os.getenv("DERIVED_STATUS_CACHE_PLANTS", 10000))
+
+# Open rows read per plant { table: columns }
+COLUMNS = {
+    'schedule': ['schedule_id', 'plant_id', 'factor_code', 'schedule_date', 'schedule_label', 'schedule_severity'],
+    'plant_factor': ['plant_factor_id', 'plant_id', 'factor_code', 'factor_date'],
+    'plant_factor_contribution': ['plant_factor_id', 'plant_id', 'factor_code', 'severity'],
+    'plant_status': ['plant_id', 'status_code']
+}
+
+
+def derive(inputs: Dict[str, pd.DataFrame], factor_lookup_df: pd.DataFrame, today_date: pd.Timestamp,
+           run_id: str = "read") -> Dict[str, pd.DataFrame]:
+    """
+    Severities and status from the open rows (no database access)
+
+    Args:
+        inputs: {'schedule', 'plant_factor', 'plant_factor_contribution', 'plant_status'} frames (COLUMNS)
+        factor_lookup_df: factor_code, weight of the active factors
+    Returns:
+        {'schedule': schedule rows with today's schedule_severity,
+         'contribution': plant_factor_id, plant_id, factor_code, severity (today's, or the
+                         stored one for factors without a contribution calculator),
+         'status': plant_id, status_code (the stored one for plants without contributions)}
+    """
+    schedule_df = inputs['schedule']
+    if schedule_df.empty:
+        schedules = schedule_df.copy()
+    else:
+        severity_df = schedule_severity_calculator(schedule_df[['schedule_id', 'schedule_date']], today_date, run_id)
+        schedules = schedule_df.drop(columns=['schedule_severity']).merge(severity_df, on='schedule_id', how='left')
+
+    # Contributions: derived where a calculator exists, stored otherwise
+    contribution_df = inputs['plant_factor_contribution']
+    factor_df = inputs['plant_factor']
+    derived = [
+        factor_contribution_registry[factor].run(factor_df[factor_df['factor_code'] == factor], today_date, run_id)
+        [['plant_factor_id', 'severity']]
+        for factor in sorted(set(factor_df['factor_code']) & set(factor_contribution_registry))
+    ]
+    contributions = contribution_df.copy()
+    if derived:
+        severity_new = pd.concat(derived, ignore_index=True).set_index('plant_factor_id')['severity']
+        contributions['severity'] = contributions['plant_factor_id'].map(severity_new).fillna(contributions['severity'])
+
+    status_df = inputs['plant_status'][['plant_id', 'status_code']]
+    if not contributions.empty:
+        calculated = contributions[['plant_id', 'factor_code', 'severity']].astype({'severity': 'float64'})
+        status_new_df = status_calculator(calculated, run_id, supabase=None, factor_lookup_df=factor_lookup_df)
+        status_df = pd.concat([status_new_df[['plant_id', 'status_code']],
+                               status_df[~status_df['plant_id'].isin(status_new_df['plant_id'])]], ignore_index=True)
+
+    return {'schedule': schedules, 'contribution': contributions, 'status': status_df}
+
+
+class DerivedStatus:
+    """Read-time severities and status of plants, with a short-lived cache per plant"""
+
+    def __init__(self, supabase_factory, state_store=None, cache_seconds: float = DERIVED_STATUS_CACHE_SECONDS,
+                 cache_plants: int = DERIVED_STATUS_CACHE_PLANTS):
+        self.supabase_factory = supabase_factory
+        # Open rows are read from the in-process state store when it is loaded
+        self.state_store = state_store
+        self.cache_seconds = cache_seconds
+        self.cache_plants = cache_plants
+        self._lock = threading.Lock()
+        # { (plant_id, day): (expires_at, plant) }
+        self._cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+        # Derivation stats tracking
+        self.stats = {
+            "requests": 0,
+            "hits": 0,
+            "misses": 0,
+            "derivations": 0,
+            "invalidated": 0
+        }
+
+    def _open_rows(self, plant_ids: List[str]) -> Dict[str, pd.DataFrame]:
+        if self.state_store is not None and self.state_store.readable:
+            return {
+                table: pd.DataFrame([row for plant_id in plant_ids
+                                     for row in self.state_store.by(table, 'plant_id', plant_id, columns)],
+                                    columns=columns)
+                for table, columns in COLUMNS.items()
+            }
+        supabase = self.supabase_factory()
+        return {
+            table: pd.DataFrame((supabase
+                .table(table)
+                .select(', '.join(columns))
+                .in_('plant_id', plant_ids)
+                .is_('end_date', 'null')
+                .execute()).data, columns=columns)
+            for table, columns in COLUMNS.items()
+        }
+
+    def _factor_lookup(self) -> pd.DataFrame:
+        factor_lookup_data = (self.supabase_factory()
+            .table('factor_lookup')
+            .select('factor_code, weight')
+            .eq('is_active', True)
+            .execute())
+        return pd.DataFrame(factor_lookup_data.data, columns=['factor_code', 'weight'])
+
+    def _derive(self, plant_ids: List[str], today_date: pd.Timestamp) -> Dict[str, Dict]:
+        """One vectorized pass over the open rows of the plants"""
+        derived = derive(self._open_rows(plant_ids), self._factor_lookup(), today_date)
+        plants = {plant_id: {'plant_id': plant_id, 'status_code': None, 'schedules': [], 'contributions': []}
+                  for plant_id in plant_ids}
+        schedules = derived['schedule'].astype(object).where(derived['schedule'].notna(), None)
+        for row in schedules.to_dict('records'):
+            plants[row.pop('plant_id')]['schedules'].append(row)
+        for row in derived['contribution'].to_dict('records'):
+            severity = None if pd.isna(row['severity']) else int(row['severity'])
+            plants[row.pop('plant_id')]['contributions'].append({**row, 'severity': severity})
+        for plant_id, status_code in zip(derived['status']['plant_id'], derived['status']['status_code']):
+            plants[plant_id]['status_code'] = None if pd.isna(status_code) else int(status_code)
+        return plants
+
+    def plants(self, plant_ids: Iterable[str], today: Optional[str] = None) -> List[Dict]:
+        """
+        Derived severities and status of plants, in the requested order
+
+        Args:
+            today: evaluation date (ISO, defaults to today in America/New_York like the daily batch)
+        Returns:
+            [{'plant_id', 'status_code', 'schedules': [...], 'contributions': [...]}]
+        """
+        plant_ids = list(dict.fromkeys(plant_ids))
+        day = today or datetime.now(ZoneInfo("America/New_York")).date().isoformat()
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            self.stats["requests"] += 1
+            for plant_id in plant_ids:
+                entry = self._cache.get((plant_id, day))
+                if entry is not None and entry[0] > now:
+                    found[plant_id] = entry[1]
+            self.stats["hits"] += len(found)
+            self.stats["misses"] += len(plant_ids) - len(found)
+
+        missing = [plant_id for plant_id in plant_ids if plant_id not in found]
+        if missing:
+            derived = self._derive(missing, pd.Timestamp(day))
+            found.update(derived)
+            with self._lock:
+                self.stats["derivations"] += 1
+                for plant_id, plant in derived.items():
+                    self._cache[(plant_id, day)] = (now + self.cache_seconds, plant)
+                    self._cache.move_to_end((plant_id, day))
+                while len(self._cache) > self.cache_plants:
+                    self._cache.popitem(last=False)
+        return [found[plant_id] for plant_id in plant_ids]
+
+    def invalidate(self, plant_ids: Iterable[str]):
+        """Forgets cached plants (every day) whose open rows changed"""
+        plant_ids = set(plant_ids)
+        with self._lock:
+            stale = [key for key in self._cache if key[0] in plant_ids]
+            for key in stale:
+                del self._cache[key]
+            self.stats["invalidated"] += len(stale)
+
+    def clear(self):
+        """Forgets every cached plant"""
+        with self._lock:
+            self.stats["invalidated"] += len(self._cache)
+            self._cache.clear()
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return {**self.stats, "mode": SEVERITY_MODE, "cached_plants": len(self._cache)}
@@ -0,0 +1,113 @@
+"""
+FACTOR_POOL.PY - Concurrent evaluation of independent factors
+Runs one task per factor (e.g. the registry entry of each factor) in a worker
+pool instead of one after another.
+
+- Results come back keyed by factor, in sorted factor order, whatever order
+  the workers finish in, so merging them is deterministic
+- A failing factor does not stop the others: its error is reported in stats
+  and it is left out of the results
+- stats['factors'] gets the duration and outcome of every factor
+
+Tasks must be picklable in process mode (functools.partial of a module-level
+function, with DataFrame arguments).
+
+Settings:
+    FACTOR_POOL_MODE       thread (default, for NumPy/pandas kernels) | process | inline
+    FACTOR_POOL_WORKERS    pool size
+"""
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from utils.ids import derive_seed, seeded_ids
+
+FACTOR_POOL_MODE = os.getenv("FACTOR_POOL_MODE", "thread")
+FACTOR_POOL_WORKERS = int(os.getenv("FACTOR_POOL_WORKERS", 4))
+
+# Shared pools, created on first use
+_executors: Dict[str, Executor] = {}
+_executors_lock = threading.Lock()
+
+
+def _executor(mode: str, workers: int) -> Executor:
+    with _executors_lock:
+        if mode not in _executors:
+            if mode == "process" and multiprocessing.current_process().daemon:
+                # Daemonic processes cannot have children: fall back to threads
+                print("Warning: FACTOR_POOL_MODE=process in a daemonic process, using threads")
+                _executors[mode] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="factor")
+            elif mode == "process":
+                _executors[mode] = ProcessPoolExecutor(max_workers=workers)
+            else:
+                _executors[mode] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="factor")
+        return _executors[mode]
+
+
+def shutdown():
+    """
+    Shuts the shared pools down (call before a process exits: a process pool's
+    workers are joined by multiprocessing before the pools' own exit handler runs)
+    """
+    with _executors_lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=True)
+
+
+def _timed_call(task: Callable[[], Any], seed: Optional[int]):
+    """Runs one task in a worker; returns (result, seconds, error)"""
+    started = time.perf_counter()
+    try:
+        if seed is None:
+            result = task()
+        else:
+            with seeded_ids(seed):
+                result = task()
+        return result, time.perf_counter() - started, None
+    except Exception as e:
+        print(f"❌ Error in factor calculation: {str(e)}")
+        return None, time.perf_counter() - started, f"{type(e).__name__}: {str(e)}"
+
+
+def evaluate(tasks: Dict[str, Callable[[], Any]], stats: Dict,
+             mode: str = FACTOR_POOL_MODE, workers: int = FACTOR_POOL_WORKERS) -> Dict[str, Any]:
+    """
+    Runs the task of every factor, concurrently when there is more than one
+
+    Args:
+        tasks: { factor_code: zero-argument callable }
+        stats: orchestrator stats; 'completed' / 'errors' are counted and
+            stats['factors'][factor] gets {'seconds', 'ok', 'error'}
+            (seconds add up when called once per partition)
+    Returns:
+        { factor_code: result } of the factors that succeeded, in sorted order
+    """
+    factors = sorted(tasks)
+    # Seeds are drawn in factor order so replays give every factor the same IDs
+    seeds = {factor: derive_seed() for factor in factors}
+
+    if mode == "inline" or workers <= 1 or len(factors) <= 1:
+        outcomes = {factor: _timed_call(tasks[factor], seeds[factor]) for factor in factors}
+    else:
+        executor = _executor(mode, workers)
+        futures = {factor: executor.submit(_timed_call, tasks[factor], seeds[factor]) for factor in factors}
+        outcomes = {factor: futures[factor].result() for factor in factors}
+
+    results = {}
+    factor_stats = stats.setdefault('factors', {})
+    for factor in factors:
+        result, seconds, error = outcomes[factor]
+        entry = factor_stats.setdefault(factor, {'seconds': 0.0, 'ok': True, 'error': None})
+        entry['seconds'] = round(entry['seconds'] + seconds, 4)
+        if error is None:
+            results[factor] = result
+            stats['completed'] += 1
+        else:
+            entry['ok'] = False
+            entry['error'] = error
+            stats['errors'] += 1
+    return results
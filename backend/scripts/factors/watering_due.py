@@ -4,7 +4,27 @@ WATERING_DUE.PY - Watering Due Factor Manager
 
 import pandas as pd
 import numpy as np
-import uuid
+from utils.ids import new_ids
+import scripts.watering_regression as watering_regression
+
+# Waterings from which a plant's own average replaces the plant type interval
+INTERVAL_MIN_WATERINGS = 5
+
+# Lookup columns this factor reads { table: [columns] } (see scripts/dependencies.py)
+LOOKUP_DEPENDENCIES = {'plant_type_lookup': ['watering_interval_days']}
+
+
+def dependents(plants_data_df, activity_data_df, table):
+    """
+    Plants whose factor depends on the lookup table's columns: the plant type
+    interval is only used until a plant has INTERVAL_MIN_WATERINGS waterings
+
+    Returns:
+        plant_ids (list)
+    """
+    watering_count = plants_data_df['plant_id'].map(activity_data_df.groupby('plant_id').size()).fillna(0)
+    return plants_data_df.loc[watering_count < INTERVAL_MIN_WATERINGS, 'plant_id'].tolist()
+
 
 def run(plants_data_df, activity_data_df, run_id):
     print(f"\nManaging watering due factor for run {run_id}...\n")
@@ -61,6 +81,14 @@ def run(plants_data_df, activity_data_df, run_id):
     ).reset_index()
     print(f"  ✅ Step 02")
 
+    # Step 02b: Regression forecast of the plants with enough history (WATERING_FORECAST_MODE=regression)
+    if watering_regression.WATERING_FORECAST_MODE == "regression":
+        forecast_df = watering_regression.fit_predict(activity_history_df)
+        last_watering = last_watering.merge(forecast_df, on='plant_id', how='left')
+        ## Plants the model could not fit keep the Phase 1 average
+        last_watering['average_watering'] = last_watering['forecast_interval'].fillna(last_watering['average_watering'])
+        print(f"  ✅ Step 02b ({len(forecast_df)} plants forecast)")
+
     # Step 03: Merge to main table
     df = plants_data_df.merge(last_watering, on='plant_id', how='left')
     print(f"  ✅ Step 03")
@@ -69,8 +97,8 @@ def run(plants_data_df, activity_data_df, run_id):
     df['watering_due_date'] = np.select(
     condlist=[
         df['last_watering_date'].isna(),    # Condition 1: no history
-        df['watering_count'] < 5,           # Condition 2: history too short
-        df['watering_count'] >= 5           # Condition 3: has enough history
+        df['watering_count'] < INTERVAL_MIN_WATERINGS,    # Condition 2: history too short
+        df['watering_count'] >= INTERVAL_MIN_WATERINGS    # Condition 3: has enough history
     ],
     choicelist=[
         df['acquisition_date'] + pd.to_timedelta(df['watering_interval_days'], unit='D'),   # Acquisition date + plant type average days
@@ -99,6 +127,10 @@ def run(plants_data_df, activity_data_df, run_id):
     # Phase 1: Cap at 0.7 (using species default)
     df['confidence_score'] = np.minimum(df['confidence_score'], 0.7)
     df['confidence_score'] = df['confidence_score'].round(2)
+    ## Regression mode: forecast plants get the confidence of their fit
+    if 'forecast_confidence' in df.columns:
+        forecast = (df['watering_count'] >= watering_regression.MIN_WATERINGS) & df['forecast_confidence'].notna()
+        df.loc[forecast, 'confidence_score'] = df.loc[forecast, 'forecast_confidence']
     print(f"  ✅ Step 05")
 
     # Step 06: Create data to upload
@@ -114,7 +146,7 @@ def run(plants_data_df, activity_data_df, run_id):
     ## Add factor code
     plant_factor_df['factor_code'] = 'watering_due'
     ## Create factor id
-    plant_factor_df['plant_factor_id'] = [str(uuid.uuid4()) for _ in range(len(plant_factor_df))]
+    plant_factor_df['plant_factor_id'] = new_ids(len(plant_factor_df))
     ## Replace NaT/NaN with None so Supabase receives a SQL NULL
     plant_factor_df = plant_factor_df.where(pd.notnull(plant_factor_df), None)
     print(f"  ✅ Step 06")
@@ -5,9 +5,18 @@ WATERING_DUE.PY - Watering Due Factor Manager
 from datetime import date
 import pandas as pd
 import numpy as np
-import uuid
+from utils.ids import new_ids
 
-def run(plant_factor_df, today, run_id):
+# Days overdue from which severity 1, 2 and 3 start
+SEVERITY_BANDS = (1, 3, 7)
+
+def severity(days_overdue, bands=SEVERITY_BANDS):
+    """Severity of each days_overdue (NaN: 0): the number of bands it reached"""
+    severity_conditions = [days_overdue.isna()] + [days_overdue >= band for band in reversed(bands)]
+    severity = [0] + list(range(len(bands), 0, -1))
+    return np.select(severity_conditions, severity, default=0)
+
+def run(plant_factor_df, today, run_id, bands=SEVERITY_BANDS):
     print(f"\nManaging watering due factor contribution for run {run_id}...\n")
 
     """
@@ -29,6 +38,7 @@ def run(plant_factor_df, today, run_id):
             - factor_code: str
             - factor_date: date
         today (date)
+        bands: days overdue from which each severity starts (what-if simulations pass candidates)
     Returns:
         plant_factor_contribution_df
             - plant_factor_id
@@ -39,6 +49,8 @@ def run(plant_factor_df, today, run_id):
     """
 
     # Step 01: Calculate days
+    ## Work on a copy: the caller's factor frame is uploaded as is
+    plant_factor_df = plant_factor_df.copy()
     plant_factor_df['factor_date'] = pd.to_datetime(plant_factor_df['factor_date'])
     plant_factor_df['days_overdue'] = (today - plant_factor_df['factor_date']).dt.days
     print(f"  ✅ Step 01")
@@ -51,25 +63,17 @@ def run(plant_factor_df, today, run_id):
     - WARNING: 3-6 days overdue
     - URGENT: 7+ days overdue
     """
-    severity_conditions = [
-        plant_factor_df['days_overdue'].isna(),
-        plant_factor_df['days_overdue'] <=0,
-        (plant_factor_df['days_overdue'] >=1) & (plant_factor_df['days_overdue'] <=2),
-        (plant_factor_df['days_overdue'] >=3) & (plant_factor_df['days_overdue'] <=6),
-        plant_factor_df['days_overdue'] >=7
-    ]
-    severity = [0,0,1,2,3]
     print(f"  ✅ Step 02")
     
     # Step 03: Assign severity
-    plant_factor_df['severity'] = np.select(severity_conditions,severity,default=0)
+    plant_factor_df['severity'] = severity(plant_factor_df['days_overdue'], bands)
     print(f"  ✅ Step 03")
 
     # Step 04: Create data to return
     ## Keep only needed data
     keep_cols = ['plant_factor_id', 'plant_id', 'factor_code', 'severity']
     plant_factor_df = plant_factor_df[keep_cols]
-    plant_factor_df['plant_factor_contribution_id'] = [str(uuid.uuid4()) for _ in range(len(plant_factor_df))]
+    plant_factor_df['plant_factor_contribution_id'] = new_ids(len(plant_factor_df))
     ## Replace NaT/NaN with None so Supabase receives a SQL NULL
     plant_factor_contribution_df = plant_factor_df.where(pd.notnull(plant_factor_df), None)
     print(f"  ✅ Step 04")
@@ -0,0 +1,452 @@
+"""
+HABITAT_SENSORS.PY - Habitat sensor ingestion and rollups
+Keeps the humidity / temperature / light readings of each habitat in memory
+and turns them into hourly and daily aggregates as they arrive.
+
+- Raw readings:  bounded ring buffer per habitat (numpy arrays, oldest overwritten)
+- Aggregates:    count / sum / min / max / last per (habitat, metric, hour | day),
+                 updated on ingest; only the most recent buckets are kept
+- Flush:         the readings added since the last flush are merged into
+                 habitat_sensor_rollup in one bulk RPC call (never one row per
+                 reading); see sql/merge_habitat_sensor_rollup.sql
+- Reads:         latest() / latest_frame() for factor modules, O(1) per habitat;
+                 reader() gives processes without a store (the job worker) the
+                 same reads from habitat_sensor_rollup
+
+Buckets are UTC hours / days. A bucket lives in memory until it falls out of
+the kept range. A flush only sends what was added since the previous one
+(count, sum, min, max, last) and the RPC adds it to the stored row, so a
+restarted process or several API workers never overwrite each other's
+readings. On start the store loads the stored buckets of the kept range, so
+its reads include the readings of before the restart. Readings older than the
+kept range are rejected,
+and so are readings more than SENSOR_MAX_SKEW_SECONDS in the future (e.g. epoch
+milliseconds sent as seconds), which would otherwise evict the real buckets.
+
+Settings:
+    SENSOR_BUFFER_READINGS      raw readings kept per habitat
+    SENSOR_HOURLY_BUCKETS       hourly buckets kept per habitat and metric
+    SENSOR_DAILY_BUCKETS        daily buckets kept per habitat and metric
+    SENSOR_FLUSH_SECONDS        rollup flush period
+    SENSOR_MAX_SKEW_SECONDS     how far past the current time a reading may be
+    SENSOR_READ_CACHE_SECONDS   how long reader() keeps aggregates read from the database
+"""
+import os
+import math
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+SENSOR_BUFFER_READINGS = int(os.getenv("SENSOR_BUFFER_READINGS", 2048))
+SENSOR_HOURLY_BUCKETS = int(os.getenv("SENSOR_HOURLY_BUCKETS", 48))
+SENSOR_DAILY_BUCKETS = int(os.getenv("SENSOR_DAILY_BUCKETS", 14))
+SENSOR_FLUSH_SECONDS = int(os.getenv("SENSOR_FLUSH_SECONDS", 60))
+SENSOR_MAX_SKEW_SECONDS = float(os.getenv("SENSOR_MAX_SKEW_SECONDS", 300))
+SENSOR_READ_CACHE_SECONDS = float(os.getenv("SENSOR_READ_CACHE_SECONDS", 300))
+
+METRICS = ("humidity", "temperature", "light")
+GRANULARITY_SECONDS = {"hour": 3600, "day": 86400}
+ROLLUP_TABLE = "habitat_sensor_rollup"
+MERGE_RPC = "merge_habitat_sensor_rollup"
+# Habitats per request of RollupReader
+READ_CHUNK = 200
+ROLLUP_COLUMNS = ["habitat_id", "metric", "granularity", "bucket_start", "reading_count",
+                  "value_avg", "value_min", "value_max", "value_last"]
+
+# Store the app registered, for factor modules (see current())
+_current = None
+# Database reader of the processes without a store (see reader())
+_reader = None
+_reader_lock = threading.Lock()
+
+
+def current():
+    """The sensor store of this process (None when sensors are not enabled)"""
+    return _current
+
+
+def reader():
+    """
+    Latest aggregates for factor modules, in any process: the sensor store of
+    this process when it has one (API), otherwise a cached reader of
+    habitat_sensor_rollup (job worker)
+    """
+    global _reader
+    if _current is not None:
+        return _current
+    with _reader_lock:
+        if _reader is None:
+            from utils.supabase_client import get_client
+            _reader = RollupReader(supabase_factory=get_client)
+        return _reader
+
+
+def parse_timestamp(value) -> Optional[float]:
+    """ISO timestamp (naive = UTC) or epoch seconds -> epoch seconds"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+    return None
+
+
+class _RingBuffer:
+    """Last `capacity` raw readings of one habitat"""
+
+    def __init__(self, capacity: int):
+        self.recorded_at = np.zeros(capacity, dtype='float64')
+        self.metric = np.zeros(capacity, dtype='int8')
+        self.value = np.zeros(capacity, dtype='float32')
+        self.head = 0
+        self.size = 0
+
+    def append(self, recorded_at: float, metric: int, value: float):
+        self.recorded_at[self.head] = recorded_at
+        self.metric[self.head] = metric
+        self.value[self.head] = value
+        self.head = (self.head + 1) % len(self.value)
+        self.size = min(self.size + 1, len(self.value))
+
+    def since(self, metric: int, since: float) -> Tuple[np.ndarray, np.ndarray]:
+        """(recorded_at, value) of one metric since a time, oldest first"""
+        order = (np.arange(self.size) + (self.head - self.size)) % len(self.value)
+        selected = order[(self.metric[order] == metric) & (self.recorded_at[order] >= since)]
+        return self.recorded_at[selected], self.value[selected]
+
+
+class SensorStore:
+    """Ring buffers and rolling hourly / daily aggregates per habitat"""
+
+    def __init__(self, buffer_readings: int = SENSOR_BUFFER_READINGS,
+                 hourly_buckets: int = SENSOR_HOURLY_BUCKETS, daily_buckets: int = SENSOR_DAILY_BUCKETS,
+                 max_skew_seconds: float = SENSOR_MAX_SKEW_SECONDS):
+        self.buffer_readings = buffer_readings
+        self.max_skew_seconds = max_skew_seconds
+        self.keep = {"hour": hourly_buckets, "day": daily_buckets}
+        self._lock = threading.Lock()
+        self._buffers: Dict[str, _RingBuffer] = {}
+        # { (habitat_id, metric, granularity): OrderedDict{bucket_start: aggregate} }
+        self._buckets: Dict[Tuple[str, str, str], "OrderedDict[int, Dict]"] = {}
+        # { (habitat_id, metric, granularity, bucket_start): aggregate of the readings not flushed yet }
+        self._pending: Dict[Tuple[str, str, str, int], Dict] = {}
+        self._stop = threading.Event()
+
+        # Sensor stats tracking
+        self.stats = {
+            "accepted": 0,
+            "rejected": 0,
+            "flushes": 0,
+            "flushed_rows": 0,
+            "flush_errors": 0,
+            "dropped_buckets": 0,
+            "seeded_buckets": 0
+        }
+
+    # ============================================
+    # INGEST
+    # ============================================
+    @staticmethod
+    def _empty() -> Dict:
+        return {"count": 0, "sum": 0.0, "min": math.inf, "max": -math.inf, "last": None, "last_at": -math.inf}
+
+    @staticmethod
+    def _combine(bucket: Dict, other: Dict):
+        """Adds the readings of another aggregate of the same bucket"""
+        bucket["count"] += other["count"]
+        bucket["sum"] += other["sum"]
+        bucket["min"] = min(bucket["min"], other["min"])
+        bucket["max"] = max(bucket["max"], other["max"])
+        if other["last_at"] >= bucket["last_at"]:
+            bucket["last"], bucket["last_at"] = other["last"], other["last_at"]
+
+    def _bucket(self, habitat_id: str, metric: str, granularity: str, start: int) -> Optional[Dict]:
+        """The kept bucket starting at `start`, created if needed (None when older than the kept range)"""
+        buckets = self._buckets.setdefault((habitat_id, metric, granularity), OrderedDict())
+        if start not in buckets:
+            if len(buckets) >= self.keep[granularity] and start < next(iter(buckets)):
+                return None
+            out_of_order = bool(buckets) and start < next(reversed(buckets))
+            buckets[start] = self._empty()
+            # Keep buckets in time order, drop the oldest beyond the kept range
+            # (their pending readings are still flushed)
+            if out_of_order:
+                for key in sorted(buckets):
+                    buckets.move_to_end(key)
+            while len(buckets) > self.keep[granularity]:
+                buckets.popitem(last=False)
+        return buckets[start]
+
+    def _add_to_bucket(self, habitat_id: str, metric: str, granularity: str, recorded_at: float, value: float) -> bool:
+        seconds = GRANULARITY_SECONDS[granularity]
+        start = int(recorded_at // seconds) * seconds
+        bucket = self._bucket(habitat_id, metric, granularity, start)
+        if bucket is None:
+            return False
+        reading = {"count": 1, "sum": value, "min": value, "max": value, "last": value, "last_at": recorded_at}
+        self._combine(bucket, reading)
+        self._combine(self._pending.setdefault((habitat_id, metric, granularity, start), self._empty()), reading)
+        return True
+
+    def ingest(self, habitat_id: str, readings: List[Dict]) -> Dict[str, int]:
+        """
+        Adds a batch of readings of one habitat
+
+        Args:
+            readings: [{'metric': 'humidity' | 'temperature' | 'light', 'value': float, 'recorded_at': ISO | epoch}]
+        Returns:
+            {'accepted': X, 'rejected': Y}
+        """
+        accepted = rejected = 0
+        latest_allowed = time.time() + self.max_skew_seconds
+        with self._lock:
+            buffer = self._buffers.get(habitat_id)
+            if buffer is None:
+                buffer = self._buffers[habitat_id] = _RingBuffer(self.buffer_readings)
+            for reading in readings:
+                metric = reading.get("metric")
+                recorded_at = parse_timestamp(reading.get("recorded_at"))
+                try:
+                    value = float(reading.get("value"))
+                except (TypeError, ValueError):
+                    value = math.nan
+                if (metric not in METRICS or recorded_at is None or not math.isfinite(value)
+                        or not math.isfinite(recorded_at) or recorded_at > latest_allowed):
+                    rejected += 1
+                    continue
+                # Too old for the kept daily range: rejected everywhere
+                if not self._add_to_bucket(habitat_id, metric, "day", recorded_at, value):
+                    rejected += 1
+                    continue
+                self._add_to_bucket(habitat_id, metric, "hour", recorded_at, value)
+                buffer.append(recorded_at, METRICS.index(metric), value)
+                accepted += 1
+            self.stats["accepted"] += accepted
+            self.stats["rejected"] += rejected
+        return {"accepted": accepted, "rejected": rejected}
+
+    # ============================================
+    # READS (for factor modules)
+    # ============================================
+    @staticmethod
+    def _aggregate(habitat_id: str, metric: str, granularity: str, start: int, bucket: Dict) -> Dict:
+        return {
+            "habitat_id": habitat_id,
+            "metric": metric,
+            "granularity": granularity,
+            "bucket_start": datetime.fromtimestamp(start, tz=timezone.utc).isoformat(),
+            "reading_count": bucket["count"],
+            "value_avg": round(bucket["sum"] / bucket["count"], 4),
+            "value_min": bucket["min"],
+            "value_max": bucket["max"],
+            "value_last": bucket["last"]
+        }
+
+    def latest(self, habitat_id: str, metric: str, granularity: str = "hour") -> Optional[Dict]:
+        """Aggregate of the most recent bucket of a habitat's metric"""
+        with self._lock:
+            buckets = self._buckets.get((habitat_id, metric, granularity))
+            if not buckets:
+                return None
+            start = next(reversed(buckets))
+            return self._aggregate(habitat_id, metric, granularity, start, buckets[start])
+
+    def series(self, habitat_id: str, metric: str, granularity: str = "hour") -> List[Dict]:
+        """Every kept bucket of a habitat's metric, oldest first"""
+        with self._lock:
+            buckets = self._buckets.get((habitat_id, metric, granularity), {})
+            return [self._aggregate(habitat_id, metric, granularity, start, bucket) for start, bucket in buckets.items()]
+
+    def latest_frame(self, habitat_ids, metric: str, granularity: str = "hour") -> pd.DataFrame:
+        """Latest aggregates of many habitats, to merge into a factor's frame on habitat_id"""
+        rows = [self.latest(habitat_id, metric, granularity) for habitat_id in pd.unique(pd.Series(habitat_ids))]
+        return pd.DataFrame([row for row in rows if row is not None], columns=ROLLUP_COLUMNS)
+
+    def recent(self, habitat_id: str, metric: str, seconds: float) -> List[Dict]:
+        """Raw readings of the last `seconds` still in the ring buffer"""
+        with self._lock:
+            buffer = self._buffers.get(habitat_id)
+            if buffer is None:
+                return []
+            recorded_at, values = buffer.since(METRICS.index(metric), time.time() - seconds)
+        return [{"recorded_at": datetime.fromtimestamp(t, tz=timezone.utc).isoformat(), "value": float(v)}
+                for t, v in zip(recorded_at, values)]
+
+    # ============================================
+    # FLUSH
+    # ============================================
+    @staticmethod
+    def _merge_row(habitat_id: str, metric: str, granularity: str, start: int, pending: Dict) -> Dict:
+        """RPC row of the readings not flushed yet (added to the stored row by the RPC)"""
+        return {
+            "habitat_id": habitat_id,
+            "metric": metric,
+            "granularity": granularity,
+            "bucket_start": datetime.fromtimestamp(start, tz=timezone.utc).isoformat(),
+            "reading_count": pending["count"],
+            "value_sum": pending["sum"],
+            "value_min": pending["min"],
+            "value_max": pending["max"],
+            "value_last": pending["last"]
+        }
+
+    def flush(self, supabase) -> int:
+        """Merges the readings added since the last flush in one bulk call; returns the number of rows"""
+        with self._lock:
+            rows = []
+            for key, pending in self._pending.items():
+                try:
+                    rows.append(self._merge_row(*key, pending))
+                except (ValueError, OverflowError, OSError) as e:
+                    # A bucket that cannot be written would fail every later flush: drop it
+                    self._buckets.get(key[:3], {}).pop(key[3], None)
+                    self.stats["dropped_buckets"] += 1
+                    print(f"Warning: dropped sensor bucket {' '.join(map(str, key))}: {str(e)}")
+            flushed, self._pending = self._pending, {}
+        if not rows:
+            return 0
+        try:
+            supabase.rpc(MERGE_RPC, {"p_rows": rows}).execute()
+        except Exception:
+            # Merged again at the next flush, with the readings added meanwhile
+            with self._lock:
+                for key, pending in flushed.items():
+                    self._combine(self._pending.setdefault(key, self._empty()), pending)
+                self.stats["flush_errors"] += 1
+            raise
+        with self._lock:
+            self.stats["flushes"] += 1
+            self.stats["flushed_rows"] += len(rows)
+        return len(rows)
+
+    def seed(self, supabase) -> int:
+        """Adds the stored aggregates of the kept range to the buckets (they are not flushed again)"""
+        rows = []
+        for granularity, seconds in GRANULARITY_SECONDS.items():
+            since = datetime.fromtimestamp(time.time() - self.keep[granularity] * seconds, tz=timezone.utc)
+            rows += (supabase
+                .table(ROLLUP_TABLE)
+                .select(", ".join(ROLLUP_COLUMNS))
+                .eq("granularity", granularity)
+                .gte("bucket_start", since.isoformat())
+                .execute()).data or []
+        seeded = 0
+        with self._lock:
+            for row in rows:
+                start = parse_timestamp(row["bucket_start"])
+                if start is None or row["granularity"] not in GRANULARITY_SECONDS or not row["reading_count"]:
+                    continue
+                bucket = self._bucket(row["habitat_id"], row["metric"], row["granularity"], int(start))
+                if bucket is None:
+                    continue
+                # The time of the stored last reading is unknown: any reading of this process is later
+                self._combine(bucket, {
+                    "count": row["reading_count"], "sum": row["value_avg"] * row["reading_count"],
+                    "min": row["value_min"], "max": row["value_max"],
+                    "last": row["value_last"], "last_at": start
+                })
+                seeded += 1
+            self.stats["seeded_buckets"] += seeded
+        return seeded
+
+    def start(self, supabase_factory, flush_seconds: int = SENSOR_FLUSH_SECONDS):
+        """Registers the store for factor modules, loads the stored buckets and flushes in a daemon thread"""
+        global _current
+        _current = self
+
+        def loop():
+            try:
+                print(f"✓ Sensor store seeded with {self.seed(supabase_factory())} stored buckets")
+            except Exception as e:
+                print(f"❌ Error loading stored sensor rollups: {str(e)}")
+            while not self._stop.wait(flush_seconds):
+                try:
+                    self.flush(supabase_factory())
+                except Exception as e:
+                    print(f"❌ Error flushing sensor rollups: {str(e)}")
+
+        threading.Thread(target=loop, name="sensor-flush", daemon=True).start()
+
+    def stop(self, supabase_factory=None):
+        """Stops the flush thread, with a last flush when a client factory is given"""
+        self._stop.set()
+        if supabase_factory is not None:
+            try:
+                self.flush(supabase_factory())
+            except Exception as e:
+                print(f"❌ Error flushing sensor rollups: {str(e)}")
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return {
+                **self.stats,
+                "habitats": len(self._buffers),
+                "pending_rows": len(self._pending)
+            }
+
+
+class RollupReader:
+    """Latest aggregates read from habitat_sensor_rollup, cached for SENSOR_READ_CACHE_SECONDS"""
+
+    def __init__(self, supabase_factory, cache_seconds: float = SENSOR_READ_CACHE_SECONDS,
+                 hourly_buckets: int = SENSOR_HOURLY_BUCKETS, daily_buckets: int = SENSOR_DAILY_BUCKETS):
+        self.supabase_factory = supabase_factory
+        self.cache_seconds = cache_seconds
+        self.keep = {"hour": hourly_buckets, "day": daily_buckets}
+        self._lock = threading.Lock()
+        # { (habitat_id, metric, granularity): (read_at, latest aggregate or None) }
+        self._cache: Dict[Tuple[str, str, str], Tuple[float, Optional[Dict]]] = {}
+
+        # Reader stats tracking
+        self.stats = {"reads": 0, "cache_hits": 0}
+
+    def _read(self, habitat_ids: List[str], metric: str, granularity: str):
+        since = datetime.fromtimestamp(time.time() - self.keep[granularity] * GRANULARITY_SECONDS[granularity], tz=timezone.utc)
+        rows = (self.supabase_factory()
+            .table(ROLLUP_TABLE)
+            .select(", ".join(ROLLUP_COLUMNS))
+            .in_("habitat_id", habitat_ids)
+            .eq("metric", metric)
+            .eq("granularity", granularity)
+            .gte("bucket_start", since.isoformat())
+            .execute()).data or []
+        latest = {}
+        for row in rows:
+            current_row = latest.get(row["habitat_id"])
+            if current_row is None or parse_timestamp(row["bucket_start"]) > parse_timestamp(current_row["bucket_start"]):
+                latest[row["habitat_id"]] = row
+        read_at = time.time()
+        with self._lock:
+            self.stats["reads"] += 1
+            for habitat_id in habitat_ids:
+                self._cache[(habitat_id, metric, granularity)] = (read_at, latest.get(habitat_id))
+
+    def latest_frame(self, habitat_ids, metric: str, granularity: str = "hour") -> pd.DataFrame:
+        """Latest aggregates of many habitats, to merge into a factor's frame on habitat_id"""
+        habitat_ids = [str(habitat_id) for habitat_id in pd.unique(pd.Series(habitat_ids)) if pd.notna(habitat_id)]
+        now = time.time()
+        with self._lock:
+            expired = [
+                habitat_id for habitat_id in habitat_ids
+                if now - self._cache.get((habitat_id, metric, granularity), (-math.inf, None))[0] > self.cache_seconds
+            ]
+            self.stats["cache_hits"] += len(habitat_ids) - len(expired)
+        for start in range(0, len(expired), READ_CHUNK):
+            self._read(expired[start:start + READ_CHUNK], metric, granularity)
+        with self._lock:
+            rows = [self._cache[(habitat_id, metric, granularity)][1] for habitat_id in habitat_ids]
+        return pd.DataFrame([row for row in rows if row is not None], columns=ROLLUP_COLUMNS)
+
+    def latest(self, habitat_id: str, metric: str, granularity: str = "hour") -> Optional[Dict]:
+        """Aggregate of the most recent stored bucket of a habitat's metric"""
+        frame = self.latest_frame([habitat_id], metric, granularity)
+        return frame.iloc[0].to_dict() if not frame.empty else None
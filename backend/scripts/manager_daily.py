@@ -5,16 +5,25 @@ MANAGER_DAILY.PY - Orchestrator of Daily Routines
 
 import os
 import sys
+import math
+import time
+from contextlib import contextmanager
+from functools import partial
 from datetime import datetime, date
 from typing import List, Dict, Optional, Tuple
 from zoneinfo import ZoneInfo
-import uuid
 import pandas as pd
 import json
 from utils.supabase_client import get_client
 from scripts.factors_contribution import registry as factor_contribution_registry
 from scripts.schedule.severity import run as schedule_severity_calculator
 from scripts.manager_plant_status import run as status_calculator
+import scripts.factor_pool as factor_pool
+from scripts.batch_checkpoint import BatchCheckpoint, DAILY_BATCH_CHECKPOINT_DIR
+import scripts.rollups as rollups
+from scripts.derived_status import SEVERITY_MODE
+from utils.frames import share_categories, to_int8, to_day, changed, memory_mb, partition, peak_rss_mb
+from utils.ids import new_id
 
 # Add parent directory to path for imports
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -23,15 +32,40 @@ sys.path.insert(0, parent_dir)
 sys.path.insert(0, current_dir)
 
 
+# Memory budget for the batch frames (0 = no budget, process everything at once)
+DAILY_BATCH_MEMORY_BUDGET_MB = float(os.getenv("DAILY_BATCH_MEMORY_BUDGET_MB", 0))
+# Intermediate frames of a stage are a few times the size of its inputs
+WORKING_SET_FACTOR = 4
+# Changed rows of compute() -> (table, key, value column) of the open row they update
+UPDATE_TARGETS = {
+    'schedule_severity': ('schedule', 'schedule_id', 'schedule_severity'),
+    'factor_contribution': ('plant_factor_contribution', 'plant_factor_id', 'severity'),
+    'status': ('plant_status', 'plant_id', 'status_code')
+}
+# Keys per request when re-reading the targets of resumed updates
+RESUME_CHECK_CHUNK = 200
+# Plants per request when reading the open rows of one timezone (rolling mode)
+PLANT_CHUNK = 200
+# Directory for input/output snapshots of each run (empty = no capture)
+DAILY_BATCH_CAPTURE_DIR = os.getenv("DAILY_BATCH_CAPTURE_DIR", "")
+
+
 class DailyBatch:
     """Main orchestrator for daily batch"""
     
-    def __init__(self):
-
-        self.supabase = get_client()
-        self.batch_id = str(uuid.uuid4())
+    def __init__(self, run_date: Optional[str] = None, timezone: Optional[str] = None, state_store=None,
+                 offline: bool = False):
+
+        # Offline batches (snapshot replay) only run compute() and need no client
+        self.supabase = None if offline else get_client()
+        # Open rows are read from the in-process state store when it is loaded
+        self.state_store = state_store
+        self.batch_id = new_id()
         self.batch_timestamp = datetime.now()
-        current_dt = datetime.now(ZoneInfo("America/New_York")).date()
+        # Rolling mode: only the plants of this timezone, evaluated with that zone's date
+        self.timezone = timezone
+        # The logical run date is pinned by the job queue so a resumed job evaluates the same day
+        current_dt = run_date or datetime.now(ZoneInfo(timezone or "America/New_York")).date()
         self.today_date = pd.Timestamp(current_dt)
 
         # Batch stats tracking
@@ -40,6 +74,8 @@ class DailyBatch:
             "completed": 0,
             "errors": 0
         }
+        if timezone:
+            self.stats["timezone"] = timezone
 
 
     def run(self):
@@ -47,6 +83,18 @@ class DailyBatch:
         Main entry point - calls for the daily functions
         
         Schedule Severity: updates any changed schedule severity
+        Factor Contribution: updates any changed factor contribution severity
+        Status: updates any changed plant status
+
+        The run is split in three stages: load_inputs() reads the open rows,
+        compute() runs the calculators (no database access) and commit() sends
+        the changes. With DAILY_BATCH_CAPTURE_DIR set, the inputs and outputs
+        are also written to a snapshot that scripts.batch_snapshot can replay.
+
+        With DAILY_BATCH_CHECKPOINT_DIR set, the computed changes are
+        checkpointed and a retry for the same date shortly after resumes the
+        uncommitted batch (same batch_id) from them, minus the changes whose
+        target row was closed or changed since; see scripts/batch_checkpoint.py.
 
         Returns:
             Dict with counts: {'processed': X, 'updated': Y, 'errors': Z}
@@ -54,6 +102,19 @@ class DailyBatch:
 
         self.stats["started"]=1
 
+        # RESUME AN INCOMPLETE BATCH OF THE SAME DATE
+        checkpoint = None
+        if DAILY_BATCH_CHECKPOINT_DIR:
+            checkpoint = BatchCheckpoint(DAILY_BATCH_CHECKPOINT_DIR, self.today_date.date().isoformat(), self.timezone)
+            if not checkpoint.acquire():
+                # Another run of this date owns the checkpoint: leave it alone
+                print(f"Warning: another batch of {self.today_date.date()} is running, not checkpointing this one")
+                checkpoint = None
+            elif checkpoint.open(self.batch_id, self.batch_timestamp.isoformat()):
+                self.batch_id = checkpoint.batch_id
+                self.batch_timestamp = datetime.fromisoformat(checkpoint.batch_timestamp)
+                self.stats['resumed'] = True
+
         print(f"\n{'='*60}")
         print(f"DAILY BATCH STARTED")
         print(f"Batch ID: {self.batch_id}")
@@ -61,213 +122,502 @@ class DailyBatch:
         print(f"{'='*60}\n")
         
         try:
+            inputs = None
+            updates = checkpoint.load('updates') if checkpoint else None
+            targets = checkpoint.load('targets') if checkpoint else None
+            if updates is None or targets is None:
+                inputs = self.load_inputs()
+                updates = self.compute(inputs)
+                if checkpoint:
+                    checkpoint.save('targets', self._targets(inputs, updates))
+                    checkpoint.save('updates', updates)
+            else:
+                print(f"  Resuming batch {self.batch_id} from its updates checkpoint")
+                updates = self._drop_stale(updates, targets)
+
+            # CAPTURE SNAPSHOT (opt-in)
+            if DAILY_BATCH_CAPTURE_DIR and inputs is not None:
+                from scripts.batch_snapshot import write_snapshot
+                try:
+                    path = write_snapshot(DAILY_BATCH_CAPTURE_DIR, self, inputs, updates)
+                    print(f"  Snapshot captured in {path}")
+                except Exception as e:
+                    print(f"Warning: could not capture batch snapshot: {str(e)}")
 
-            #########################################
-            ## SCHEDULE SEVERITY MANAGEMENT
-            #########################################
+            self.commit(updates)
+            if checkpoint:
+                checkpoint.mark_committed()
 
-            print(f"Managing schedule.")
-            # GET CURRENT SCHEDULE DATA
-            schedule_data = (self.supabase
-                .table('schedule')
-                .select('schedule_id, schedule_date, schedule_severity, user_id')
-                .is_('end_date','null')
-                .execute())
-            schedule_df = pd.DataFrame(schedule_data.data)
-            schedule_df['schedule_date'] = pd.to_datetime(schedule_df['schedule_date']).dt.tz_localize(None)
-            self.stats['completed'] += 1
-            print(f"\nCurrent schedule loaded\n")
+        except Exception as e:
+            print(f"❌ Error in managing schedule severity: {str(e)}")
+            raise  # stop entire batch on failure
+        finally:
+            if checkpoint:
+                checkpoint.release()
 
-            # CALCULATE SEVERITY
-            # Prep data for calculator
-            keep_cols = ['schedule_id', 'schedule_date']
-            schedule_calculator_data_df = schedule_df[keep_cols].copy()
-            # Send data to calculator
-            schedule_severity_new_df = schedule_severity_calculator(schedule_calculator_data_df,self.today_date,run_id=self.batch_id)
-            schedule_severity_new_df = schedule_severity_new_df.rename(columns={'schedule_severity': 'schedule_severity_new'})
-            self.stats['completed'] += 1
-            print(f"\nCalculated schedule new severity\n")
-            
-            # MERGE
-            schedule_severity_calculated_df = schedule_df.merge(schedule_severity_new_df,on='schedule_id',how='left')
-            self.stats['completed'] += 1
             
-            # FILTER FOR SEVERITY THAT CHANGED
-            # Use .ne() (not equal) or fillna to handle potential Nulls
-            schedule_severity_update_df = schedule_severity_calculated_df[
-                (schedule_severity_calculated_df['schedule_severity_new'] != schedule_severity_calculated_df['schedule_severity']) &
-                (schedule_severity_calculated_df['schedule_severity_new'].notna())
-            ][['schedule_id', 'schedule_severity_new', 'user_id']]
-            self.stats['completed'] += 1
-            print(f"\nNew severity filtered\n")
-            print(f"  Found {len(schedule_severity_update_df)} schedules with changed severity")
-
-            # CLEAN DATA
-            keep_cols = ['schedule_id', 'schedule_severity_new', 'user_id']
-            rename_map = {'schedule_severity_new': 'schedule_severity'}
-            schedule_severity_update_df = schedule_severity_update_df[keep_cols].rename(columns=rename_map)
+        # Print summary
+        print(f"\n{'='*60}")
+        print(f"DAILY BATCH COMPLETED")
+        print(f"Stats: {self.stats}")
+        print(f"{'='*60}\n")
+        
+        return self.stats
 
+    @contextmanager
+    def _timed(self, stage: str):
+        """Adds the duration of a stage to stats['timings']"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            timings = self.stats.setdefault('timings', {})
+            timings[stage] = round(timings.get(stage, 0) + time.perf_counter() - started, 4)
 
+    def load_inputs(self) -> Dict[str, pd.DataFrame]:
+        """
+        Reads the open rows the batch works on
 
+        Returns:
+            {'schedule', 'plant_factor', 'plant_factor_contribution', 'plant_status', 'factor_lookup'} frames
+        """
+        with self._timed('load'):
             #########################################
-            ## FACTOR CONTRIBUTION MANAGEMENT
+            ## LOAD CURRENT DATA
             #########################################
 
-            print(f"\nManaging factor contributions.\n")
-
-            # GET CURRENT FACTOR
-            factor_data = (self.supabase
-                .table('plant_factor')
-                .select('plant_factor_id, plant_id, factor_code, factor_date, factor_float')
-                .is_('end_date','null')
-                .execute())
-            factor_data_df = pd.DataFrame(factor_data.data)
+            # ONLY THE PLANTS OF THE TIMEZONE (rolling mode): read just their open rows
+            plant_ids = None
+            if self.timezone:
+                plant_ids = self._fetch_timezone_plants()
+                print(f"  {len(plant_ids)} plants in timezone {self.timezone}")
 
-            # CALCULATE FACTOR CONTRIBUTION for EACH COMPONENT
-            # Create factor contribution data
-            cols = ['plant_id','plant_factor_id','factor_code','severity']
-            factor_contribution_df = pd.DataFrame(columns=cols)
+            # GET CURRENT SCHEDULE DATA
+            schedule_df = self._select_open('schedule', 'schedule_id, plant_id, schedule_date, schedule_severity, user_id', plant_ids)
+            print(f"\nCurrent schedule loaded\n")
 
-            # Define the list of factors to be called
-            list_factors_calculation = {
-                "watering_due"
-            #    "fertilizing_due"
-            }
+            # GET CURRENT FACTOR
+            factor_data_df = self._select_open('plant_factor', 'plant_factor_id, plant_id, factor_code, factor_date, factor_float', plant_ids)
 
-            for factor in list_factors_calculation:
-                try:
-                    # CALCULATE FACTOR CONTRIBUTION
-                    if factor in factor_contribution_registry:
-                        print(f"Calculating {factor} contribution.")
-                        plant_single_factor_contribution_df = factor_contribution_registry[factor].run(
-                            plant_factor_df=factor_data_df,
-                            today=self.today_date,
-                            run_id=self.batch_id
-                        )
-                        factor_contribution_new_df = pd.concat([factor_contribution_df,plant_single_factor_contribution_df], ignore_index=True)
-                        self.stats['completed'] += 1
-                    else:
-                        print(f"Warning: {factor} is not a valid factor contribution.")
-                        self.stats['errors'] += 1
+            # GET CURRENT FACTOR CONTRIBUTION
+            factor_contribution_data_df = self._select_open('plant_factor_contribution', 'plant_factor_contribution_id, plant_factor_id, plant_id, factor_code, severity', plant_ids)
 
-                except Exception as e:
-                    print(f"❌ Error in factor calculation: {str(e)}")
-                    raise  # stop entire batch on failure
-            # Rename to new severity and clean data
-            # CLEAN DATA
-            keep_cols = ['plant_factor_id', 'severity']
-            rename_map = {'severity': 'severity_new'}
-            factor_contribution_new_df = factor_contribution_new_df[keep_cols].rename(columns=rename_map)
+            # GET CURRENT STATUS
+            status_df = self._select_open('plant_status', 'plant_status_id, plant_id, status_code, user_id', plant_ids)
+            print(f"\nCurrent status retrieved\n")
 
-            # GET CURRENT FACTOR CONTRIBUTION
-            factor_contribution_data = (self.supabase
-                .table('plant_factor_contribution')
-                .select('plant_factor_contribution_id, plant_factor_id, plant_id, factor_code, severity')
-                .is_('end_date','null')
+            # GET CURRENT FACTOR CONTRIBUTION WEIGHT (read once, shared by every partition)
+            factor_lookup_data = (self.supabase
+                .table('factor_lookup')
+                .select('factor_code, weight')
+                .eq('is_active',True)
                 .execute())
-            factor_contribution_data_df = pd.DataFrame(factor_contribution_data.data)
-
-            # MERGE
-            factor_contribution_calculated_df = factor_contribution_data_df.merge(factor_contribution_new_df,on='plant_factor_id',how='left')
-            self.stats['completed'] += 1
-            # FILTER FOR CONTRIBUTIONS THAT CHANGED
-            # Use .ne() (not equal) or fillna to handle potential Nulls
-            factor_contribution_update_df = factor_contribution_calculated_df[
-                (factor_contribution_calculated_df['severity_new'] != factor_contribution_calculated_df['severity']) &
-                (factor_contribution_calculated_df['severity_new'].notna())
-            ][['plant_factor_id', 'severity_new']]
+            factor_lookup_df = pd.DataFrame(factor_lookup_data.data)
             self.stats['completed'] += 1
-            print(f"\nNew severity of factor contributions filtered\n")
-            print(f"  Found {len(factor_contribution_update_df)} factors with changed severity\n")
-            
-            # CLEAN DATA
-            keep_cols = ['plant_factor_id', 'severity_new']
-            rename_map = {'severity_new': 'severity'}
-            factor_contribution_update_df = factor_contribution_update_df[keep_cols].rename(columns=rename_map)
-
-
-            #########################################
-            ## STATUS MANAGEMENT
-            #########################################
 
-            print(f"Managing statuses.")
+        return {
+            'schedule': schedule_df,
+            'plant_factor': factor_data_df,
+            'plant_factor_contribution': factor_contribution_data_df,
+            'plant_status': status_df,
+            'factor_lookup': factor_lookup_df
+        }
 
-            # PREP DATA FOR STATUS CALCULATION
-            keep_cols = ['plant_id', 'factor_code', 'severity_new']
-            rename_map = {'severity_new': 'severity'}
-            factor_contribution_calculated_df = factor_contribution_calculated_df[keep_cols].rename(columns=rename_map)
+    def compute(self, inputs: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+        """
+        Runs the calculators over the inputs of load_inputs() (no database access)
 
-            # CALCULATE STATUS
-            status_new_df = status_calculator(factor_contribution_calculated_df,run_id=self.batch_id,supabase=self.supabase)
-            status_new_df = status_new_df.rename(columns={'status_code': 'status_code_new'})
-            self.stats['completed'] += 1
-            print(f"\nCalculated new status\n")
-            
-            # GET CURRENT STATUS
-            status_data = (self.supabase
-                .table('plant_status')
-                .select('plant_status_id, plant_id, status_code, user_id')
-                .is_('end_date','null')
-                .execute())
-            status_df = pd.DataFrame(status_data.data)
-            print(f"\nCurrent status retrieved\n")
+        Frames are kept compact (categorical UUID keys, int8 severities, day dates).
+        When DAILY_BATCH_MEMORY_BUDGET_MB is set and the estimated working set is
+        larger, the stages run over partitions of the data (by plant) and only the
+        changed rows of each partition are kept.
 
-            # MERGE
-            status_calculated_df = status_df.merge(status_new_df,on='plant_id',how='left')
-            self.stats['completed'] += 1
+        With SEVERITY_MODE=derived, severities are derived at read time
+        (scripts/derived_status.py): changed schedule and contribution severities
+        are only counted (stats['derived']), not returned for writing.
 
-            # FILTER FOR STATUSES THAT CHANGED
-            # Use .ne() (not equal) or fillna to handle potential Nulls
-            status_update_df = status_calculated_df[
-                (status_calculated_df['status_code_new'] != status_calculated_df['status_code']) &
-                (status_calculated_df['status_code_new'].notna())
-            ][['plant_id', 'status_code_new', 'user_id']]
-            self.stats['completed'] += 1
-            print(f"\nNew statuses filtered\n")
-            print(f"  Found {len(status_update_df)} plants with changed statuses")
+        Returns:
+            {'schedule_severity', 'factor_contribution', 'status'} frames of changed rows,
+            plus 'rollup' (one row per plant for the run date) when DAILY_ROLLUP_ENABLED
+        """
+        factor_lookup_df = inputs['factor_lookup']
+
+        # COMPACT DATA
+        with self._timed('compact'):
+            schedule_df, factor_data_df, factor_contribution_data_df, status_df = self._compact(
+                inputs['schedule'].copy(), inputs['plant_factor'].copy(),
+                inputs['plant_factor_contribution'].copy(), inputs['plant_status'].copy()
+            )
+            n_parts = self._partition_count(schedule_df, factor_data_df, factor_contribution_data_df, status_df)
+            self.stats['partitions'] = n_parts
+
+        #########################################
+        ## SCHEDULE SEVERITY MANAGEMENT
+        #########################################
+
+        print(f"Managing schedule.")
+        with self._timed('schedule_severity'):
+            schedule_severity_update_df = pd.concat(
+                [self._schedule_severity_updates(part) for part in partition(schedule_df, 'schedule_id', n_parts)],
+                ignore_index=True
+            )
+        self.stats['completed'] += 1
+        print(f"  Found {len(schedule_severity_update_df)} schedules with changed severity")
+
+        #########################################
+        ## FACTOR CONTRIBUTION & STATUS MANAGEMENT
+        #########################################
+
+        # Partitions are by plant: a plant's factors, contributions and status stay together
+        print(f"\nManaging factor contributions and statuses.\n")
+        factor_contribution_updates = []
+        status_updates = []
+        for factor_part, contribution_part, status_part in zip(
+            partition(factor_data_df, 'plant_id', n_parts),
+            partition(factor_contribution_data_df, 'plant_id', n_parts),
+            partition(status_df, 'plant_id', n_parts)
+        ):
+            with self._timed('factor_contribution'):
+                factor_contribution_update_df, factor_contribution_calculated_df = self._factor_contribution_updates(
+                    factor_part, contribution_part
+                )
+            factor_contribution_updates.append(factor_contribution_update_df)
+            with self._timed('status'):
+                status_updates.append(self._status_updates(factor_contribution_calculated_df, status_part, factor_lookup_df))
+
+        factor_contribution_update_df = pd.concat(factor_contribution_updates, ignore_index=True)
+        status_update_df = pd.concat(status_updates, ignore_index=True)
+        self.stats['completed'] += 2
+        print(f"  Found {len(factor_contribution_update_df)} factors with changed severity")
+        print(f"  Found {len(status_update_df)} plants with changed statuses")
+
+        #########################################
+        ## DAILY ROLLUP (side output for history charts)
+        #########################################
+        updates = {
+            'schedule_severity': schedule_severity_update_df,
+            'factor_contribution': factor_contribution_update_df,
+            'status': status_update_df
+        }
+        if rollups.DAILY_ROLLUP_ENABLED:
+            with self._timed('rollup'):
+                updates['rollup'] = rollups.build(
+                    schedule_df, status_df, schedule_severity_update_df, status_update_df, self.today_date
+                )
+
+        # CONSISTENCY PASS (derived mode): only statuses and the rollup are written
+        if SEVERITY_MODE == "derived":
+            self.stats['derived'] = {
+                'schedule_severity': len(schedule_severity_update_df),
+                'factor_contribution': len(factor_contribution_update_df)
+            }
+            updates['schedule_severity'] = schedule_severity_update_df.iloc[0:0]
+            updates['factor_contribution'] = factor_contribution_update_df.iloc[0:0]
+            print(f"  Severity mode 'derived': {self.stats['derived']} changed severities left to read time")
 
-            # CLEAN DATA
-            keep_cols = ['plant_id', 'status_code_new', 'user_id']
-            rename_map = {'status_code_new': 'status_code'}
-            status_update_df = status_update_df[keep_cols].rename(columns=rename_map)
+        self.stats['frames_mb'] = memory_mb(schedule_df, factor_data_df, factor_contribution_data_df, status_df)
+        self.stats['peak_rss_mb'] = peak_rss_mb()
 
+        return updates
 
+    @staticmethod
+    def records(updates: Dict[str, pd.DataFrame]) -> Dict[str, List[Dict]]:
+        """Changed rows of compute() as JSON-ready records (RPC format)"""
+        return {
+            name: json.loads(df.to_json(orient="records", date_format="iso"))
+            for name, df in updates.items()
+        }
 
+    def commit(self, updates: Dict[str, pd.DataFrame]):
+        """Sends the changed rows of compute() to run_daily_batch"""
+        with self._timed('commit'):
             #########################################
             ## SUPABASE COMMAND
             #########################################
 
             # PREPARE DATA TO UPLOAD
             self.batch_timestamp = self.batch_timestamp.isoformat()
-            schedule_severity_update_df = json.loads(schedule_severity_update_df.to_json(orient="records", date_format="iso"))
-            factor_contribution_update_df = json.loads(factor_contribution_update_df.to_json(orient="records", date_format="iso"))
-            status_update_df = json.loads(status_update_df.to_json(orient="records", date_format="iso"))
+            records = self.records(updates)
 
             # EXECUTE IN SUPAPBASE
-            response = self.supabase.rpc(
-                "run_daily_batch",
-                {
-                    "p_batch_id": self.batch_id,
-                    "p_batch_timestamp": self.batch_timestamp,
-                    "p_user_id": "9be41371-7b73-429d-a369-5cd3bd25269b",
-                    "p_schedule_severity": schedule_severity_update_df,
-                    "p_factor_contribution": factor_contribution_update_df,
-                    "p_status": status_update_df
-                }
-            ).execute()
+            payload = {
+                "p_batch_id": self.batch_id,
+                "p_batch_timestamp": self.batch_timestamp,
+                "p_user_id": "9be41371-7b73-429d-a369-5cd3bd25269b",
+                "p_schedule_severity": records['schedule_severity'],
+                "p_factor_contribution": records['factor_contribution'],
+                "p_status": records['status']
+            }
+            # A resumed batch may have reached the database before the failure
+            if self.stats.get('resumed') and self._already_committed():
+                print(f"  Batch {self.batch_id} was already applied, skipping run_daily_batch")
+                self.stats['already_committed'] = True
+            else:
+                response = self.supabase.rpc("run_daily_batch", payload).execute()
+
+            # WRITE DAILY ROLLUP (upsert: a resumed batch rewrites the same rows)
+            if 'rollup' in records:
+                self.stats['rollup_rows'] = len(records['rollup'])
+                rollups.write(self.supabase, records['rollup'])
+
+            # REFRESH STATE STORE with the rows just written
+            if self.state_store is not None:
+                self.state_store.apply_daily_batch(payload)
+
+    @staticmethod
+    def _targets(inputs: Dict[str, pd.DataFrame], updates: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+        """Key and current value of the open row each changed row updates"""
+        targets = {}
+        for name, (table, key, column) in UPDATE_TARGETS.items():
+            df = inputs[table]
+            if df.empty:
+                targets[name] = pd.DataFrame(columns=[key, column])
+                continue
+            targets[name] = df[df[key].isin(updates[name][key])][[key, column]].reset_index(drop=True)
+        return targets
+
+    def _drop_stale(self, updates: Dict[str, pd.DataFrame], targets: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+        """
+        Drops the checkpointed changes whose target row is no longer the one they were computed from
 
-        except Exception as e:
-            print(f"❌ Error in managing schedule severity: {str(e)}")
-            raise  # stop entire batch on failure
+        A target is stale when it was closed (e.g. by /api/new-activity), replaced
+        by a row started after the batch timestamp, or its value changed.
+        """
+        batch_started = pd.Timestamp(self.batch_timestamp.astimezone())
+        updates = dict(updates)
+        dropped = 0
+        for name, (table, key, column) in UPDATE_TARGETS.items():
+            base = {str(k): v for k, v in zip(targets[name][key], targets[name][column])}
+            keys = list(base)
+            current = {}
+            for start in range(0, len(keys), RESUME_CHECK_CHUNK):
+                rows = (self.supabase
+                    .table(table)
+                    .select(f'{key}, {column}, start_date')
+                    .in_(key, keys[start:start + RESUME_CHECK_CHUNK])
+                    .is_('end_date','null')
+                    .execute()).data
+                for row in rows or []:
+                    current[str(row[key])] = row
+
+            def fresh(k: str) -> bool:
+                row = current.get(k)
+                if row is None or k not in base:
+                    return False
+                if row.get('start_date') and pd.Timestamp(row['start_date']) > batch_started:
+                    return False
+                return row[column] == base[k]
+
+            df = updates[name]
+            keep = [fresh(k) for k in df[key].astype(str)]
+            dropped += keep.count(False)
+            updates[name] = df[keep]
+
+        self.stats['stale_dropped'] = dropped
+        if dropped:
+            print(f"  Dropped {dropped} checkpointed changes whose rows changed since the checkpoint")
+        return updates
+
+    def _already_committed(self) -> bool:
+        """True when run_daily_batch already recorded this batch_id in the batch table"""
+        batch_data = (self.supabase
+            .table('batch')
+            .select('batch_id')
+            .eq('batch_id',self.batch_id)
+            .execute())
+        return bool(batch_data.data)
+
+    def _select_open(self, table: str, columns: str, plant_ids: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Open rows (end_date IS NULL) of a table, from the state store when it is loaded
 
-            
-        # Print summary
-        print(f"\n{'='*60}")
-        print(f"DAILY BATCH COMPLETED")
-        print(f"Stats: {self.stats}")
-        print(f"{'='*60}\n")
-        
-        return self.stats
+        Args:
+            plant_ids: only the rows of these plants (read PLANT_CHUNK plants per request), or None for all
+        """
+        cols = [col.strip() for col in columns.split(',')]
+        if self.state_store is not None and self.state_store.ready:
+            if plant_ids is None:
+                return pd.DataFrame(self.state_store.select(table, cols), columns=cols)
+            return pd.DataFrame([row for plant_id in plant_ids
+                                 for row in self.state_store.by(table, 'plant_id', plant_id, cols)], columns=cols)
+        if plant_ids is None:
+            data = (self.supabase
+                .table(table)
+                .select(columns)
+                .is_('end_date','null')
+                .execute())
+            return pd.DataFrame(data.data)
+        rows = []
+        for start in range(0, len(plant_ids), PLANT_CHUNK):
+            rows += (self.supabase
+                .table(table)
+                .select(columns)
+                .in_('plant_id', plant_ids[start:start + PLANT_CHUNK])
+                .is_('end_date','null')
+                .execute()).data
+        return pd.DataFrame(rows, columns=cols)
+
+    def _fetch_timezone_plants(self) -> List[str]:
+        """Active plants whose user_timezone is the batch timezone"""
+        plant_data = (self.supabase
+            .table('plant')
+            .select('plant_id')
+            .eq('is_active',True)
+            .eq('user_timezone',self.timezone)
+            .execute())
+        return [row['plant_id'] for row in plant_data.data]
+
+    def _compact(self, schedule_df, factor_data_df, factor_contribution_data_df, status_df):
+        """Categorical UUID keys shared across frames, int8 severities and day dates"""
+        schedule_df = to_day(schedule_df, ['schedule_date'])
+        factor_data_df = to_day(factor_data_df, ['factor_date'])
+        schedule_df = to_int8(schedule_df, ['schedule_severity'])
+        factor_contribution_data_df = to_int8(factor_contribution_data_df, ['severity'])
+        status_df = to_int8(status_df, ['status_code'])
+
+        frames = [schedule_df, factor_data_df, factor_contribution_data_df, status_df]
+        for key in ['schedule_id', 'plant_factor_id', 'plant_id', 'user_id']:
+            frames = share_categories(frames, key)
+        return frames
+
+    def _partition_count(self, *frames) -> int:
+        """Number of partitions needed to keep the estimated working set within the memory budget"""
+        if DAILY_BATCH_MEMORY_BUDGET_MB <= 0:
+            return 1
+        working_set_mb = memory_mb(*frames) * WORKING_SET_FACTOR
+        n_parts = max(1, math.ceil(working_set_mb / DAILY_BATCH_MEMORY_BUDGET_MB))
+        if n_parts > 1:
+            print(f"  Working set ~{working_set_mb} MB over budget, processing in {n_parts} partitions")
+        return n_parts
+
+    def _schedule_severity_updates(self, schedule_df):
+        """Schedules whose severity changed"""
+        # CALCULATE SEVERITY
+        # Prep data for calculator
+        keep_cols = ['schedule_id', 'schedule_date']
+        schedule_calculator_data_df = schedule_df[keep_cols].copy()
+        # Send data to calculator
+        schedule_severity_new_df = schedule_severity_calculator(schedule_calculator_data_df,self.today_date,run_id=self.batch_id)
+        schedule_severity_new_df = schedule_severity_new_df.rename(columns={'schedule_severity': 'schedule_severity_new'})
+        schedule_severity_new_df = to_int8(schedule_severity_new_df, ['schedule_severity_new'])
+
+        # MERGE (on the shared categorical codes)
+        schedule_severity_calculated_df = schedule_df.merge(schedule_severity_new_df,on='schedule_id',how='left')
+
+        # FILTER FOR SEVERITY THAT CHANGED
+        schedule_severity_update_df = schedule_severity_calculated_df[
+            changed(schedule_severity_calculated_df['schedule_severity_new'], schedule_severity_calculated_df['schedule_severity'])
+        ]
+
+        # CLEAN DATA
+        keep_cols = ['schedule_id', 'schedule_severity_new', 'user_id']
+        rename_map = {'schedule_severity_new': 'schedule_severity'}
+        return schedule_severity_update_df[keep_cols].rename(columns=rename_map)
+
+    def _factor_contribution_updates(self, factor_data_df, factor_contribution_data_df):
+        """
+        Factor contributions whose severity changed
+
+        Returns:
+            (factor_contribution_update_df, factor_contribution_calculated_df) - the
+            second one holds every current contribution with its new severity, for the
+            status calculation
+        """
+        # CALCULATE FACTOR CONTRIBUTION for EACH COMPONENT
+        # Create factor contribution data
+        cols = ['plant_id','plant_factor_id','factor_code','severity']
+        factor_contribution_df = pd.DataFrame(columns=cols)
+
+        # Define the list of factors to be called
+        list_factors_calculation = {
+            "watering_due"
+        #    "fertilizing_due"
+        }
+
+        # CALCULATE FACTOR CONTRIBUTIONS (concurrently, see factor_pool)
+        tasks = {}
+        for factor in list_factors_calculation:
+            if factor in factor_contribution_registry:
+                print(f"Calculating {factor} contribution.")
+                tasks[factor] = partial(
+                    factor_contribution_registry[factor].run,
+                    plant_factor_df=factor_data_df[factor_data_df['factor_code'] == factor],
+                    today=self.today_date,
+                    run_id=self.batch_id
+                )
+            else:
+                print(f"Warning: {factor} is not a valid factor contribution.")
+                self.stats['errors'] += 1
+        factor_results = factor_pool.evaluate(tasks, self.stats)
+        # Factors that failed keep their current severity
+        failed_factors = sorted(set(tasks) - set(factor_results))
+
+        # Merge every factor's contributions (sorted factor order)
+        factor_contribution_new_df = pd.concat([factor_contribution_df, *factor_results.values()], ignore_index=True)
+
+        # Rename to new severity and clean data
+        # CLEAN DATA
+        keep_cols = ['plant_factor_id', 'severity']
+        rename_map = {'severity': 'severity_new'}
+        factor_contribution_new_df = factor_contribution_new_df[keep_cols].rename(columns=rename_map)
+        factor_contribution_new_df = to_int8(factor_contribution_new_df, ['severity_new'])
+        ## concat with the empty frame drops the categorical dtype; restore the shared categories
+        factor_contribution_new_df['plant_factor_id'] = pd.Categorical(
+            factor_contribution_new_df['plant_factor_id'],
+            categories=factor_contribution_data_df['plant_factor_id'].cat.categories
+        )
+
+        # MERGE
+        factor_contribution_calculated_df = factor_contribution_data_df.merge(factor_contribution_new_df,on='plant_factor_id',how='left')
+        if failed_factors:
+            failed = factor_contribution_calculated_df['factor_code'].isin(failed_factors)
+            factor_contribution_calculated_df.loc[failed, 'severity_new'] = factor_contribution_calculated_df.loc[failed, 'severity']
+        # FILTER FOR CONTRIBUTIONS THAT CHANGED
+        factor_contribution_update_df = factor_contribution_calculated_df[
+            changed(factor_contribution_calculated_df['severity_new'], factor_contribution_calculated_df['severity'])
+        ]
+
+        # CLEAN DATA
+        keep_cols = ['plant_factor_id', 'severity_new']
+        rename_map = {'severity_new': 'severity'}
+        factor_contribution_update_df = factor_contribution_update_df[keep_cols].rename(columns=rename_map)
+
+        # PREP DATA FOR STATUS CALCULATION
+        keep_cols = ['plant_id', 'factor_code', 'severity_new']
+        rename_map = {'severity_new': 'severity'}
+        factor_contribution_calculated_df = factor_contribution_calculated_df[keep_cols].rename(columns=rename_map)
+        factor_contribution_calculated_df['severity'] = factor_contribution_calculated_df['severity'].astype('float64')
+
+        return factor_contribution_update_df, factor_contribution_calculated_df
+
+    def _status_updates(self, factor_contribution_calculated_df, status_df, factor_lookup_df):
+        """Plants whose status changed"""
+        keep_cols = ['plant_id', 'status_code', 'user_id']
+        if factor_contribution_calculated_df.empty:
+            return status_df.iloc[0:0][keep_cols]
+
+        # CALCULATE STATUS
+        status_new_df = status_calculator(
+            factor_contribution_calculated_df,
+            run_id=self.batch_id,
+            supabase=self.supabase,
+            factor_lookup_df=factor_lookup_df
+        )
+        status_new_df = status_new_df.rename(columns={'status_code': 'status_code_new'})
+        status_new_df = to_int8(status_new_df, ['status_code_new'])
+
+        # MERGE
+        status_calculated_df = status_df.merge(status_new_df,on='plant_id',how='left')
+
+        # FILTER FOR STATUSES THAT CHANGED
+        status_update_df = status_calculated_df[
+            changed(status_calculated_df['status_code_new'], status_calculated_df['status_code'])
+        ]
+
+        # CLEAN DATA
+        keep_cols = ['plant_id', 'status_code_new', 'user_id']
+        rename_map = {'status_code_new': 'status_code'}
+        return status_update_df[keep_cols].rename(columns=rename_map)
 
 def run_routine(self, name: str, routine_fn):
         """Wrapper to run a routine safely"""
@@ -11,11 +11,15 @@ from zoneinfo import ZoneInfo
 import uuid
 import pandas as pd
 import json
+from functools import partial
 from utils.supabase_client import get_client
 from scripts.factors import registry as factor_registry
 from scripts.factors_contribution import registry as factor_contribution_registry
 import scripts.manager_plant_status as manager_plant_status
 from scripts.manager_schedule import create_schedule
+import scripts.scalar_path as scalar_path
+import scripts.factor_pool as factor_pool
+from scripts.prefetch import Prefetch
 
 
 # Add parent directory to path for imports
@@ -24,14 +28,21 @@ parent_dir = os.path.dirname(current_dir)
 sys.path.insert(0, parent_dir)
 sys.path.insert(0, current_dir)
 
+# Factors recalculated when an activity of a type is logged
+ACTIVITY_FACTORS = {
+    "watering": ["watering_due"],
+    "fertilizing": ["fertilizing_due"]
+}
 
 
 class NewActivity:
     """Main orchestrator for new activity flow"""
     
-    def __init__(self):
+    def __init__(self, state_store=None):
 
         self.supabase = get_client()
+        # Open contributions are read from the in-process state store when it is loaded
+        self.state_store = state_store
         self.batch_id = str(uuid.uuid4())
         self.batch_timestamp = datetime.now()
         current_dt = datetime.now(ZoneInfo("America/New_York")).date()
@@ -47,6 +58,9 @@ class NewActivity:
     def run(self, activityData):
         """
         Main entry point
+        Small inputs (one plant, a handful of history rows) are calculated on the
+        scalar fast path (scripts/scalar_path.py); larger ones on the pandas path.
+        Both give the same results.
         Returns:
             Dict with counts: {'processed': X, 'updated': Y, 'errors': Z}
         """
@@ -60,8 +74,7 @@ class NewActivity:
         print(f"{'='*60}\n")
         
         # Create new activity data
-        
-        new_activity_df = pd.DataFrame([{
+        new_activity = {
             "plant_id": activityData.plant_id,
             "activity_type_code": activityData.activity_type_code,
             "activity_date": activityData.activity_date,
@@ -69,181 +82,63 @@ class NewActivity:
             "unit": activityData.unit,
             "notes": activityData.notes,
             "result": activityData.result
-        }])
+        }
         
         user_id = activityData.user_id
 
-        # Create factor data
-        cols = ['plant_id','factor_code','factor_date','factor_float','confidence_score']
-        plant_factor_df = pd.DataFrame(columns=cols)
-
-        # Create factor contribution data
-        cols = ['plant_id','plant_factor_id','factor_code','severity']
-        plant_factor_contribution_df = pd.DataFrame(columns=cols)
-
         # Get variables
         plant_id = activityData.plant_id
         activity_type_code = activityData.activity_type_code
         
         try:
-            # GET PLANT DETAIL
-            plant_data = (self.supabase
-                .table('plant')
-                .select('plant_id, plant_type_id, habitat_id, acquisition_date, user_timezone')
-                .eq('plant_id',plant_id)
-                .eq('is_active',True)
-                .execute())
-            plant_data_df = pd.DataFrame(plant_data.data)
-            plant_data_df['acquisition_date'] = pd.to_datetime(plant_data_df['acquisition_date'])
-
-            # GET PLANT TYPE
-            plant_type = (self.supabase
-                .table('plant_type_lookup')
-                .select('plant_type_id, watering_interval_days')
-                .eq('is_active',True)
-                .execute())
-            plant_type_df = pd.DataFrame(plant_type.data)
-            plant_type_df['watering_interval_days'] = pd.to_numeric(plant_type_df['watering_interval_days'])
-
-            # MERGE PLANT TYPE DATA INTO PLANT DETAIL
-            plant_data_df = plant_data_df.merge(plant_type_df, on='plant_type_id', how='left')
-
-            # GET ACTIVITY
-            activity_data_df = (self.supabase
-                .table('plant_activity_history')
-                .select('plant_id, activity_date, quantifier')
-                .eq('plant_id',plant_id)
-                .eq('activity_type_code',activity_type_code)
-                .order('plant_id', desc=False)
-                .order('activity_date', desc=False)
-                .execute())
+            # PREFETCH (independent reads run concurrently, see prefetch.py)
+            reads = self._prefetch(plant_id, activity_type_code).run(self.stats)
             
-            ## Add new activity
-            if activity_data_df.data:
-                activity_data_df = pd.DataFrame(activity_data_df.data)    
-            else:
-                activity_data_df = pd.DataFrame(columns=['plant_id', 'activity_date', 'quantifier'])
-            
-            activity_data_df = pd.concat([new_activity_df, activity_data_df], join='inner', ignore_index=True)
-            activity_data_df['activity_date'] = pd.to_datetime(activity_data_df['activity_date'])
-
-            # GET ALL CURRENT FACTOR CONTRIBUTIONS (for status calculations)
-            factor_contribution_data = (self.supabase
-                .table('plant_factor_contribution')
-                .select('plant_id, factor_code, severity')
-                .is_('end_date','null')
-                .execute())
-            factor_contribution_data_df = pd.DataFrame(factor_contribution_data.data)
-            factor_contribution_data_df['severity'] = pd.to_numeric(factor_contribution_data_df['severity'], errors='coerce')
-            
-            # Define the list of factors to be called
-            list_factors_calculation = {
-                "watering": ["watering_due"],
-                "fertilizing": ["fertilizing_due"]
-            }
-
-             # Get the factors for this specific activity type
-            factors_to_calculate = list_factors_calculation.get(activity_type_code, [])
+            # Get the factors for this specific activity type
+            factors_to_calculate = ACTIVITY_FACTORS.get(activity_type_code, [])
             
             if not factors_to_calculate:
                 print(f"Warning: No factors defined for activity type '{activity_type_code}'")
                 self.stats['errors'] += 1
                 return self.stats
-            
-            # CALCULATE FACTOR and CONTRIBUTION for EACH COMPONENT
-            for factor in factors_to_calculate:
-                try:
-                    # CALCULATE FACTOR
-                    if factor in factor_registry:
-                        print(f"Calculating {factor}.")
-                        plant_single_factor_df = factor_registry[factor].run(
-                            plant_data_df,
-                            activity_data_df,
-                            run_id=self.batch_id
-                        )
-                        plant_factor_df = pd.concat([plant_factor_df,plant_single_factor_df], ignore_index=True)
-                        self.stats['completed'] += 1
-                        
-                    else:
-                        print(f"Warning: {factor} is not a valid factor.")
-                        self.stats['errors'] += 1
-
-                    # CALCULATE FACTOR CONTRIBUTION
-                    if factor in factor_contribution_registry:
-                        print(f"Calculating {factor} contribution.")
-                        plant_single_factor_contribution_df = factor_contribution_registry[factor].run(
-                            plant_factor_df,
-                            today = self.today_date,
-                            run_id=self.batch_id
-                        )
-                        plant_factor_contribution_df = pd.concat([plant_factor_contribution_df,plant_single_factor_contribution_df], ignore_index=True)
-
-                        # ADJUST TABLE OF FACTORS CONTRIBUTIONS
-                        ## Remove previous factor contribution
-                        factor_contribution_data_df = factor_contribution_data_df[factor_contribution_data_df['factor_code'] != factor]
-                        ## Add new factor contribution
-                        factor_contribution_df = pd.concat([factor_contribution_data_df,plant_factor_contribution_df], ignore_index=True)
-
-                        self.stats['completed'] += 1
-                    else:
-                        print(f"Warning: {factor} is not a valid factor contribution.")
-                        self.stats['errors'] += 1
-
-                except Exception as e:
-                    print(f"❌ Error in factor calculation: {str(e)}")
-                    raise  # stop entire batch on failure
-
-
-            # CALCULATE STATUS
-            try:
-                print(f"Calculating statuses.")
-                plant_status_df = manager_plant_status.run(
-                    factor_contribution_df,
-                    run_id=self.batch_id,
-                    supabase=self.supabase
-                )
-                self.stats['completed'] += 1
-            except Exception as e:
-                print(f"❌ Error in factor contribution calculation: {str(e)}")
-                raise  # stop entire batch on failure
-
-            # PREPARE SCHEDULE ITEMS
-            try:
-                print(f"Managing schedule.")
-                schedule_df = create_schedule(
-                    plant_factor_df,
-                    today_date=self.batch_timestamp,
-                    run_id=self.batch_id,
-                    supabase = self.supabase
-                )
-                self.stats['completed'] += 1
-            except Exception as e:
-                print(f"❌ Error in managing schedule: {str(e)}")
-                raise  # stop entire batch on failure
 
+            # CALCULATE FACTORS, CONTRIBUTIONS, STATUS AND SCHEDULE
+            if scalar_path.accepts(new_activity, reads, factors_to_calculate):
+                print(f"Calculating on the scalar fast path.")
+                calculator = scalar_path.calculate
+                self.stats['path'] = 'scalar'
+            else:
+                calculator = calculate
+                self.stats['path'] = 'vectorized'
+            results = calculator(
+                new_activity,
+                reads,
+                factors_to_calculate,
+                today_date=self.today_date,
+                batch_timestamp=self.batch_timestamp,
+                run_id=self.batch_id,
+                stats=self.stats
+            )
 
             # PREPARE DATA TO UPLOAD
             self.batch_timestamp = self.batch_timestamp.isoformat()
-            new_activity_df = json.loads(new_activity_df.to_json(orient="records", date_format="iso")) 
-            plant_factor_df = json.loads(plant_factor_df.to_json(orient="records", date_format="iso"))
-            plant_factor_contribution_df = json.loads(plant_factor_contribution_df.to_json(orient="records", date_format="iso"))
-            plant_status_df = json.loads(plant_status_df.to_json(orient="records", date_format="iso"))
-            schedule_df = json.loads(schedule_df.to_json(orient="records", date_format="iso"))
 
             # EXECUTE IN SUPAPBASE
-            response = self.supabase.rpc(
-                "run_new_activity",
-                {
-                    "p_batch_id": self.batch_id,
-                    "p_batch_timestamp": self.batch_timestamp,
-                    "p_user_id": user_id,
-                    "p_new_activity": new_activity_df,
-                    "p_plant_factor": plant_factor_df,
-                    "p_plant_factor_contribution": plant_factor_contribution_df,
-                    "p_plant_status": plant_status_df,
-                    "p_schedule": schedule_df
-                }
-            ).execute()
+            payload = {
+                "p_batch_id": self.batch_id,
+                "p_batch_timestamp": self.batch_timestamp,
+                "p_user_id": user_id,
+                "p_new_activity": [new_activity],
+                "p_plant_factor": results["plant_factor"],
+                "p_plant_factor_contribution": results["plant_factor_contribution"],
+                "p_plant_status": results["plant_status"],
+                "p_schedule": results["schedule"]
+            }
+            response = self.supabase.rpc("run_new_activity", payload).execute()
+
+            # REFRESH STATE STORE with the rows just written
+            if self.state_store is not None:
+                self.state_store.apply_new_activity(payload)
                     
         except Exception as e:
             print(f"\n❌ Fatal error in new activity: {str(e)}")
@@ -258,6 +153,220 @@ class NewActivity:
         return self.stats
 
 
+    def _prefetch(self, plant_id: str, activity_type_code: str) -> Prefetch:
+        """
+        Reads of a new activity
+
+        Only plant_type waits for another read (it needs the plant's type);
+        the others start right away.
+        """
+        prefetch = Prefetch()
+
+        # GET PLANT DETAIL
+        prefetch.add('plant', lambda: (self.supabase
+            .table('plant')
+            .select('plant_id, plant_type_id, habitat_id, acquisition_date, user_timezone')
+            .eq('plant_id',plant_id)
+            .eq('is_active',True)
+            .execute()).data)
+
+        # GET PLANT TYPE (of the plant)
+        def plant_type(plant):
+            plant_type_ids = sorted({row['plant_type_id'] for row in plant if row.get('plant_type_id')})
+            if not plant_type_ids:
+                return []
+            return (self.supabase
+                .table('plant_type_lookup')
+                .select('plant_type_id, watering_interval_days')
+                .in_('plant_type_id',plant_type_ids)
+                .eq('is_active',True)
+                .execute()).data
+        prefetch.add('plant_type', plant_type, after=['plant'])
+
+        # GET ACTIVITY
+        prefetch.add('activity', lambda: (self.supabase
+            .table('plant_activity_history')
+            .select('plant_id, activity_date, quantifier')
+            .eq('plant_id',plant_id)
+            .eq('activity_type_code',activity_type_code)
+            .order('plant_id', desc=False)
+            .order('activity_date', desc=False)
+            .execute()).data or [])
+
+        # GET ALL CURRENT FACTOR CONTRIBUTIONS (for status calculations)
+        if self.state_store is not None and self.state_store.ready:
+            prefetch.add('factor_contribution', lambda: self.state_store.select(
+                'plant_factor_contribution', ['plant_id', 'factor_code', 'severity']
+            ))
+        else:
+            prefetch.add('factor_contribution', lambda: (self.supabase
+                .table('plant_factor_contribution')
+                .select('plant_id, factor_code, severity')
+                .is_('end_date','null')
+                .execute()).data)
+
+        # GET FACTOR LOOKUP (weights for status, categories for schedule)
+        prefetch.add('factor_lookup', lambda: (self.supabase
+            .table('factor_lookup')
+            .select('factor_code, weight, factor_category')
+            .eq('is_active',True)
+            .execute()).data)
+
+        return prefetch
+
+
+def calculate(new_activity, reads, factors_to_calculate, today_date, batch_timestamp, run_id, stats):
+    """
+    Vectorized (pandas) calculation of the new activity
+
+    Args:
+        new_activity: dict of the activity being logged (None: recalculate from the history
+            alone, e.g. after a bulk import)
+        reads: dict of the rows read from supabase
+            - plant, plant_type, activity, factor_contribution, factor_lookup
+        factors_to_calculate: list of factor codes
+        today_date: pd.Timestamp, date used for the factor contributions
+        batch_timestamp: datetime, date used for the schedule severity
+    Returns:
+        Dict of records ready for the RPC:
+            plant_factor, plant_factor_contribution, plant_status, schedule
+    """
+    # Create factor data
+    cols = ['plant_id','factor_code','factor_date','factor_float','confidence_score']
+    plant_factor_df = pd.DataFrame(columns=cols)
+
+    # Create factor contribution data
+    cols = ['plant_id','plant_factor_id','factor_code','severity']
+    plant_factor_contribution_df = pd.DataFrame(columns=cols)
+
+    # PLANT DETAIL
+    plant_data_df = pd.DataFrame(reads['plant'])
+    plant_data_df['acquisition_date'] = pd.to_datetime(plant_data_df['acquisition_date'])
+
+    # PLANT TYPE
+    plant_type_df = pd.DataFrame(reads['plant_type'])
+    plant_type_df['watering_interval_days'] = pd.to_numeric(plant_type_df['watering_interval_days'])
+
+    # MERGE PLANT TYPE DATA INTO PLANT DETAIL
+    plant_data_df = plant_data_df.merge(plant_type_df, on='plant_type_id', how='left')
+
+    # ACTIVITY
+    if reads['activity']:
+        activity_data_df = pd.DataFrame(reads['activity'])
+    else:
+        activity_data_df = pd.DataFrame(columns=['plant_id', 'activity_date', 'quantifier'])
+
+    ## Add new activity
+    if new_activity is not None:
+        activity_data_df = pd.concat([pd.DataFrame([new_activity]), activity_data_df], join='inner', ignore_index=True)
+    activity_data_df['activity_date'] = pd.to_datetime(activity_data_df['activity_date'])
+
+    # CURRENT FACTOR CONTRIBUTIONS
+    factor_contribution_data_df = pd.DataFrame(reads['factor_contribution'], columns=['plant_id', 'factor_code', 'severity'])
+    factor_contribution_data_df['severity'] = pd.to_numeric(factor_contribution_data_df['severity'], errors='coerce')
+
+    # FACTOR LOOKUP
+    factor_lookup_df = pd.DataFrame(reads['factor_lookup'])
+
+    # CALCULATE FACTOR and CONTRIBUTION for EACH COMPONENT (concurrently, see factor_pool)
+    tasks = {}
+    for factor in factors_to_calculate:
+        if factor not in factor_registry:
+            print(f"Warning: {factor} is not a valid factor.")
+            stats['errors'] += 1
+            continue
+        if factor not in factor_contribution_registry:
+            print(f"Warning: {factor} is not a valid factor contribution.")
+            stats['errors'] += 1
+        tasks[factor] = partial(evaluate_factor, factor, plant_data_df, activity_data_df, today_date, run_id)
+    factor_results = factor_pool.evaluate(tasks, stats)
+    if not factor_results:
+        raise RuntimeError("No factor could be calculated")
+
+    # MERGE RESULTS (sorted factor order)
+    plant_factor_df = pd.concat([plant_factor_df] + [
+        plant_single_factor_df for plant_single_factor_df, _ in factor_results.values()
+    ], ignore_index=True)
+    calculated_contributions = {
+        factor: plant_single_factor_contribution_df
+        for factor, (_, plant_single_factor_contribution_df) in factor_results.items()
+        if plant_single_factor_contribution_df is not None
+    }
+    stats['completed'] += len(calculated_contributions)
+    plant_factor_contribution_df = pd.concat(
+        [plant_factor_contribution_df] + list(calculated_contributions.values()), ignore_index=True
+    )
+
+    # ADJUST TABLE OF FACTORS CONTRIBUTIONS
+    ## Remove previous factor contribution
+    factor_contribution_data_df = factor_contribution_data_df[
+        ~factor_contribution_data_df['factor_code'].isin(list(calculated_contributions))
+    ]
+    ## Add new factor contribution
+    factor_contribution_df = pd.concat([factor_contribution_data_df,plant_factor_contribution_df], ignore_index=True)
+
+    # CALCULATE STATUS
+    try:
+        print(f"Calculating statuses.")
+        plant_status_df = manager_plant_status.run(
+            factor_contribution_df,
+            run_id=run_id,
+            supabase=None,
+            factor_lookup_df=factor_lookup_df
+        )
+        stats['completed'] += 1
+    except Exception as e:
+        print(f"❌ Error in factor contribution calculation: {str(e)}")
+        raise  # stop entire batch on failure
+
+    # PREPARE SCHEDULE ITEMS
+    try:
+        print(f"Managing schedule.")
+        schedule_df = create_schedule(
+            plant_factor_df,
+            today_date=batch_timestamp,
+            run_id=run_id,
+            supabase=None,
+            factor_lookup_df=factor_lookup_df
+        )
+        stats['completed'] += 1
+    except Exception as e:
+        print(f"❌ Error in managing schedule: {str(e)}")
+        raise  # stop entire batch on failure
+
+    # PREPARE DATA TO UPLOAD
+    return {
+        "plant_factor": json.loads(plant_factor_df.to_json(orient="records", date_format="iso")),
+        "plant_factor_contribution": json.loads(plant_factor_contribution_df.to_json(orient="records", date_format="iso")),
+        "plant_status": json.loads(plant_status_df.to_json(orient="records", date_format="iso")),
+        "schedule": json.loads(schedule_df.to_json(orient="records", date_format="iso"))
+    }
+
+
+
+def evaluate_factor(factor, plant_data_df, activity_data_df, today_date, run_id):
+    """
+    Factor and factor contribution of one factor (one factor_pool task)
+
+    Returns:
+        (plant_factor_df, plant_factor_contribution_df or None)
+    """
+    print(f"Calculating {factor}.")
+    plant_single_factor_df = factor_registry[factor].run(
+        plant_data_df,
+        activity_data_df,
+        run_id=run_id
+    )
+    plant_single_factor_contribution_df = None
+    if factor in factor_contribution_registry:
+        print(f"Calculating {factor} contribution.")
+        plant_single_factor_contribution_df = factor_contribution_registry[factor].run(
+            plant_single_factor_df,
+            today = today_date,
+            run_id=run_id
+        )
+    return plant_single_factor_df, plant_single_factor_contribution_df
+
 
 def run_routine(self, name: str, routine_fn):
         """Wrapper to run a routine safely"""
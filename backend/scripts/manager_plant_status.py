@@ -6,9 +6,43 @@ Version 1.0.0
 """
 import pandas as pd
 import numpy as np
-import uuid
+from utils.ids import new_ids
 
-def run(factor_contribution_df, run_id, supabase):
+def weighted_average(df, values, weights, by='plant_id'):
+    """
+    Weighted average of `values` per `by` group, vectorized (no groupby.apply)
+
+    NaN values and weights are skipped like sum() does; a group whose weights
+    sum to 0 averages to 0. The sums are bit for bit those of a per-group
+    Series.sum(), so statuses on a .5 boundary round the same way: groups of
+    the same size are stacked into one matrix and summed along its rows, which
+    numpy does with the same kernel as a 1-d sum.
+    """
+    ## observed=True: a categorical key must not create rows for groups without data
+    grouped = df.groupby(by, observed=True)
+    index = grouped.size().index
+    group = grouped.ngroup().to_numpy()
+    keep = np.flatnonzero(group >= 0)
+    keep = keep[np.argsort(group[keep], kind='stable')]
+
+    weighted = df[values].astype('float64').to_numpy()[keep] * df[weights].astype('float64').to_numpy()[keep]
+    weight = df[weights].astype('float64').to_numpy()[keep]
+    weighted = np.where(np.isnan(weighted), 0, weighted)
+    weight = np.where(np.isnan(weight), 0, weight)
+
+    starts = np.flatnonzero(np.r_[True, np.diff(group[keep]) != 0]) if len(keep) else np.zeros(0, dtype=int)
+    sizes = np.diff(np.r_[starts, len(keep)])
+    weighted_sum = np.zeros(len(starts))
+    weight_sum = np.zeros(len(starts))
+    for size in np.unique(sizes):
+        groups = np.flatnonzero(sizes == size)
+        rows = starts[groups][:, None] + np.arange(size)
+        weighted_sum[groups] = weighted[rows].sum(axis=1)
+        weight_sum[groups] = weight[rows].sum(axis=1)
+    average = np.divide(weighted_sum, weight_sum, out=np.zeros_like(weighted_sum), where=weight_sum != 0)
+    return pd.Series(average, index=index)
+
+def run(factor_contribution_df, run_id, supabase, factor_lookup_df=None):
     print(f"\nManaging watering due factor for run {run_id}...\n")
 
     """
@@ -24,6 +58,8 @@ def run(factor_contribution_df, run_id, supabase):
         status_factor_contribution_map_df
             - factor_code: str
             - weight: float (the sum of the weights in the table is 1)
+        factor_lookup_df (optional)
+            - factor_code, weight of the active factors; read from supabase when not given
     Returns:
         plant_status_df
             - plant_status_id: str        
@@ -32,29 +68,22 @@ def run(factor_contribution_df, run_id, supabase):
     """
 
     # Step 01: get current factor contribution weight (for status calculations)
-    factor_lookup_data = (supabase
-        .table('factor_lookup')
-        .select('factor_code, weight')
-        .eq('is_active',True)
-        .execute())
-    status_factor_contribution_map_df = pd.DataFrame(factor_lookup_data.data)
+    if factor_lookup_df is None:
+        factor_lookup_data = (supabase
+            .table('factor_lookup')
+            .select('factor_code, weight')
+            .eq('is_active',True)
+            .execute())
+        factor_lookup_df = pd.DataFrame(factor_lookup_data.data)
+    status_factor_contribution_map_df = factor_lookup_df[['factor_code', 'weight']].copy()
     status_factor_contribution_map_df['weight'] = pd.to_numeric(status_factor_contribution_map_df['weight'], errors='coerce')
 
     # Step 02: join tables and calculate the weighted average
     plant_status_df = factor_contribution_df.merge(status_factor_contribution_map_df, on='factor_code', how='left')
     print(f"  ✅ Step 02")
     
-    # Step 03: Custom function to handle weights per group
-    def w_avg(group, values, weights):
-        d = group[values]
-        w = group[weights]
-        if w.sum() == 0:
-            return 0
-        return (d * w).sum() / w.sum()
-    print(f"  ✅ Step 03")
-
-    # Step 04: calculates weighted averages
-    weighted_series = plant_status_df.groupby('plant_id').apply(w_avg, 'severity', 'weight')
+    # Step 03/04: weighted average per plant
+    weighted_series = weighted_average(plant_status_df, 'severity', 'weight')
     print(f"  ✅ Step 04")
 
     # Step 05: Convert Series to DataFrame and name the column
@@ -67,7 +96,7 @@ def run(factor_contribution_df, run_id, supabase):
     print(f"  ✅ Step 06")
 
     ## Step 07: Add status id
-    plant_status_df['plant_status_id'] = [str(uuid.uuid4()) for _ in range(len(plant_status_df))]
+    plant_status_df['plant_status_id'] = new_ids(len(plant_status_df))
     print(f"  ✅ Step 07")
     
     return plant_status_df
@@ -0,0 +1,106 @@
+"""
+MANAGER_ROLLING.PY - Timezone-bucketed rolling daily batch
+Instead of one fleet-wide batch pinned to America/New_York, queues one small
+daily batch per plant timezone, shortly after that zone's local midnight and
+evaluated with that zone's date.
+
+Each run is a `daily_batch` job with payload {run_date, timezone} and dedupe
+key "<timezone>:<run_date>", so ticking more often than needed (cron every
+15 minutes, the in-process ticker, ...) never queues a zone twice per day.
+
+Settings:
+    DAILY_BATCH_MODE                full (one batch) | rolling (per timezone)
+    ROLLING_BATCH_DELAY_MINUTES     minutes after local midnight before a zone runs
+    ROLLING_BATCH_TICK_SECONDS      in-process ticker period (0 = rely on /cron/daily)
+"""
+import os
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+DAILY_BATCH_MODE = os.getenv("DAILY_BATCH_MODE", "full")
+ROLLING_BATCH_DELAY_MINUTES = int(os.getenv("ROLLING_BATCH_DELAY_MINUTES", 15))
+ROLLING_BATCH_TICK_SECONDS = int(os.getenv("ROLLING_BATCH_TICK_SECONDS", 0))
+
+
+def due_timezones(timezones: List[str], now_utc: datetime,
+                  delay_minutes: int = ROLLING_BATCH_DELAY_MINUTES) -> List[Tuple[str, str]]:
+    """
+    Timezones whose local day has started (past midnight + delay)
+
+    Returns:
+        List of (timezone, local run date 'YYYY-MM-DD')
+    """
+    due = []
+    for tz_name in sorted(set(timezones)):
+        try:
+            local_now = now_utc.astimezone(ZoneInfo(tz_name))
+        except (ZoneInfoNotFoundError, ValueError):
+            print(f"Warning: {tz_name} is not a valid timezone.")
+            continue
+        local_midnight = local_now.replace(hour=0, minute=0, second=0, microsecond=0)
+        if local_now >= local_midnight + timedelta(minutes=delay_minutes):
+            due.append((tz_name, local_now.date().isoformat()))
+    return due
+
+
+class RollingScheduler:
+    """Queues the per-timezone daily batches that are due"""
+
+    def __init__(self, job_queue, supabase_factory):
+        self.job_queue = job_queue
+        # Called lazily so the API can start without database access
+        self.supabase_factory = supabase_factory
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _fetch_timezones(self) -> List[str]:
+        """Distinct timezones of the active plants"""
+        plant_data = (self.supabase_factory()
+            .table('plant')
+            .select('user_timezone')
+            .eq('is_active',True)
+            .execute())
+        return sorted({row['user_timezone'] for row in plant_data.data if row.get('user_timezone')})
+
+    def enqueue_due(self, now_utc: Optional[datetime] = None) -> List[Dict]:
+        """
+        Queues a daily batch for every timezone whose local day has started
+
+        Returns:
+            List of {timezone, run_date, job_id, created}
+        """
+        now_utc = now_utc or datetime.now(dt_timezone.utc)
+        queued = []
+        for tz_name, run_date in due_timezones(self._fetch_timezones(), now_utc):
+            job = self.job_queue.enqueue(
+                "daily_batch",
+                payload={"run_date": run_date, "timezone": tz_name},
+                dedupe_key=f"{tz_name}:{run_date}"
+            )
+            queued.append({"timezone": tz_name, "run_date": run_date, "job_id": job["job_id"], "created": job["created"]})
+            if job["created"]:
+                print(f"  Queued daily batch for {tz_name} ({run_date})")
+        return queued
+
+    def start(self, tick_seconds: int = ROLLING_BATCH_TICK_SECONDS):
+        """Ticks in a daemon thread (no-op when tick_seconds is 0)"""
+        if tick_seconds <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+
+        def tick():
+            while not self._stop.is_set():
+                try:
+                    self.enqueue_due()
+                except Exception as e:
+                    print(f"❌ Error in rolling batch scheduler: {str(e)}")
+                self._stop.wait(tick_seconds)
+
+        self._thread = threading.Thread(target=tick, name="rolling-batch", daemon=True)
+        self._thread.start()
+        print(f"✓ Rolling batch scheduler started (every {tick_seconds}s)")
+
+    def stop(self):
+        self._stop.set()
@@ -6,10 +6,10 @@ Version 1.0.0
 """
 import pandas as pd
 import numpy as np
-import uuid
+from utils.ids import new_ids
 from scripts.schedule.severity import run as schedule_severity_calculator
 
-def create_schedule(plant_factor_df, today_date, run_id, supabase):
+def create_schedule(plant_factor_df, today_date, run_id, supabase, factor_lookup_df=None):
     print(f"\nManaging schedule for run {run_id}...\n")
 
     """
@@ -24,7 +24,7 @@ def create_schedule(plant_factor_df, today_date, run_id, supabase):
             - factor_code: str
             - factor_date: date
             - confidence_score: float (0.0-1.0)
-        factor_lookup_df
+        factor_lookup_df (optional, read from supabase when not given)
             - factor_code
             - factor_category            
     Returns:
@@ -40,19 +40,21 @@ def create_schedule(plant_factor_df, today_date, run_id, supabase):
 
     # Step 01: get current factor category
     # GET CURRENT FACTOR CONTRIBUTION WEIGHT (for status calculations)
-    factor_lookup_data = (supabase
-        .table('factor_lookup')
-        .select('factor_code, factor_category')
-        .eq('is_active',True)
-        .execute())
-    factor_lookup_df = pd.DataFrame(factor_lookup_data.data)
+    if factor_lookup_df is None:
+        factor_lookup_data = (supabase
+            .table('factor_lookup')
+            .select('factor_code, factor_category')
+            .eq('is_active',True)
+            .execute())
+        factor_lookup_df = pd.DataFrame(factor_lookup_data.data)
+    factor_lookup_df = factor_lookup_df[['factor_code', 'factor_category']]
     print(f"  ✅ Step 01")
     
     # Step 02: join tables
     schedule_df = plant_factor_df.merge(factor_lookup_df, on='factor_code', how='left')
     print(f"  ✅ Step 02")
     ## Create factor id
-    schedule_df['schedule_id'] = [str(uuid.uuid4()) for _ in range(len(schedule_df))]
+    schedule_df['schedule_id'] = new_ids(len(schedule_df))
     # Step 03: rename columns
     rename_map = {
         'factor_category': 'schedule_label',
@@ -0,0 +1,117 @@
+"""
+PREFETCH.PY - Concurrent, dependency-aware read stage
+An orchestrator declares the reads it needs up front; the prefetch runs every
+read whose dependencies are done concurrently, instead of one round trip after
+another, and hands the results to the calculators.
+
+- A read can depend on other reads (it gets their results)
+- Reads declared twice with the same key run once
+- stats['reads'] gets the duration of every read, stats['prefetch_seconds']
+  the wall time of the whole stage
+
+Settings:
+    PREFETCH_WORKERS    concurrent reads (shared by every request)
+"""
+import os
+import time
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional
+
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", 8))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+        return _executor
+
+
+class Prefetch:
+    """Declared reads of one run"""
+
+    def __init__(self):
+        # { name: {'fn', 'after', 'key'} }
+        self._reads: Dict[str, Dict] = {}
+
+    def add(self, name: str, fn: Callable[..., Any], after: Optional[List[str]] = None, key: Optional[str] = None):
+        """
+        Declares a read
+
+        Args:
+            name: name of the result
+            fn: does the read; called with the results of `after` as keyword arguments
+            after: names of the reads this one needs
+            key: identity of the read (e.g. "table?filters"); reads with the same key run once
+        """
+        self._reads[name] = {'fn': fn, 'after': list(after or []), 'key': key or name}
+        return self
+
+    def run(self, stats: Optional[Dict] = None) -> Dict[str, Any]:
+        """
+        Runs the declared reads
+
+        Returns:
+            { name: result } in declaration order
+        Raises:
+            The first error of a read (reads that were not started are skipped)
+        """
+        for name, read in self._reads.items():
+            missing = [dep for dep in read['after'] if dep not in self._reads]
+            if missing:
+                raise ValueError(f"Read '{name}' depends on undeclared reads {missing}")
+
+        executor = _get_executor()
+        started = time.perf_counter()
+        timings: Dict[str, float] = {}
+        results: Dict[str, Any] = {}
+        by_key: Dict[str, Future] = {}
+        running: Dict[Future, List[str]] = {}
+        pending = dict(self._reads)
+
+        def timed(name, fn, kwargs):
+            read_started = time.perf_counter()
+            try:
+                return fn(**kwargs)
+            finally:
+                timings[name] = round(time.perf_counter() - read_started, 4)
+
+        try:
+            while pending or running:
+                # Start every read whose dependencies are done
+                for name, read in list(pending.items()):
+                    if any(dep not in results for dep in read['after']):
+                        continue
+                    del pending[name]
+                    future = by_key.get(read['key'])
+                    if future is None:
+                        kwargs = {dep: results[dep] for dep in read['after']}
+                        future = executor.submit(timed, name, read['fn'], kwargs)
+                        by_key[read['key']] = future
+                        running[future] = []
+                    if future.done():
+                        results[name] = future.result()
+                    else:
+                        running[future].append(name)
+
+                if not running:
+                    if pending:
+                        raise ValueError(f"Circular read dependencies: {sorted(pending)}")
+                    break
+
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    for name in running.pop(future):
+                        results[name] = future.result()
+        finally:
+            if stats is not None:
+                stats['reads'] = timings
+                stats['reads_deduped'] = len(self._reads) - len(by_key)
+                stats['prefetch_seconds'] = round(time.perf_counter() - started, 4)
+
+        return {name: results[name] for name in self._reads}
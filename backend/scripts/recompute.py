@@ -0,0 +1,171 @@
+"""
+RECOMPUTE.PY - Recalculation of plants outside a new activity
+Recalculates many plants at once and writes them the way a new activity does
+(run_new_activity, without a new activity row), so their open factor,
+contribution, status and schedule rows are replaced as usual:
+
+- factors():    factors of an activity type from the plants' full history,
+                with the vectorized new activity calculate()
+- statuses():   status only, from the open contributions (e.g. after a
+                factor_lookup weight change); only changed statuses are written
+
+Rows are written with one run_new_activity call per user (p_user_id is stamped
+on the status and schedule rows), and applied to the state store when given.
+Callers batch the plants (activity_import.py, dependencies.py).
+"""
+import json
+from datetime import datetime
+from typing import Dict, List, Optional
+import pandas as pd
+from scripts.manager_new_activity import ACTIVITY_FACTORS, calculate
+from scripts.manager_plant_status import run as status_calculator
+from scripts.reports import pages
+
+PLANT_COLUMNS = ['plant_id', 'plant_type_id', 'habitat_id', 'acquisition_date', 'user_timezone', 'user_id']
+ACTIVITY_COLUMNS = ['plant_id', 'activity_date', 'quantifier']
+CONTRIBUTION_COLUMNS = ['plant_id', 'factor_code', 'severity']
+# Row lists of run_new_activity (p_<name>)
+RESULTS = ['plant_factor', 'plant_factor_contribution', 'plant_status', 'schedule']
+
+
+# ============================================
+# READS
+# ============================================
+def history(supabase, plant_ids: List[str], activity_type_code: str) -> List[Dict]:
+    """Full activity history of one type for the plants (paged), ordered like the new activity read"""
+    rows = [
+        {column: row[column] for column in ACTIVITY_COLUMNS}
+        for page in pages(supabase, 'plant_activity_history', 'activity_id', ['activity_id'] + ACTIVITY_COLUMNS,
+                          [('in_', 'plant_id', plant_ids), ('eq', 'activity_type_code', activity_type_code)])
+        for row in page
+    ]
+    rows.sort(key=lambda row: (row['plant_id'], row['activity_date']))
+    return rows
+
+
+def _open_rows(supabase, table: str, plant_ids: List[str], columns: List[str], state_store=None) -> List[Dict]:
+    if state_store is not None and state_store.ready:
+        return [row for plant_id in plant_ids for row in state_store.by(table, 'plant_id', plant_id, columns)]
+    return (supabase
+        .table(table)
+        .select(', '.join(columns))
+        .in_('plant_id', plant_ids)
+        .is_('end_date', 'null')
+        .execute()).data
+
+
+def _factor_lookup(supabase) -> List[Dict]:
+    return (supabase
+        .table('factor_lookup')
+        .select('factor_code, weight, factor_category')
+        .eq('is_active', True)
+        .execute()).data
+
+
+def _plant_types(supabase, plants: List[Dict]) -> List[Dict]:
+    plant_type_ids = sorted({plant['plant_type_id'] for plant in plants if plant.get('plant_type_id')})
+    return (supabase
+        .table('plant_type_lookup')
+        .select('plant_type_id, watering_interval_days')
+        .in_('plant_type_id', plant_type_ids)
+        .eq('is_active', True)
+        .execute()).data
+
+
+# ============================================
+# WRITE
+# ============================================
+def _write(supabase, plants: List[Dict], results: Dict[str, List[Dict]], run_id: str, state_store=None) -> int:
+    """One run_new_activity call per user of the plants; returns the number of calls"""
+    user_of = {plant['plant_id']: plant.get('user_id') for plant in plants}
+    batch_timestamp = datetime.now().isoformat()
+    calls = 0
+    for user_id in sorted(set(user_of.values()), key=str):
+        payload = {
+            "p_batch_id": run_id,
+            "p_batch_timestamp": batch_timestamp,
+            "p_user_id": user_id,
+            "p_new_activity": [],
+            **{
+                f"p_{name}": [row for row in results.get(name, []) if user_of.get(row['plant_id']) == user_id]
+                for name in RESULTS
+            }
+        }
+        if not any(payload[f"p_{name}"] for name in RESULTS):
+            continue
+        supabase.rpc("run_new_activity", payload).execute()
+        calls += 1
+        # REFRESH STATE STORE with the rows just written
+        if state_store is not None:
+            state_store.apply_new_activity(payload)
+    return calls
+
+
+# ============================================
+# RECALCULATIONS
+# ============================================
+def factors(supabase, plants: List[Dict], activity: List[Dict], activity_type_code: str, run_id: str,
+            today_date: pd.Timestamp, state_store=None, stats: Optional[Dict] = None) -> int:
+    """
+    Recalculates the factors of an activity type (ACTIVITY_FACTORS) for the plants
+
+    Args:
+        plants: plant rows (PLANT_COLUMNS)
+        activity: their full history of the activity type (history())
+    Returns:
+        number of run_new_activity calls
+    """
+    plant_ids = [plant['plant_id'] for plant in plants]
+    reads = {
+        'plant': plants,
+        'plant_type': _plant_types(supabase, plants),
+        'activity': activity,
+        'factor_contribution': _open_rows(supabase, 'plant_factor_contribution', plant_ids, CONTRIBUTION_COLUMNS, state_store),
+        'factor_lookup': _factor_lookup(supabase)
+    }
+    results = calculate(
+        None,
+        reads,
+        ACTIVITY_FACTORS[activity_type_code],
+        today_date=today_date,
+        batch_timestamp=datetime.now(),
+        run_id=run_id,
+        stats=stats if stats is not None else {"completed": 0, "errors": 0}
+    )
+    return _write(supabase, plants, results, run_id, state_store)
+
+
+def statuses(supabase, plants: List[Dict], run_id: str, state_store=None) -> int:
+    """
+    Recalculates the status of the plants from their open contributions and the
+    current factor_lookup weights; writes the changed ones
+
+    Returns:
+        number of plants whose status changed
+    """
+    plant_ids = [plant['plant_id'] for plant in plants]
+    contribution_df = pd.DataFrame(
+        _open_rows(supabase, 'plant_factor_contribution', plant_ids, CONTRIBUTION_COLUMNS, state_store),
+        columns=CONTRIBUTION_COLUMNS
+    )
+    if contribution_df.empty:
+        return 0
+    contribution_df['severity'] = pd.to_numeric(contribution_df['severity'], errors='coerce')
+    status_new_df = status_calculator(
+        contribution_df,
+        run_id=run_id,
+        supabase=None,
+        factor_lookup_df=pd.DataFrame(_factor_lookup(supabase))
+    )
+
+    stored = {row['plant_id']: row['status_code']
+              for row in _open_rows(supabase, 'plant_status', plant_ids, ['plant_id', 'status_code'], state_store)}
+    status_update_df = status_new_df[[
+        stored.get(plant_id) is None or int(stored[plant_id]) != status_code
+        for plant_id, status_code in zip(status_new_df['plant_id'], status_new_df['status_code'])
+    ]]
+    if status_update_df.empty:
+        return 0
+    records = json.loads(status_update_df.to_json(orient="records", date_format="iso"))
+    _write(supabase, plants, {"plant_status": records}, run_id, state_store)
+    return len(records)
@@ -0,0 +1,247 @@
+"""
+REPORTS.PY - Reports and exports over schedule, activity and status history
+Pages through history instead of loading it whole, so memory stays bounded
+whatever the date range:
+
+- pages():          keyset paging on the primary key (id > last id of the
+                    previous page), one REPORT_PAGE_SIZE page in memory at a time
+- schedule_report:  watering compliance, lateness and overdue counts, folded
+                    page by page into one running total per group
+                    (period x habitat x plant type); memory grows with the
+                    number of groups, not the number of rows
+- export():         raw rows of a history table, passed through page by page
+- csv_lines() / ndjson_lines(): response bodies, yielded in chunks of rows
+
+Definitions (schedules of one factor, watering_due by default):
+- closed:           schedule ended (the activity was logged, a new schedule replaced it)
+- lateness_days:    end date - schedule date (negative = early)
+- on_time:          closed with lateness_days <= 0
+- overdue:          closed late, or still open past its schedule date (as of today)
+
+Settings:
+    REPORT_PAGE_SIZE    rows per page (PostgREST returns at most 1000 by default)
+"""
+import os
+import csv
+import io
+import json
+from datetime import date
+from typing import Dict, Iterator, List, Optional
+import pandas as pd
+
+REPORT_PAGE_SIZE = int(os.getenv("REPORT_PAGE_SIZE", 1000))
+
+PERIODS = ("day", "week", "month", "all")
+FORMATS = ("csv", "ndjson")
+DIMENSIONS = ("habitat", "plant_type")
+
+# Export name -> (table, primary key, date column, columns)
+EXPORTS = {
+    "activity": ("plant_activity_history", "activity_id", "activity_date",
+                 ["activity_id", "plant_id", "activity_type_code", "activity_date", "quantifier", "unit",
+                  "notes", "result", "created_at", "user_id"]),
+    "status": ("plant_status", "plant_status_id", "start_date",
+               ["plant_status_id", "plant_id", "status_code", "batch_id", "start_date", "end_date", "user_id"]),
+    "schedule": ("schedule", "schedule_id", "schedule_date",
+                 ["schedule_id", "plant_id", "factor_code", "schedule_date", "schedule_label",
+                  "schedule_severity", "batch_id", "start_date", "end_date", "user_id"])
+}
+
+REPORT_COLUMNS = ["period", "habitat_id", "habitat_name", "plant_type_id", "plant_type", "schedules", "closed",
+                  "on_time", "overdue", "open_overdue", "compliance_rate", "avg_lateness_days", "max_lateness_days"]
+
+
+def pages(supabase, table: str, key: str, columns: List[str], filters: List, page_size: int = REPORT_PAGE_SIZE) -> Iterator[List[Dict]]:
+    """
+    Yields the rows of a table page by page, ordered by its primary key
+
+    Args:
+        filters: [(method, column, value)], e.g. ('gte', 'activity_date', '2026-01-01')
+    """
+    last = None
+    while True:
+        query = supabase.table(table).select(",".join(columns))
+        for method, column, value in filters:
+            query = getattr(query, method)(column, value)
+        if last is not None:
+            query = query.gt(key, last)
+        rows = query.order(key).limit(page_size).execute().data
+        if not rows:
+            return
+        yield rows
+        if len(rows) < page_size:
+            return
+        last = rows[-1][key]
+
+
+def _date_filters(date_column: str, start_date: Optional[str], end_date: Optional[str], user_id: Optional[str]) -> List:
+    filters = []
+    if start_date:
+        filters.append(("gte", date_column, start_date))
+    if end_date:
+        filters.append(("lte", date_column, end_date))
+    if user_id:
+        filters.append(("eq", "user_id", user_id))
+    return filters
+
+
+def check_dates(start_date: Optional[str], end_date: Optional[str]):
+    """Raises ValueError unless the dates given are ISO dates (YYYY-MM-DD)"""
+    for label, value in (("start_date", start_date), ("end_date", end_date)):
+        if value:
+            try:
+                date.fromisoformat(value)
+            except ValueError:
+                raise ValueError(f"Invalid {label} '{value}' (expected YYYY-MM-DD)")
+
+
+def _period_start(dates: pd.Series, period: str) -> pd.Series:
+    if period == "day":
+        return dates.dt.strftime("%Y-%m-%d")
+    if period == "week":
+        return (dates - pd.to_timedelta(dates.dt.weekday, unit="D")).dt.strftime("%Y-%m-%d")
+    if period == "month":
+        return dates.dt.strftime("%Y-%m-01")
+    return pd.Series("all", index=dates.index)
+
+
+def load_dimensions(supabase, user_id: Optional[str] = None) -> pd.DataFrame:
+    """plant_id -> habitat and plant type (small tables, read once per report)"""
+    query = supabase.table("plant").select("plant_id, habitat_id, plant_type_id")
+    if user_id:
+        query = query.eq("user_id", user_id)
+    plant_df = pd.DataFrame(query.execute().data, columns=["plant_id", "habitat_id", "plant_type_id"])
+    habitat_df = pd.DataFrame(supabase.table("habitat").select("habitat_id, habitat_name").execute().data,
+                              columns=["habitat_id", "habitat_name"])
+    plant_type_df = pd.DataFrame(supabase.table("plant_type_lookup").select("plant_type_id, common_name, species").execute().data,
+                                 columns=["plant_type_id", "common_name", "species"])
+    plant_type_df["plant_type"] = plant_type_df["common_name"].fillna(plant_type_df["species"])
+    return (plant_df
+        .merge(habitat_df, on="habitat_id", how="left")
+        .merge(plant_type_df[["plant_type_id", "plant_type"]], on="plant_type_id", how="left")
+        .set_index("plant_id"))
+
+
+def _fold(totals: Dict, page_df: pd.DataFrame, keys: List[str]):
+    """Adds one page's partial sums into the running totals"""
+    grouped = page_df.groupby(keys, dropna=False, sort=False).agg(
+        schedules=("schedule_id", "size"),
+        closed=("closed", "sum"),
+        on_time=("on_time", "sum"),
+        overdue=("overdue", "sum"),
+        open_overdue=("open_overdue", "sum"),
+        lateness_sum=("lateness_days", "sum"),
+        lateness_max=("lateness_days", "max")
+    )
+    for group, row in zip(grouped.index, grouped.itertuples(index=False)):
+        # NaN keys (plants without habitat / plant type) must compare equal across pages
+        group = tuple(None if pd.isna(value) else value for value in (group if isinstance(group, tuple) else (group,)))
+        total = totals.get(group)
+        if total is None:
+            totals[group] = list(row)
+            continue
+        for i in range(5):
+            total[i] += row[i]
+        total[5] += row[5]
+        if pd.notna(row[6]) and (pd.isna(total[6]) or row[6] > total[6]):
+            total[6] = row[6]
+
+
+def schedule_report(supabase, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                    period: str = "month", group_by: List[str] = DIMENSIONS, factor_code: str = "watering_due",
+                    user_id: Optional[str] = None, today: Optional[date] = None) -> Iterator[Dict]:
+    """
+    Compliance, lateness and overdue counts of schedules, by period / habitat / plant type
+    Arguments are checked here; the history is read as the returned iterator is consumed
+
+    Args:
+        start_date, end_date: schedule_date range (inclusive, ISO dates)
+        period: day | week | month | all
+        group_by: subset of ('habitat', 'plant_type')
+    Returns:
+        iterator of one dict per group (REPORT_COLUMNS), sorted by the group keys
+    """
+    if period not in PERIODS:
+        raise ValueError(f"Unknown period '{period}' (expected one of {PERIODS})")
+    unknown = set(group_by) - set(DIMENSIONS)
+    if unknown:
+        raise ValueError(f"Unknown group_by {sorted(unknown)} (expected some of {DIMENSIONS})")
+    check_dates(start_date, end_date)
+    return _schedule_rows(supabase, start_date, end_date, period, group_by, factor_code, user_id, today)
+
+
+def _schedule_rows(supabase, start_date, end_date, period, group_by, factor_code, user_id, today) -> Iterator[Dict]:
+    today = pd.Timestamp(today or date.today())
+    dimensions = load_dimensions(supabase, user_id)
+    keys = ["period"]
+    if "habitat" in group_by:
+        keys += ["habitat_id", "habitat_name"]
+    if "plant_type" in group_by:
+        keys += ["plant_type_id", "plant_type"]
+
+    totals: Dict = {}
+    filters = [("eq", "factor_code", factor_code)] + _date_filters("schedule_date", start_date, end_date, user_id)
+    for page in pages(supabase, "schedule", "schedule_id", ["schedule_id", "plant_id", "schedule_date", "end_date"], filters):
+        page_df = pd.DataFrame(page)
+        schedule_date = pd.to_datetime(page_df["schedule_date"])
+        ended = pd.to_datetime(page_df["end_date"], utc=True, format="ISO8601").dt.tz_localize(None).dt.normalize()
+        page_df["closed"] = ended.notna()
+        page_df["lateness_days"] = (ended - schedule_date).dt.days
+        page_df["on_time"] = page_df["closed"] & (page_df["lateness_days"] <= 0)
+        page_df["open_overdue"] = ~page_df["closed"] & (schedule_date < today)
+        page_df["overdue"] = (page_df["closed"] & (page_df["lateness_days"] > 0)) | page_df["open_overdue"]
+        page_df["period"] = _period_start(schedule_date, period)
+        page_df = page_df.join(dimensions, on="plant_id")
+        _fold(totals, page_df, keys)
+
+    for group in sorted(totals, key=lambda group: tuple("" if value is None else str(value) for value in group)):
+        schedules, closed, on_time, overdue, open_overdue, lateness_sum, lateness_max = totals[group]
+        row = dict.fromkeys(REPORT_COLUMNS)
+        row.update(zip(keys, group))
+        row.update({
+            "schedules": int(schedules),
+            "closed": int(closed),
+            "on_time": int(on_time),
+            "overdue": int(overdue),
+            "open_overdue": int(open_overdue),
+            "compliance_rate": round(on_time / closed, 4) if closed else None,
+            "avg_lateness_days": round(lateness_sum / closed, 2) if closed else None,
+            "max_lateness_days": None if pd.isna(lateness_max) else int(lateness_max)
+        })
+        yield row
+
+
+def export(supabase, name: str, start_date: Optional[str] = None, end_date: Optional[str] = None,
+           user_id: Optional[str] = None) -> Iterator[Dict]:
+    """Raw rows of a history table (see EXPORTS) within a date range, read as they are consumed"""
+    if name not in EXPORTS:
+        raise ValueError(f"Unknown export '{name}' (expected one of {sorted(EXPORTS)})")
+    check_dates(start_date, end_date)
+    table, key, date_column, columns = EXPORTS[name]
+    filters = _date_filters(date_column, start_date, end_date, user_id)
+    return (row for page in pages(supabase, table, key, columns, filters) for row in page)
+
+
+def csv_lines(rows: Iterator[Dict], columns: List[str], chunk_rows: int = REPORT_PAGE_SIZE) -> Iterator[str]:
+    """CSV body, chunk_rows lines at a time (one line per chunk would cost a threadpool hop per row)"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    for i, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if i % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def ndjson_lines(rows: Iterator[Dict], chunk_rows: int = REPORT_PAGE_SIZE) -> Iterator[str]:
+    """Newline-delimited JSON body, chunk_rows rows at a time"""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row, default=str) + "\n")
+        if len(lines) == chunk_rows:
+            yield "".join(lines)
+            lines = []
+    yield "".join(lines)
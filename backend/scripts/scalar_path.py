@@ -0,0 +1,249 @@
+"""
+SCALAR_PATH.PY - Scalar fast path for a new activity
+Same calculations as the vectorized new activity path (factors/watering_due.py,
+factors_contribution/watering_due.py, manager_plant_status.py and
+manager_schedule.py) written with plain Python scalars.
+
+A typical /api/new-activity call has one plant and a handful of history rows;
+at that size pandas' fixed overhead (frames, merges, np.select, groupby.apply,
+JSON round trips) dominates. NewActivity dispatches here when accepts() is True.
+
+tests/test_scalar_path.py checks on seeded random inputs that both paths give
+identical results (`python -m pytest tests` from backend/).
+"""
+import os
+import math
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+import numpy as np
+from utils.ids import new_id
+import scripts.watering_regression as watering_regression
+
+# Largest input (history rows, contributions of other factors) handled on the scalar path
+FAST_PATH_MAX_ROWS = int(os.getenv("FAST_PATH_MAX_ROWS", 200))
+
+# Factors with a scalar implementation
+SCALAR_FACTORS = {"watering_due"}
+
+
+def parse_day(value) -> Optional[date]:
+    """'YYYY-MM-DD' to date; None for anything else (times, other formats)"""
+    if isinstance(value, str) and len(value) == 10:
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            return None
+    return None
+
+
+def to_float(value) -> float:
+    """Like pd.to_numeric(errors='coerce') for one value"""
+    if value is None or isinstance(value, bool):
+        return math.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def iso_day(day: Optional[date]) -> Optional[str]:
+    """Same format pandas' to_json(date_format='iso') gives a date"""
+    return f"{day.isoformat()}T00:00:00.000" if day is not None else None
+
+
+def accepts(new_activity: Dict, reads: Dict, factors_to_calculate: List[str]) -> bool:
+    """True when the input is small and in the shape the scalar path supports"""
+    if not set(factors_to_calculate) <= SCALAR_FACTORS:
+        return False
+    if len(reads['plant']) != 1 or not reads['factor_contribution']:
+        return False
+    if len(reads['activity']) > FAST_PATH_MAX_ROWS:
+        return False
+    # The interval regression only has a vectorized implementation
+    if (watering_regression.WATERING_FORECAST_MODE == "regression"
+            and len(reads['activity']) + 1 >= watering_regression.MIN_WATERINGS):
+        return False
+    remaining = sum(1 for row in reads['factor_contribution'] if row.get('factor_code') not in factors_to_calculate)
+    if remaining > FAST_PATH_MAX_ROWS:
+        return False
+
+    # Dates the scalar path parses exactly like pandas
+    activity_dates = [new_activity['activity_date']] + [row.get('activity_date') for row in reads['activity']]
+    if any(parse_day(value) is None for value in activity_dates):
+        return False
+    return parse_day(reads['plant'][0].get('acquisition_date')) is not None
+
+
+def watering_due(plant: Dict, activity_dates: List[date], run_id) -> Dict:
+    """
+    Watering due factor of one plant (see factors/watering_due.py)
+
+    Args:
+        plant: plant_id, acquisition_date (date), watering_interval_days (float, may be nan)
+        activity_dates: watering dates, including the new activity
+    Returns:
+        plant factor record
+    """
+    dates = sorted(activity_dates)
+    count = len(dates)
+    interval = plant['watering_interval_days']
+
+    # Step 01/02: last watering, watering count, average days between waterings
+    if count == 0:
+        base, days = plant['acquisition_date'], interval
+    elif count < 5:
+        base, days = dates[-1], interval
+    else:
+        intervals = [(later - earlier).days for earlier, later in zip(dates, dates[1:])]
+        base, days = dates[-1], sum(intervals) / len(intervals)
+
+    # Step 04: next watering date (the time part of a fractional average is dropped)
+    factor_date = None if math.isnan(days) else base + timedelta(days=math.floor(days))
+
+    # Step 05: confidence
+    if count == 0:
+        confidence = 0.0
+    elif count <= 2:
+        confidence = 0.3 + (count * 0.05)
+    elif count <= 5:
+        confidence = 0.5 + ((count - 2) * 0.03)
+    elif count <= 10:
+        confidence = 0.7 + ((count - 5) * 0.02)
+    else:
+        confidence = min(0.95, 0.9 + ((count - 10) * 0.01))
+    # Phase 1: Cap at 0.7 (using species default)
+    confidence = float(np.round(min(confidence, 0.7), 2))
+
+    return {
+        'plant_id': plant['plant_id'],
+        'factor_code': 'watering_due',
+        'factor_date': factor_date,
+        'factor_float': None,
+        'confidence_score': confidence,
+        'plant_factor_id': new_id()
+    }
+
+
+def watering_due_contribution(plant_factor: Dict, today: date) -> Dict:
+    """Severity of a watering due factor (see factors_contribution/watering_due.py)"""
+    severity = 0
+    if plant_factor['factor_date'] is not None:
+        days_overdue = (today - plant_factor['factor_date']).days
+        if 1 <= days_overdue <= 2:
+            severity = 1
+        elif 3 <= days_overdue <= 6:
+            severity = 2
+        elif days_overdue >= 7:
+            severity = 3
+
+    return {
+        'plant_id': plant_factor['plant_id'],
+        'plant_factor_id': plant_factor['plant_factor_id'],
+        'factor_code': plant_factor['factor_code'],
+        'severity': severity,
+        'plant_factor_contribution_id': new_id()
+    }
+
+
+def plant_status(factor_contributions: List[Dict], weights: Dict[str, float]) -> List[Dict]:
+    """
+    Weighted average of the contribution severities per plant (see manager_plant_status.py)
+
+    NaN severities and weights are skipped like pandas' sum() does.
+    """
+    groups: Dict[str, List[Dict]] = {}
+    for row in factor_contributions:
+        groups.setdefault(row['plant_id'], []).append(row)
+
+    plant_status_list = []
+    for plant_id in sorted(groups):
+        weighted_sum = 0.0
+        weight_sum = 0.0
+        for row in groups[plant_id]:
+            weight = weights.get(row['factor_code'], math.nan)
+            severity = to_float(row['severity'])
+            if not math.isnan(weight):
+                weight_sum += weight
+                if not math.isnan(severity):
+                    weighted_sum += severity * weight
+        value = 0 if weight_sum == 0 else weighted_sum / weight_sum
+        plant_status_list.append({
+            'plant_id': plant_id,
+            'status_code': int(np.round(value)),
+            'plant_status_id': new_id()
+        })
+    return plant_status_list
+
+
+def schedule_item(plant_factor: Dict, factor_category: Optional[str], today: datetime) -> Dict:
+    """Schedule row of a factor with its severity (see manager_schedule.py, schedule/severity.py)"""
+    schedule_severity = 0
+    if plant_factor['factor_date'] is not None:
+        days_until = (today - datetime.combine(plant_factor['factor_date'], datetime.min.time())).days
+        if 1 <= days_until <= 2:
+            schedule_severity = 1
+        elif 3 <= days_until <= 6:
+            schedule_severity = 2
+        elif days_until >= 7:
+            schedule_severity = 3
+
+    return {
+        'schedule_id': new_id(),
+        'plant_factor_id': plant_factor['plant_factor_id'],
+        'plant_id': plant_factor['plant_id'],
+        'factor_code': plant_factor['factor_code'],
+        'schedule_date': iso_day(plant_factor['factor_date']),
+        'schedule_label': factor_category,
+        'schedule_severity': schedule_severity
+    }
+
+
+def calculate(new_activity, reads, factors_to_calculate, today_date, batch_timestamp, run_id, stats):
+    """
+    Scalar calculation of the new activity, same signature and result as
+    manager_new_activity.calculate (only valid when accepts() is True)
+    """
+    # PLANT DETAIL + PLANT TYPE
+    plant_row = reads['plant'][0]
+    interval = math.nan
+    for plant_type in reads['plant_type']:
+        if plant_type['plant_type_id'] == plant_row['plant_type_id']:
+            interval = to_float(plant_type['watering_interval_days'])
+            break
+    plant = {
+        'plant_id': plant_row['plant_id'],
+        'acquisition_date': parse_day(plant_row['acquisition_date']),
+        'watering_interval_days': interval
+    }
+
+    # ACTIVITY (history + new activity)
+    activity_dates = [parse_day(new_activity['activity_date'])]
+    activity_dates += [parse_day(row['activity_date']) for row in reads['activity']]
+
+    # FACTOR LOOKUP
+    weights = {row['factor_code']: to_float(row.get('weight')) for row in reads['factor_lookup']}
+    categories = {row['factor_code']: row.get('factor_category') for row in reads['factor_lookup']}
+
+    # CALCULATE FACTOR and CONTRIBUTION
+    today = today_date.date() if isinstance(today_date, datetime) else today_date
+    plant_factor = watering_due(plant, activity_dates, run_id)
+    stats['completed'] += 1
+    plant_factor_contribution = watering_due_contribution(plant_factor, today)
+    stats['completed'] += 1
+
+    # CALCULATE STATUS (other factors' contributions + the new one)
+    factor_contributions = [row for row in reads['factor_contribution'] if row.get('factor_code') not in factors_to_calculate]
+    factor_contributions.append(plant_factor_contribution)
+    plant_status_list = plant_status(factor_contributions, weights)
+    stats['completed'] += 1
+
+    # PREPARE SCHEDULE ITEMS
+    schedule = schedule_item(plant_factor, categories.get(plant_factor['factor_code']), batch_timestamp)
+    stats['completed'] += 1
+
+    return {
+        "plant_factor": [{**plant_factor, 'factor_date': iso_day(plant_factor['factor_date'])}],
+        "plant_factor_contribution": [plant_factor_contribution],
+        "plant_status": plant_status_list,
+        "schedule": [schedule]
+    }
@@ -28,7 +28,8 @@ def run(schedule_df, today_date, run_id):
     df = schedule_df.copy()
     
     # Step 01: days from today until schedule date
-    df['days_until'] = (today_date - df['schedule_date']).dt.days
+    ## to_datetime: a schedule_date column holding None (object dtype) has no .dt accessor
+    df['days_until'] = (today_date - pd.to_datetime(df['schedule_date'])).dt.days
     print(f"  ✅ Step 01")
 
     # Step 02: Calculate schedule severity
@@ -0,0 +1,279 @@
+"""
+SIMULATOR.PY - What-if simulation of factor weights and severity bands
+Recomputes every plant's factor contributions and status with candidate
+factor_lookup weights and / or severity bands, over a cached snapshot of the
+open factors, and reports how the status distribution would move. Nothing is
+written.
+
+- Snapshot:   open plant_factor + plant_factor_contribution rows and the active
+              factor_lookup weights, from the state store when it is loaded
+              (else paged from the database), kept SIMULATOR_SNAPSHOT_SECONDS;
+              or the inputs of a captured daily batch (CLI --snapshot)
+- Current:    contributions and status as the daily batch would compute them
+              today with the current weights and bands (not the stored ones,
+              so the diff only shows the effect of the candidates)
+- Candidate:  the same with the candidate weights / bands
+- Both use the vectorized paths (factors_contribution severity(),
+  manager_plant_status.weighted_average), so a fleet takes milliseconds
+
+Severity bands: days overdue from which severity 1, 2, 3 start, e.g.
+{"watering_due": [2, 4, 8]}; only factors whose contribution module defines
+SEVERITY_BANDS can be simulated. Contributions of other factors keep their
+stored severity.
+
+Usage:
+    python -m scripts.simulator --weight watering_due=0.5 --bands watering_due=2,4,8
+    python -m scripts.simulator --snapshot <capture dir>/<run_date>_<batch_id> --bands watering_due=1,4,10
+
+Settings:
+    SIMULATOR_SNAPSHOT_SECONDS    how long a loaded snapshot is reused
+"""
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+from zoneinfo import ZoneInfo
+import pandas as pd
+from scripts.factors_contribution import registry as factor_contribution_registry
+from scripts.manager_plant_status import weighted_average
+from scripts.reports import pages
+
+SIMULATOR_SNAPSHOT_SECONDS = float(os.getenv("SIMULATOR_SNAPSHOT_SECONDS", 300))
+
+CONTRIBUTION_COLUMNS = ['plant_factor_id', 'plant_id', 'factor_code', 'severity']
+FACTOR_COLUMNS = ['plant_factor_id', 'factor_date']
+
+
+def band_factors() -> Dict:
+    """Factor code -> contribution module, for the factors whose bands can be simulated"""
+    return {code: module for code, module in factor_contribution_registry.items() if hasattr(module, 'SEVERITY_BANDS')}
+
+
+def build_snapshot(plant_factor_df: pd.DataFrame, contribution_df: pd.DataFrame,
+                   factor_lookup_df: pd.DataFrame) -> Dict:
+    """Compact frame of the open contributions with their factor date, plus the current weights"""
+    contributions = contribution_df[CONTRIBUTION_COLUMNS].merge(
+        plant_factor_df[FACTOR_COLUMNS], on='plant_factor_id', how='left'
+    )
+    contributions = pd.DataFrame({
+        'plant_id': contributions['plant_id'].astype('category'),
+        'factor_code': contributions['factor_code'].astype('category'),
+        'severity': pd.to_numeric(contributions['severity'], errors='coerce'),
+        'factor_date': pd.to_datetime(contributions['factor_date'], errors='coerce').dt.normalize()
+    })
+    weights = factor_lookup_df[['factor_code', 'weight']].copy()
+    weights['weight'] = pd.to_numeric(weights['weight'], errors='coerce')
+    return {
+        'contributions': contributions,
+        'weights': dict(zip(weights['factor_code'], weights['weight'])),
+        'loaded_at': time.time()
+    }
+
+
+def _check(weights: Dict[str, float], bands: Dict[str, List[int]], snapshot: Dict):
+    unknown = set(weights) - set(snapshot['weights'])
+    if unknown:
+        raise ValueError(f"Unknown factors in weights {sorted(unknown)} (active: {sorted(snapshot['weights'])})")
+    for code, weight in weights.items():
+        if not isinstance(weight, (int, float)) or not math.isfinite(weight) or weight < 0:
+            raise ValueError(f"Weight of {code} must be a number >= 0")
+    simulated = band_factors()
+    unknown = set(bands) - set(simulated)
+    if unknown:
+        raise ValueError(f"No severity bands for {sorted(unknown)} (expected some of {sorted(simulated)})")
+    for code, days in bands.items():
+        if not 1 <= len(days) <= 3 or any(later <= earlier for earlier, later in zip(days, days[1:])):
+            raise ValueError(f"Bands of {code} must be 1 to 3 increasing day counts, got {days}")
+
+
+def _distribution(values: pd.Series) -> Dict[str, int]:
+    return {str(code): int(count) for code, count in values.value_counts().sort_index().items()}
+
+
+def simulate(snapshot: Dict, weights: Optional[Dict[str, float]] = None, bands: Optional[Dict[str, List[int]]] = None,
+             today: Optional[str] = None) -> Dict:
+    """
+    Current vs candidate contributions and status of every plant of a snapshot
+
+    Args:
+        weights: {factor_code: weight} overriding factor_lookup
+        bands: {factor_code: [days for severity 1, 2, 3]} overriding the module's SEVERITY_BANDS
+        today: evaluation date (ISO, defaults to today in America/New_York like the daily batch)
+    Returns:
+        {'today', 'plants', 'status': {'current', 'candidate'} distributions,
+         'changed', 'by_delta', 'transitions', 'contributions': {...}, 'elapsed_ms'}
+    """
+    started = time.perf_counter()
+    weights = weights or {}
+    bands = {code: [int(day) for day in days] for code, days in (bands or {}).items()}
+    _check(weights, bands, snapshot)
+    today_date = pd.Timestamp(today or datetime.now(ZoneInfo("America/New_York")).date())
+
+    contributions = snapshot['contributions']
+    days_overdue = (today_date - contributions['factor_date']).dt.days
+    severity_current = contributions['severity'].copy()
+    severity_candidate = contributions['severity'].copy()
+    for code, module in band_factors().items():
+        rows = (contributions['factor_code'] == code).to_numpy()
+        if not rows.any():
+            continue
+        severity_current[rows] = module.severity(days_overdue[rows], module.SEVERITY_BANDS)
+        severity_candidate[rows] = module.severity(days_overdue[rows], bands.get(code, module.SEVERITY_BANDS))
+
+    current_weights = snapshot['weights']
+    candidate_weights = {**current_weights, **weights}
+    factor_code = contributions['factor_code'].astype(object)
+
+    def status(severity: pd.Series, factor_weights: Dict[str, float]) -> pd.Series:
+        frame = pd.DataFrame({
+            'plant_id': contributions['plant_id'],
+            'severity': severity,
+            'weight': factor_code.map(factor_weights).astype('float64')
+        })
+        return weighted_average(frame, 'severity', 'weight').round(0).astype(int)
+
+    status_current = status(severity_current, current_weights)
+    status_candidate = status(severity_candidate, candidate_weights)
+    delta = status_candidate - status_current
+    moved = delta != 0
+    transitions = (pd.DataFrame({'current': status_current[moved], 'candidate': status_candidate[moved]})
+        .value_counts()
+        .sort_index())
+
+    return {
+        'today': today_date.date().isoformat(),
+        'snapshot_loaded_at': snapshot['loaded_at'],
+        'weights': candidate_weights,
+        'bands': {code: bands.get(code, list(module.SEVERITY_BANDS)) for code, module in band_factors().items()},
+        'plants': int(len(status_current)),
+        'status': {
+            'current': _distribution(status_current),
+            'candidate': _distribution(status_candidate)
+        },
+        'changed': int(moved.sum()),
+        'by_delta': {f"{int(value):+d}": count for value, count in _distribution(delta[moved]).items()},
+        'transitions': {f"{current}->{candidate}": int(count) for (current, candidate), count in transitions.items()},
+        'contributions': {
+            'rows': int(len(contributions)),
+            'changed': int((severity_candidate.fillna(-1) != severity_current.fillna(-1)).sum()),
+            'current': _distribution(severity_current.dropna().astype(int)),
+            'candidate': _distribution(severity_candidate.dropna().astype(int))
+        },
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)
+    }
+
+
+class Simulator:
+    """Cached snapshot of the open factors, for repeated simulations"""
+
+    def __init__(self, supabase_factory, state_store=None, snapshot_seconds: float = SIMULATOR_SNAPSHOT_SECONDS):
+        self.supabase_factory = supabase_factory
+        # Open rows are read from the in-process state store when it is loaded
+        self.state_store = state_store
+        self.snapshot_seconds = snapshot_seconds
+        self._lock = threading.Lock()
+        self._snapshot: Optional[Dict] = None
+
+        # Simulation stats tracking
+        self.stats = {
+            "simulations": 0,
+            "snapshots": 0
+        }
+
+    def _load(self) -> Dict:
+        supabase = self.supabase_factory()
+        if self.state_store is not None and self.state_store.readable:
+            plant_factor_df = pd.DataFrame(self.state_store.select('plant_factor', FACTOR_COLUMNS), columns=FACTOR_COLUMNS)
+            contribution_df = pd.DataFrame(self.state_store.select('plant_factor_contribution', CONTRIBUTION_COLUMNS),
+                                           columns=CONTRIBUTION_COLUMNS)
+        else:
+            open_rows = [('is_', 'end_date', 'null')]
+            plant_factor_df = pd.DataFrame([row for page in pages(supabase, 'plant_factor', 'plant_factor_id', FACTOR_COLUMNS, open_rows)
+                                            for row in page], columns=FACTOR_COLUMNS)
+            contribution_df = pd.DataFrame([row for page in pages(supabase, 'plant_factor_contribution', 'plant_factor_contribution_id',
+                                                                   ['plant_factor_contribution_id'] + CONTRIBUTION_COLUMNS, open_rows)
+                                            for row in page], columns=['plant_factor_contribution_id'] + CONTRIBUTION_COLUMNS)
+        factor_lookup_data = (supabase
+            .table('factor_lookup')
+            .select('factor_code, weight')
+            .eq('is_active', True)
+            .execute())
+        factor_lookup_df = pd.DataFrame(factor_lookup_data.data, columns=['factor_code', 'weight'])
+        return build_snapshot(plant_factor_df, contribution_df, factor_lookup_df)
+
+    def snapshot(self, refresh: bool = False) -> Dict:
+        """The cached snapshot, reloaded when older than snapshot_seconds (or on refresh)"""
+        with self._lock:
+            if (refresh or self._snapshot is None
+                    or time.time() - self._snapshot['loaded_at'] > self.snapshot_seconds):
+                self._snapshot = self._load()
+                self.stats["snapshots"] += 1
+            return self._snapshot
+
+    def simulate(self, weights: Optional[Dict[str, float]] = None, bands: Optional[Dict[str, List[int]]] = None,
+                 today: Optional[str] = None, refresh: bool = False) -> Dict:
+        result = simulate(self.snapshot(refresh), weights, bands, today)
+        with self._lock:
+            self.stats["simulations"] += 1
+        return result
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return {
+                **self.stats,
+                "snapshot_loaded_at": self._snapshot['loaded_at'] if self._snapshot else None,
+                "snapshot_rows": len(self._snapshot['contributions']) if self._snapshot else 0
+            }
+
+
+def _pairs(values: List[str], parse) -> Dict:
+    """['code=value', ...] -> {code: parse(value)}"""
+    pairs = {}
+    for value in values:
+        code, _, raw = value.partition('=')
+        if not raw:
+            raise ValueError(f"Expected factor_code=value, got '{value}'")
+        pairs[code] = parse(raw)
+    return pairs
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(description="What-if simulation of factor weights and severity bands")
+    parser.add_argument('--weight', action='append', default=[], help="factor_code=weight (repeatable)")
+    parser.add_argument('--bands', action='append', default=[], help="factor_code=days,days,days (repeatable)")
+    parser.add_argument('--today', help="evaluation date (ISO)")
+    parser.add_argument('--snapshot', help="captured daily batch directory to simulate over (no database access)")
+    args = parser.parse_args()
+
+    try:
+        weights = _pairs(args.weight, float)
+        bands = _pairs(args.bands, lambda raw: [int(day) for day in raw.split(',')])
+    except ValueError as e:
+        parser.error(str(e))
+
+    # Calculator progress goes to stderr so stdout is only the report
+    stdout, sys.stdout = sys.stdout, sys.stderr
+    try:
+        if args.snapshot:
+            from scripts.batch_snapshot import load_snapshot
+            meta, inputs, _ = load_snapshot(args.snapshot)
+            snapshot = build_snapshot(inputs['plant_factor'], inputs['plant_factor_contribution'], inputs['factor_lookup'])
+            report = simulate(snapshot, weights, bands, args.today or meta['today_date'])
+        else:
+            from utils.supabase_client import get_client
+            report = Simulator(get_client).simulate(weights, bands, args.today)
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        sys.stdout = stdout
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
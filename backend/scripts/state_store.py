@@ -0,0 +1,366 @@
+"""
+STATE_STORE.PY - In-process materialized store of open rows
+Keeps the open rows (end_date IS NULL) of schedule, plant_factor,
+plant_factor_contribution and plant_status in memory, indexed by plant and
+by factor, so the orchestrators do not download these tables on every run.
+
+- load():       full read from the database (startup, reconciliation)
+- apply_*():    incremental refresh from the rows each RPC wrote
+- snapshot():   local file for a fast restart (restore() on startup)
+- reconcile():  periodic reload that also reports how far the store drifted
+
+`ready` is only set by a full read from the database (load / reconcile):
+everything that feeds an RPC (NewActivity, recompute, DailyBatch) reads the
+store only then. A restored snapshot (at most STATE_STORE_SNAPSHOT_MAX_AGE_SECONDS
+old) only sets `readable`, for read-only views (derived status, simulator)
+until the first reconciliation.
+
+A reload fetches without holding the lock; payloads applied meanwhile are
+logged and applied again on top of the fetched rows, so they are not lost.
+
+The RPCs run in the database, so apply_*() mirrors what they do (close the
+open rows a new row replaces, update severities in place). Anything it gets
+wrong (e.g. new plant_status ids written by run_daily_batch) is fixed at the
+next reconciliation.
+
+Settings:
+    STATE_STORE_ENABLED              true | false
+    STATE_STORE_SNAPSHOT_PATH        local snapshot file
+    STATE_STORE_RECONCILE_SECONDS    reconciliation period
+    STATE_STORE_SNAPSHOT_MAX_AGE_SECONDS   oldest snapshot restored on startup
+"""
+import os
+import gzip
+import json
+import time
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+STATE_STORE_ENABLED = os.getenv("STATE_STORE_ENABLED", "true").lower() == "true"
+STATE_STORE_SNAPSHOT_PATH = os.getenv("STATE_STORE_SNAPSHOT_PATH", "local_data/open_rows.json.gz")
+STATE_STORE_RECONCILE_SECONDS = int(os.getenv("STATE_STORE_RECONCILE_SECONDS", 600))
+STATE_STORE_SNAPSHOT_MAX_AGE_SECONDS = int(os.getenv("STATE_STORE_SNAPSHOT_MAX_AGE_SECONDS", 3600))
+
+# { table: primary key, columns kept, indexed columns, date columns }
+TABLES = {
+    'schedule': {
+        'key': 'schedule_id',
+        'columns': ['schedule_id', 'plant_id', 'plant_factor_id', 'factor_code', 'schedule_date',
+                    'schedule_label', 'schedule_severity', 'user_id'],
+        'index': ['plant_id', 'plant_factor_id'],
+        'dates': ['schedule_date']
+    },
+    'plant_factor': {
+        'key': 'plant_factor_id',
+        'columns': ['plant_factor_id', 'plant_id', 'factor_code', 'factor_date', 'factor_float', 'confidence_score'],
+        'index': ['plant_id'],
+        'dates': ['factor_date']
+    },
+    'plant_factor_contribution': {
+        'key': 'plant_factor_contribution_id',
+        'columns': ['plant_factor_contribution_id', 'plant_factor_id', 'plant_id', 'factor_code', 'severity'],
+        'index': ['plant_id', 'plant_factor_id'],
+        'dates': []
+    },
+    'plant_status': {
+        'key': 'plant_status_id',
+        'columns': ['plant_status_id', 'plant_id', 'status_code', 'user_id'],
+        'index': ['plant_id'],
+        'dates': []
+    }
+}
+
+
+class OpenRowStore:
+    """Indexed in-memory copy of the open rows"""
+
+    def __init__(self, snapshot_path: str = STATE_STORE_SNAPSHOT_PATH,
+                 snapshot_max_age_seconds: int = STATE_STORE_SNAPSHOT_MAX_AGE_SECONDS):
+        self.snapshot_path = snapshot_path
+        self.snapshot_max_age_seconds = snapshot_max_age_seconds
+        # Reconciled with the database since startup (safe to feed RPCs)
+        self.ready = False
+        # Rows are loaded, possibly only from the snapshot (read-only views)
+        self.readable = False
+        self._lock = threading.RLock()
+        # One reload (load / reconcile) at a time; payloads applied during its fetch
+        self._reload_lock = threading.Lock()
+        self._applied_during_fetch: Optional[List[Tuple[str, Dict]]] = None
+        self._rows: Dict[str, Dict[str, Dict]] = {table: {} for table in TABLES}
+        self._index: Dict[str, Dict[str, Dict[str, set]]] = {
+            table: {col: {} for col in spec['index']} for table, spec in TABLES.items()
+        }
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+        # Store stats tracking
+        self.stats = {
+            "loaded_at": None,
+            "reconciled_at": None,
+            "reads": 0,
+            "applied_rows": 0,
+            "reapplied_payloads": 0,
+            "last_drift": {}
+        }
+
+    # ============================================
+    # ROWS AND INDEXES
+    # ============================================
+    @staticmethod
+    def _normalize(table: str, row: Dict) -> Dict:
+        """Keeps the store columns; dates as 'YYYY-MM-DD' like the database returns them"""
+        spec = TABLES[table]
+        clean = {col: row.get(col) for col in spec['columns']}
+        for col in spec['dates']:
+            if isinstance(clean[col], str):
+                clean[col] = clean[col][:10]
+        return clean
+
+    def _put(self, table: str, row: Dict):
+        key = row[TABLES[table]['key']]
+        self._remove(table, key)
+        self._rows[table][key] = row
+        for col, index in self._index[table].items():
+            index.setdefault(row.get(col), set()).add(key)
+
+    def _remove(self, table: str, key: str):
+        row = self._rows[table].pop(key, None)
+        if row is None:
+            return
+        for col, index in self._index[table].items():
+            keys = index.get(row.get(col))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del index[row.get(col)]
+
+    def _replace_all(self, table: str, rows: Iterable[Dict]):
+        self._rows[table] = {}
+        self._index[table] = {col: {} for col in TABLES[table]['index']}
+        for row in rows:
+            self._put(table, self._normalize(table, row))
+
+    # ============================================
+    # READS
+    # ============================================
+    def select(self, table: str, columns: Optional[List[str]] = None) -> List[Dict]:
+        """All open rows of a table (copies, only the requested columns)"""
+        with self._lock:
+            self.stats["reads"] += 1
+            rows = list(self._rows[table].values())
+        columns = columns or TABLES[table]['columns']
+        return [{col: row.get(col) for col in columns} for row in rows]
+
+    def by(self, table: str, col: str, value, columns: Optional[List[str]] = None) -> List[Dict]:
+        """Open rows of a table where an indexed column equals value"""
+        with self._lock:
+            self.stats["reads"] += 1
+            rows = [self._rows[table][key] for key in self._index[table][col].get(value, ())]
+        columns = columns or TABLES[table]['columns']
+        return [{col: row.get(col) for col in columns} for row in rows]
+
+    # ============================================
+    # INCREMENTAL REFRESH
+    # ============================================
+    def _close_and_insert(self, table: str, rows: List[Dict], match: List[str], extra: Optional[Dict] = None):
+        """Closes the open rows a new row replaces (same values in `match`), then inserts it"""
+        for row in rows:
+            row = self._normalize(table, {**(extra or {}), **row})
+            candidates = self._index[table]['plant_id'].get(row['plant_id'], set())
+            for key in list(candidates):
+                current = self._rows[table][key]
+                if all(current.get(col) == row.get(col) for col in match):
+                    self._remove(table, key)
+            self._put(table, row)
+            self.stats["applied_rows"] += 1
+
+    def _apply_new_activity(self, payload: Dict):
+        user = {"user_id": payload.get("p_user_id")}
+        self._close_and_insert('plant_factor', payload.get("p_plant_factor", []), ['plant_id', 'factor_code'])
+        self._close_and_insert('plant_factor_contribution', payload.get("p_plant_factor_contribution", []), ['plant_id', 'factor_code'])
+        self._close_and_insert('plant_status', payload.get("p_plant_status", []), ['plant_id'], extra=user)
+        self._close_and_insert('schedule', payload.get("p_schedule", []), ['plant_id', 'factor_code'], extra=user)
+
+    def apply_new_activity(self, payload: Dict):
+        """Mirrors run_new_activity with the RPC's parameters"""
+        with self._lock:
+            self._apply_new_activity(payload)
+            if self._applied_during_fetch is not None:
+                self._applied_during_fetch.append(('new_activity', payload))
+
+    def _update(self, table: str, col: str, rows: List[Dict], field: str):
+        """Sets `field` on the open rows matched by `col`"""
+        for row in rows:
+            if col == TABLES[table]['key']:
+                keys = [row[col]] if row[col] in self._rows[table] else []
+            else:
+                keys = list(self._index[table][col].get(row[col], ()))
+            for key in keys:
+                self._rows[table][key][field] = row[field]
+                self.stats["applied_rows"] += 1
+
+    def _apply_daily_batch(self, payload: Dict):
+        self._update('schedule', 'schedule_id', payload.get("p_schedule_severity", []), 'schedule_severity')
+        self._update('plant_factor_contribution', 'plant_factor_id', payload.get("p_factor_contribution", []), 'severity')
+        self._update('plant_status', 'plant_id', payload.get("p_status", []), 'status_code')
+
+    def apply_daily_batch(self, payload: Dict):
+        """Mirrors run_daily_batch with the RPC's parameters"""
+        with self._lock:
+            self._apply_daily_batch(payload)
+            if self._applied_during_fetch is not None:
+                self._applied_during_fetch.append(('daily_batch', payload))
+
+    # ============================================
+    # LOAD / RECONCILE / SNAPSHOT
+    # ============================================
+    @staticmethod
+    def _fetch(supabase, table: str) -> List[Dict]:
+        data = (supabase
+            .table(table)
+            .select(', '.join(TABLES[table]['columns']))
+            .is_('end_date','null')
+            .execute())
+        return data.data
+
+    def _fetch_all(self, supabase) -> Dict[str, List[Dict]]:
+        """Every table from the database; payloads applied meanwhile are logged for _reapply()"""
+        with self._lock:
+            self._applied_during_fetch = []
+        try:
+            return {table: self._fetch(supabase, table) for table in TABLES}
+        except Exception:
+            with self._lock:
+                self._applied_during_fetch = None
+            raise
+
+    def _reapply(self):
+        """Applies the payloads logged during the fetch on top of the fetched rows (lock held)"""
+        applied = self._applied_during_fetch or []
+        self._applied_during_fetch = None
+        for kind, payload in applied:
+            if kind == 'new_activity':
+                self._apply_new_activity(payload)
+            else:
+                self._apply_daily_batch(payload)
+        self.stats["reapplied_payloads"] += len(applied)
+
+    def load(self, supabase):
+        """Full read of every table from the database"""
+        print("  🔍 Loading open rows into the state store...")
+        with self._reload_lock:
+            fetched = self._fetch_all(supabase)
+            with self._lock:
+                for table, rows in fetched.items():
+                    self._replace_all(table, rows)
+                self._reapply()
+                self.ready = self.readable = True
+                self.stats["loaded_at"] = time.time()
+        print(f"  ✅ State store loaded: { {table: len(rows) for table, rows in fetched.items()} }")
+
+    def reconcile(self, supabase) -> Dict[str, Dict[str, int]]:
+        """
+        Reloads from the database and reports the drift of the store
+
+        Returns:
+            { table: {'missing': X, 'stale': Y, 'changed': Z} }
+        """
+        drift = {}
+        with self._reload_lock:
+            fetched = self._fetch_all(supabase)
+            with self._lock:
+                for table, rows in fetched.items():
+                    key = TABLES[table]['key']
+                    database = {row[key]: self._normalize(table, row) for row in rows}
+                    store = self._rows[table]
+                    drift[table] = {
+                        'missing': len(database.keys() - store.keys()),
+                        'stale': len(store.keys() - database.keys()),
+                        'changed': sum(1 for k in database.keys() & store.keys() if database[k] != store[k])
+                    }
+                    self._replace_all(table, rows)
+                self._reapply()
+                self.ready = self.readable = True
+                self.stats["reconciled_at"] = time.time()
+                self.stats["last_drift"] = drift
+        return drift
+
+    def snapshot(self):
+        """Writes the store to the local snapshot file"""
+        with self._lock:
+            data = {table: list(rows.values()) for table, rows in self._rows.items()}
+        directory = os.path.dirname(self.snapshot_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump({"saved_at": time.time(), "tables": data}, f)
+        os.replace(tmp_path, self.snapshot_path)
+
+    def restore(self) -> bool:
+        """
+        Loads the local snapshot, if any and recent enough; until the first
+        reconciliation it only serves read-only views (`readable`, not `ready`)
+        """
+        if not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            with gzip.open(self.snapshot_path, 'rt', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Warning: could not read state store snapshot: {str(e)}")
+            return False
+        age = time.time() - (data.get("saved_at") or 0)
+        if age > self.snapshot_max_age_seconds:
+            print(f"Warning: state store snapshot is {age / 60:.0f} minutes old, waiting for the database")
+            return False
+        with self._lock:
+            if self.ready:
+                # A reconciliation already finished: the snapshot is older
+                return False
+            for table in TABLES:
+                self._replace_all(table, data["tables"].get(table, []))
+            self.readable = True
+            self.stats["loaded_at"] = data.get("saved_at")
+        print(f"✓ State store restored from {self.snapshot_path}")
+        return True
+
+    def start(self, supabase_factory, reconcile_seconds: int = STATE_STORE_RECONCILE_SECONDS):
+        """Restores the snapshot, then reconciles (and snapshots) in a daemon thread"""
+        self.restore()
+
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    drift = self.reconcile(supabase_factory())
+                    self.snapshot()
+                    print(f"  ✅ State store reconciled: {drift}")
+                except Exception as e:
+                    print(f"❌ Error reconciling state store: {str(e)}")
+                self._wake.wait(reconcile_seconds)
+                self._wake.clear()
+
+        threading.Thread(target=loop, name="state-store", daemon=True).start()
+
+    def request_reconcile(self):
+        """Reconciles now instead of at the end of the period (e.g. a batch ran in another process)"""
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self.ready:
+            try:
+                self.snapshot()
+            except Exception as e:
+                print(f"❌ Error writing state store snapshot: {str(e)}")
+
+    def metrics(self) -> Dict:
+        """Row counts per table plus the store stats"""
+        with self._lock:
+            return {
+                **self.stats,
+                "ready": self.ready,
+                "readable": self.readable,
+                "rows": {table: len(rows) for table, rows in self._rows.items()}
+            }
@@ -0,0 +1,153 @@
+"""
+WATERING_REGRESSION.PY - Fleet-wide watering interval regression
+Predicts the next watering interval of every plant with enough history at
+once, instead of the plain mean of its past intervals.
+
+Model (per plant, fitted for all plants together):
+    interval ~ b0 + b1 * trend + b2 * sin(season) + b3 * cos(season)
+    - trend:    time of the interval, in months relative to the last watering
+    - season:   day of year of the interval, as an angle
+    - weights:  recency, halving every WATERING_FORECAST_HALF_LIFE_DAYS
+    - ridge:    trend and season terms shrink to 0 when history is short,
+                so the fit falls back to the recency-weighted mean
+
+The last WATERING_FORECAST_MAX_INTERVALS intervals of each plant are laid out
+in a padded plants x intervals array (right-aligned, with a mask), and the
+weighted least squares of every plant are solved as one batch of 4x4 systems.
+
+Confidence comes from the fit: the weighted residual spread relative to the
+predicted interval, discounted by the effective number of observations.
+
+Settings:
+    WATERING_FORECAST_MODE               mean (Phase 1 average) | regression
+    WATERING_FORECAST_HALF_LIFE_DAYS     recency half-life of the weights
+    WATERING_FORECAST_MAX_INTERVALS      most recent intervals used per plant
+"""
+import os
+import numpy as np
+import pandas as pd
+
+WATERING_FORECAST_MODE = os.getenv("WATERING_FORECAST_MODE", "mean")
+WATERING_FORECAST_HALF_LIFE_DAYS = float(os.getenv("WATERING_FORECAST_HALF_LIFE_DAYS", 60))
+WATERING_FORECAST_MAX_INTERVALS = int(os.getenv("WATERING_FORECAST_MAX_INTERVALS", 30))
+
+# Same threshold as the Phase 1 average (docs/LOGIC.md)
+MIN_WATERINGS = 5
+# Ridge penalty per coefficient: intercept, trend, sin, cos
+RIDGE = np.array([1e-6, 1.0, 4.0, 4.0])
+# Plants solved per batch (bounds the plants x intervals x features arrays)
+CHUNK_PLANTS = 100_000
+DAYS_PER_MONTH = 30.0
+DAYS_PER_YEAR = 365.25
+
+
+def _features(trend_days: np.ndarray, day_of_year: np.ndarray) -> np.ndarray:
+    """[1, trend (months), sin(season), cos(season)] along a new last axis"""
+    angle = 2 * np.pi * day_of_year / DAYS_PER_YEAR
+    return np.stack([np.ones_like(trend_days), trend_days / DAYS_PER_MONTH, np.sin(angle), np.cos(angle)], axis=-1)
+
+
+def padded_intervals(activity_history_df: pd.DataFrame, max_intervals: int = WATERING_FORECAST_MAX_INTERVALS):
+    """
+    Plants x intervals arrays of the plants with at least MIN_WATERINGS waterings
+
+    Same-day waterings (0-day intervals) are left out: they say nothing about the
+    interval, and a plant with only those is not forecast (it keeps the average).
+
+    Args:
+        activity_history_df: plant_id, activity_date (datetime), days_since_last
+    Returns:
+        (plant_ids, intervals, age_days, day_of_year, mask, last_watering) - the
+        (plants, max_intervals) arrays are right-aligned: the last column is the
+        most recent interval; age_days is counted back from the last watering
+    """
+    df = activity_history_df[['plant_id', 'activity_date', 'days_since_last']]
+    df = df[df['days_since_last'] > 0]
+    counts = df.groupby('plant_id', observed=True)['days_since_last'].transform('size')
+    df = df[counts >= MIN_WATERINGS - 1].sort_values(['plant_id', 'activity_date'])
+
+    # Position counted from the most recent interval
+    from_end = df.groupby('plant_id', observed=True).cumcount(ascending=False).to_numpy()
+    keep = from_end < max_intervals
+    df, from_end = df[keep], from_end[keep]
+
+    codes, plant_ids = pd.factorize(df['plant_id'])
+    n_plants = len(plant_ids)
+    dates = df['activity_date'].to_numpy(dtype='datetime64[D]')
+    last_watering = np.empty(n_plants, dtype='datetime64[D]')
+    last_watering[codes[from_end == 0]] = dates[from_end == 0]
+
+    rows, cols = codes, max_intervals - 1 - from_end
+    intervals = np.zeros((n_plants, max_intervals))
+    age_days = np.zeros((n_plants, max_intervals))
+    day_of_year = np.zeros((n_plants, max_intervals))
+    mask = np.zeros((n_plants, max_intervals), dtype=bool)
+    intervals[rows, cols] = df['days_since_last'].to_numpy(dtype='float64')
+    age_days[rows, cols] = (last_watering[codes] - dates).astype('float64')
+    day_of_year[rows, cols] = pd.DatetimeIndex(df['activity_date']).dayofyear.to_numpy(dtype='float64')
+    mask[rows, cols] = True
+    return plant_ids, intervals, age_days, day_of_year, mask, last_watering
+
+
+def _fit_chunk(intervals, age_days, day_of_year, mask, last_watering, half_life_days):
+    """Batched weighted ridge regression of one chunk of plants"""
+    X = _features(-age_days, day_of_year)                                 # (P, K, F)
+    W = mask * np.power(0.5, age_days / half_life_days)                   # (P, K)
+    A = np.einsum('pkf,pk,pkg->pfg', X, W, X) + np.diag(RIDGE)            # (P, F, F)
+    b = np.einsum('pkf,pk,pk->pf', X, W, intervals)                       # (P, F)
+    beta = np.linalg.solve(A, b[..., None])[..., 0]                       # (P, F)
+
+    # Next interval: ends about one (weighted mean) interval after the last watering
+    w_sum = W.sum(axis=1)
+    mean_interval = (W * intervals).sum(axis=1) / w_sum
+    next_day = (pd.DatetimeIndex(last_watering + np.round(mean_interval).astype('timedelta64[D]')).dayofyear
+                .to_numpy(dtype='float64'))
+    x_next = _features(mean_interval, next_day)                            # (P, F)
+    predicted = np.einsum('pf,pf->p', x_next, beta)
+
+    # Stay within the range the plant has actually shown
+    observed_min = np.where(mask, intervals, np.inf).min(axis=1)
+    observed_max = np.where(mask, intervals, -np.inf).max(axis=1)
+    lower = np.maximum(1.0, 0.5 * observed_min)
+    predicted = np.clip(predicted, lower, np.maximum(1.5 * observed_max, lower))
+
+    # Confidence: residual spread vs the prediction, discounted by effective sample size
+    residuals = (intervals - np.einsum('pkf,pf->pk', X, beta)) * mask
+    n_eff = w_sum ** 2 / (W ** 2).sum(axis=1)
+    variance = (W * residuals ** 2).sum(axis=1) / w_sum * n_eff / np.maximum(n_eff - 2, 1)
+    standard_error = np.sqrt(variance * (1 + 1 / n_eff))
+    spread = np.minimum(standard_error / predicted, 1.0)
+    confidence = np.clip((1 - spread) * n_eff / (n_eff + 2), 0.0, 0.95)
+    return predicted, confidence
+
+
+def fit_predict(activity_history_df: pd.DataFrame,
+                half_life_days: float = WATERING_FORECAST_HALF_LIFE_DAYS,
+                max_intervals: int = WATERING_FORECAST_MAX_INTERVALS) -> pd.DataFrame:
+    """
+    Predicted next interval and confidence of every plant with enough history
+
+    Args:
+        activity_history_df: plant_id, activity_date (datetime), days_since_last
+            (days since the previous watering of the plant, NaN for the first)
+    Returns:
+        forecast_df
+            - plant_id
+            - forecast_interval: float (days)
+            - forecast_confidence: float (0.0-0.95)
+    """
+    plant_ids, intervals, age_days, day_of_year, mask, last_watering = padded_intervals(
+        activity_history_df, max_intervals
+    )
+    predicted = np.empty(len(plant_ids))
+    confidence = np.empty(len(plant_ids))
+    for start in range(0, len(plant_ids), CHUNK_PLANTS):
+        chunk = slice(start, start + CHUNK_PLANTS)
+        predicted[chunk], confidence[chunk] = _fit_chunk(
+            intervals[chunk], age_days[chunk], day_of_year[chunk], mask[chunk], last_watering[chunk], half_life_days
+        )
+    return pd.DataFrame({
+        'plant_id': plant_ids,
+        'forecast_interval': predicted,
+        'forecast_confidence': confidence.round(2)
+    })
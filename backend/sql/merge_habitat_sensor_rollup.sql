@@ -0,0 +1,39 @@
+-- Adds the readings flushed by scripts/habitat_sensors.py to habitat_sensor_rollup.
+-- Each row holds only the readings of one bucket since the previous flush of one
+-- process, so stored aggregates are merged, never overwritten.
+--
+-- p_rows: [{habitat_id, metric, granularity, bucket_start, reading_count,
+--           value_sum, value_min, value_max, value_last}]
+create or replace function merge_habitat_sensor_rollup(p_rows jsonb)
+returns void
+language sql
+security definer
+as $$
+    insert into habitat_sensor_rollup as stored (
+        habitat_id, metric, granularity, bucket_start,
+        reading_count, value_avg, value_min, value_max, value_last, modified_at
+    )
+    select
+        (row->>'habitat_id')::uuid,
+        row->>'metric',
+        row->>'granularity',
+        (row->>'bucket_start')::timestamptz,
+        (row->>'reading_count')::integer,
+        (row->>'value_sum')::double precision / (row->>'reading_count')::integer,
+        (row->>'value_min')::double precision,
+        (row->>'value_max')::double precision,
+        (row->>'value_last')::double precision,
+        now()
+    from jsonb_array_elements(p_rows) as row
+    where (row->>'reading_count')::integer > 0
+    on conflict (habitat_id, metric, granularity, bucket_start) do update set
+        -- Right-hand sides read the stored row before the update
+        reading_count = stored.reading_count + excluded.reading_count,
+        value_avg = (stored.value_avg * stored.reading_count + excluded.value_avg * excluded.reading_count)
+                    / (stored.reading_count + excluded.reading_count),
+        value_min = least(stored.value_min, excluded.value_min),
+        value_max = greatest(stored.value_max, excluded.value_max),
+        -- Most recently flushed reading (readings of one bucket arrive in time order)
+        value_last = excluded.value_last,
+        modified_at = now();
+$$;
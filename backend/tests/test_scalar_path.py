@@ -0,0 +1,83 @@
+"""
+Equivalence of the scalar fast path (scripts/scalar_path.py) and the vectorized
+new activity path on seeded random inputs
+"""
+import io
+import json
+import random
+import contextlib
+from datetime import date, datetime, timedelta
+import pandas as pd
+import pytest
+from scripts import scalar_path
+from scripts.manager_new_activity import calculate as vectorized_calculate
+
+SEED = 7
+CASES = 500
+FACTORS = ["watering_due"]
+# Generated IDs are random in both paths, so they are left out of the comparison
+IDS = {'plant_factor_id', 'plant_factor_contribution_id', 'plant_status_id', 'schedule_id'}
+
+
+def seeded_case(case: int):
+    """(new_activity, reads, calculate kwargs) of one seeded case"""
+    rnd = random.Random(f"{SEED}-{case}")
+    today = date(2026, 3, 1) + timedelta(days=rnd.randint(0, 365))
+    plant_id = f"plant-{case}"
+    plant_type_id = rnd.choice(["type-a", "type-b", "type-missing"])
+    new_activity = {
+        "plant_id": plant_id, "activity_type_code": "watering",
+        "activity_date": (today - timedelta(days=rnd.randint(0, 3))).isoformat(),
+        "quantifier": rnd.choice([None, 250.0]), "unit": None, "notes": None, "result": None
+    }
+    reads = {
+        "plant": [{
+            "plant_id": plant_id, "plant_type_id": plant_type_id, "habitat_id": "habitat",
+            "acquisition_date": (today - timedelta(days=rnd.randint(0, 400))).isoformat(),
+            "user_timezone": "America/New_York"
+        }],
+        "plant_type": [
+            {"plant_type_id": "type-a", "watering_interval_days": rnd.randint(1, 21)},
+            {"plant_type_id": "type-b", "watering_interval_days": str(rnd.randint(1, 21))}
+        ],
+        "activity": [
+            {"plant_id": plant_id, "activity_date": (today - timedelta(days=rnd.randint(1, 200))).isoformat(), "quantifier": None}
+            for _ in range(rnd.randint(0, 12))
+        ],
+        "factor_contribution": [
+            {"plant_id": f"plant-{rnd.randint(0, 5)}", "factor_code": rnd.choice(["watering_due", "humidity", "light"]),
+             "severity": rnd.choice([0, 1, 2, 3, None])}
+            for _ in range(rnd.randint(1, 15))
+        ],
+        "factor_lookup": [
+            {"factor_code": "watering_due", "weight": rnd.choice(["1.0", "0.5", 2]), "factor_category": "Water"},
+            {"factor_code": "humidity", "weight": rnd.choice(["0.25", None, 0]), "factor_category": "Environment"}
+        ]
+    }
+    batch_timestamp = datetime.combine(today, datetime.min.time()) + timedelta(minutes=rnd.randint(0, 1439))
+    kwargs = dict(today_date=pd.Timestamp(today), batch_timestamp=batch_timestamp, run_id="check")
+    return new_activity, reads, kwargs
+
+
+def without_ids(results):
+    return {
+        name: sorted(json.dumps({k: v for k, v in row.items() if k not in IDS}, sort_keys=True) for row in rows)
+        for name, rows in results.items()
+    }
+
+
+# Only the cases the fast path accepts (the others always take the vectorized path)
+ACCEPTED = [case for case in range(CASES) if scalar_path.accepts(*seeded_case(case)[:2], FACTORS)]
+
+
+def test_cases_cover_the_fast_path():
+    assert len(ACCEPTED) > CASES // 2
+
+
+@pytest.mark.parametrize("case", ACCEPTED)
+def test_scalar_path_matches_vectorized(case):
+    new_activity, reads, kwargs = seeded_case(case)
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = without_ids(vectorized_calculate(new_activity, reads, FACTORS, stats={'completed': 0, 'errors': 0}, **kwargs))
+    actual = without_ids(scalar_path.calculate(new_activity, reads, FACTORS, stats={'completed': 0, 'errors': 0}, **kwargs))
+    assert actual == expected
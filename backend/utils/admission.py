@@ -0,0 +1,111 @@
+"""
+ADMISSION.PY - Admission control for API routes
+Bounds how many requests of a route run at once. Extra requests wait in a
+bounded queue; when the queue is full (429) or the wait times out (503) the
+request is rejected right away with a Retry-After header.
+
+Settings per route (NAME is the upper-case route name, e.g. NEW_ACTIVITY):
+    ADMISSION_<NAME>_CONCURRENCY     requests running at once
+    ADMISSION_<NAME>_QUEUE           requests allowed to wait
+    ADMISSION_<NAME>_TIMEOUT         seconds a request may wait
+    ADMISSION_<NAME>_RETRY_AFTER     seconds suggested to the client
+"""
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict
+from fastapi import HTTPException
+
+# This dictionary will hold { "route name": <AdmissionController> }
+controllers = {}
+
+
+class AdmissionController:
+    """Concurrency limit with a bounded wait queue for one route"""
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, queue_timeout: float, retry_after: int):
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+
+        # Admission stats tracking
+        self.stats = {
+            "in_flight": 0,
+            "queue_depth": 0,
+            "max_queue_depth": 0,
+            "admitted": 0,
+            "rejected_queue_full": 0,
+            "rejected_timeout": 0,
+            "wait_seconds_total": 0.0
+        }
+
+    def _reject(self, status_code: int, reason: str):
+        raise HTTPException(
+            status_code=status_code,
+            detail=f"{self.name} is saturated: {reason}",
+            headers={"Retry-After": str(self.retry_after)}
+        )
+
+    @asynccontextmanager
+    async def admit(self):
+        """Waits for a slot (or rejects) and holds it for the body of the block"""
+        if not self._semaphore.locked():
+            # Free slot: acquire returns without yielding to the event loop
+            await self._semaphore.acquire()
+        else:
+            if self.stats["queue_depth"] >= self.max_queue:
+                self.stats["rejected_queue_full"] += 1
+                self._reject(429, "too many requests waiting")
+
+            self.stats["queue_depth"] += 1
+            self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self.stats["queue_depth"])
+            wait_start = time.perf_counter()
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.stats["rejected_timeout"] += 1
+                self._reject(503, "timed out waiting for a slot")
+            finally:
+                self.stats["queue_depth"] -= 1
+                self.stats["wait_seconds_total"] += time.perf_counter() - wait_start
+
+        self.stats["admitted"] += 1
+        self.stats["in_flight"] += 1
+        try:
+            yield
+        finally:
+            self.stats["in_flight"] -= 1
+            self._semaphore.release()
+
+    def metrics(self) -> Dict:
+        """Current stats plus the configured limits"""
+        return {
+            **self.stats,
+            "wait_seconds_total": round(self.stats["wait_seconds_total"], 3),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue
+        }
+
+
+def get_controller(name: str, concurrency: int = 4, queue: int = 16, timeout: float = 10,
+                   retry_after: int = 5) -> AdmissionController:
+    """Returns the controller of a route, created from env settings on first use"""
+    if name not in controllers:
+        prefix = f"ADMISSION_{name.upper()}"
+        controllers[name] = AdmissionController(
+            name=name,
+            max_concurrent=int(os.getenv(f"{prefix}_CONCURRENCY", concurrency)),
+            max_queue=int(os.getenv(f"{prefix}_QUEUE", queue)),
+            queue_timeout=float(os.getenv(f"{prefix}_TIMEOUT", timeout)),
+            retry_after=int(os.getenv(f"{prefix}_RETRY_AFTER", retry_after))
+        )
+    return controllers[name]
+
+
+def metrics() -> Dict:
+    """Stats of every route under admission control"""
+    return {name: controller.metrics() for name, controller in controllers.items()}
@@ -0,0 +1,101 @@
+"""
+FRAMES.PY - Compact DataFrame helpers
+Helpers to keep batch frames small:
+- UUID keys as categoricals that share one set of categories per key, so
+  merges between frames run on the integer codes instead of Python strings
+- Severities / status codes as (nullable) int8
+- Dates as day-precision datetimes
+- Memory estimates, chunking and peak RSS for the memory budget mode
+"""
+from typing import Iterator, List, Optional
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def share_categories(frames: List[pd.DataFrame], key: str) -> List[pd.DataFrame]:
+    """
+    Converts `key` to a categorical with the same categories in every frame
+
+    Frames sharing categories merge on their codes (no string hashing) and
+    store each UUID once instead of once per row.
+    """
+    present = [df[key].astype('object') for df in frames if key in df.columns]
+    if not present:
+        return frames
+    categories = pd.Index(pd.unique(pd.concat(present, ignore_index=True).dropna()))
+
+    compacted = []
+    for df in frames:
+        if key in df.columns:
+            df = df.assign(**{key: pd.Categorical(df[key].astype('object'), categories=categories)})
+        compacted.append(df)
+    return compacted
+
+
+def to_int8(df: pd.DataFrame, cols: List[str]) -> pd.DataFrame:
+    """Casts severity-like columns to nullable int8 (missing values stay <NA>)"""
+    for col in cols:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').round().astype('Int8')
+    return df
+
+
+def to_day(df: pd.DataFrame, cols: List[str]) -> pd.DataFrame:
+    """
+    Casts date columns to naive, day-precision datetimes
+
+    pandas has no datetime64[D] dtype; datetime64[s] normalized to midnight is
+    the closest supported unit.
+    """
+    for col in cols:
+        if col in df.columns:
+            values = pd.to_datetime(df[col])
+            if getattr(values.dt, 'tz', None) is not None:
+                values = values.dt.tz_localize(None)
+            df[col] = values.dt.normalize().astype('datetime64[s]')
+    return df
+
+
+def changed(new: pd.Series, old: pd.Series) -> pd.Series:
+    """Boolean mask of rows where a new value exists and differs from the old one"""
+    differs = (new != old)
+    if differs.dtype != bool:
+        # Nullable comparison: a missing old value counts as a change
+        differs = differs.fillna(True).astype(bool)
+    return new.notna().to_numpy() & differs.to_numpy()
+
+
+def memory_mb(*frames: pd.DataFrame) -> float:
+    """Deep memory usage of the frames in MB"""
+    total = sum(int(df.memory_usage(deep=True).sum()) for df in frames if df is not None)
+    return round(total / (1024 * 1024), 2)
+
+
+def partition(df: pd.DataFrame, key: str, n_parts: int) -> Iterator[pd.DataFrame]:
+    """
+    Splits df in n_parts by key, keeping every row of one key in the same part
+
+    Works on the categorical codes (or a hash of the values), so frames that
+    share categories are partitioned consistently.
+    """
+    if n_parts <= 1 or df.empty:
+        yield df
+        return
+    if isinstance(df[key].dtype, pd.CategoricalDtype):
+        bucket = df[key].cat.codes.to_numpy() % n_parts
+    else:
+        bucket = pd.util.hash_array(df[key].astype('object').to_numpy()) % n_parts
+    for part in range(n_parts):
+        yield df[bucket == part]
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process in MB (None where unsupported)"""
+    if resource is None:
+        return None
+    # ru_maxrss is in KB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
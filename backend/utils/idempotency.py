@@ -0,0 +1,129 @@
+"""
+IDEMPOTENCY.PY - Idempotency keys with a replay cache
+Remembers the responses of recent requests by their Idempotency-Key so a
+client retry gets the stored response instead of running the work again.
+
+- A retry with the same key and the same body replays the stored response
+- A duplicate that arrives while the first request is still running waits
+  for it instead of running in parallel
+- The same key with a different body is rejected (422)
+- Failed requests are not stored, so the next retry runs again
+- The store is bounded (oldest entries are evicted first) and entries expire
+
+Settings:
+    IDEMPOTENCY_MAX_ENTRIES     responses kept in memory
+    IDEMPOTENCY_TTL_SECONDS     how long a response is replayed
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from fastapi import HTTPException
+
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", 1000))
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", 24 * 3600))
+
+
+def fingerprint(body: Dict) -> str:
+    """Stable hash of a request body"""
+    return hashlib.sha256(json.dumps(body, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """Bounded in-memory store of responses by idempotency key"""
+
+    def __init__(self, max_entries: int = IDEMPOTENCY_MAX_ENTRIES, ttl_seconds: float = IDEMPOTENCY_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # { key: {'fingerprint', 'future', 'expires_at'} }
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+
+        # Idempotency stats tracking
+        self.stats = {
+            "executed": 0,
+            "replayed": 0,
+            "waited": 0,
+            "conflicts": 0,
+            "evicted": 0
+        }
+
+    def _expire(self):
+        now = time.monotonic()
+        for key in [key for key, entry in self._entries.items() if entry['expires_at'] < now]:
+            del self._entries[key]
+
+    def _evict(self):
+        """Drops the oldest finished entries above max_entries (running ones are kept)"""
+        while len(self._entries) > self.max_entries:
+            for key, entry in self._entries.items():
+                if entry['future'].done():
+                    del self._entries[key]
+                    self.stats["evicted"] += 1
+                    break
+            else:
+                return
+
+    async def run(self, key: str, body_fingerprint: str, fn: Callable[[], Awaitable[Any]],
+                  should_store: Optional[Callable[[Any], bool]] = None) -> Tuple[Any, bool]:
+        """
+        Runs fn once per key
+
+        Args:
+            key: idempotency key (scoped by the caller, e.g. "route:key")
+            body_fingerprint: fingerprint() of the request body
+            fn: coroutine function doing the work
+            should_store: predicate on the response; responses it rejects are not replayed
+        Returns:
+            (response, replayed)
+        """
+        while True:
+            self._expire()
+            entry = self._entries.get(key)
+
+            if entry is None:
+                break
+
+            if entry['fingerprint'] != body_fingerprint:
+                self.stats["conflicts"] += 1
+                raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request body")
+
+            future = entry['future']
+            if future.done():
+                self._entries.move_to_end(key)
+                self.stats["replayed"] += 1
+                return future.result(), True
+
+            # Same request still running: wait for it, then look again (it may have failed)
+            self.stats["waited"] += 1
+            await asyncio.wait({future})
+
+        future = asyncio.get_running_loop().create_future()
+        self._entries[key] = {
+            'fingerprint': body_fingerprint,
+            'future': future,
+            'expires_at': time.monotonic() + self.ttl_seconds
+        }
+        self._evict()
+
+        self.stats["executed"] += 1
+        try:
+            response = await fn()
+        except BaseException:
+            # Not stored: waiting duplicates and later retries run the work themselves
+            self._entries.pop(key, None)
+            future.cancel()
+            raise
+
+        if should_store is not None and not should_store(response):
+            self._entries.pop(key, None)
+            future.cancel()
+        else:
+            future.set_result(response)
+        return response, False
+
+    def metrics(self) -> Dict:
+        """Current stats plus the number of stored entries"""
+        return {**self.stats, "entries": len(self._entries), "max_entries": self.max_entries}
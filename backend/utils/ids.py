@@ -0,0 +1,48 @@
+"""
+IDS.PY - Row ID generation
+Every calculator creates its row IDs here instead of calling uuid.uuid4()
+directly, so a replay can make them deterministic with seeded_ids().
+"""
+import uuid
+import random
+import threading
+from contextlib import contextmanager
+from typing import List
+
+# Seeded generator per thread (None = random uuid4)
+_local = threading.local()
+
+
+def new_id() -> str:
+    """A new UUID4 string (deterministic inside seeded_ids())"""
+    rng = getattr(_local, 'rng', None)
+    if rng is None:
+        return str(uuid.uuid4())
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def new_ids(n: int) -> List[str]:
+    """n new UUID4 strings"""
+    return [new_id() for _ in range(n)]
+
+
+@contextmanager
+def seeded_ids(seed: int):
+    """IDs created by this thread inside the block follow a fixed sequence"""
+    previous = getattr(_local, 'rng', None)
+    _local.rng = random.Random(seed)
+    try:
+        yield
+    finally:
+        _local.rng = previous
+
+
+def derive_seed():
+    """
+    Seed for work handed to another thread or process (None when not seeded)
+
+    Drawn from this thread's sequence, so a replay hands out the same seeds in
+    the same order.
+    """
+    rng = getattr(_local, 'rng', None)
+    return None if rng is None else rng.getrandbits(64)
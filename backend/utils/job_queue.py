@@ -0,0 +1,334 @@
+"""
+JOB_QUEUE.PY - Durable local job queue
+Keeps long running jobs (daily batch, ...) in a local SQLite file so they
+survive a restart of the API process.
+
+- At-least-once: a job is leased to one worker; if the lease expires (the
+  process died or stopped heartbeating) the job becomes claimable again.
+- Dedupe: a job can carry a dedupe key (e.g. the logical run date); enqueueing
+  the same kind + key again returns the existing job instead of a new one.
+- Bounded concurrency: JobWorker never runs more than `concurrency` jobs.
+- Progress: a running job's handler can call report_progress(); the progress
+  is kept in the job's result until the final result replaces it.
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "local_data/jobs.sqlite3")
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 60))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", 1))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", 2))
+
+# Job run by the current thread (set by JobWorker, read by report_progress)
+_current = threading.local()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS job (
+    job_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    dedupe_key TEXT,
+    payload TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    lease_owner TEXT,
+    lease_expires_at REAL,
+    result TEXT,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    UNIQUE (kind, dedupe_key)
+);
+CREATE INDEX IF NOT EXISTS job_status_idx ON job (status, created_at);
+"""
+
+
+class JobQueue:
+    """SQLite backed queue of jobs with leases"""
+
+    def __init__(self, path: str = JOB_QUEUE_PATH, lease_seconds: int = JOB_LEASE_SECONDS,
+                 max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection (one per call, connections are not shared between threads)"""
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @staticmethod
+    def _to_dict(row: Optional[sqlite3.Row]) -> Optional[Dict]:
+        if row is None:
+            return None
+        job = dict(row)
+        job['payload'] = json.loads(job['payload']) if job['payload'] else {}
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def enqueue(self, kind: str, payload: Optional[Dict] = None, dedupe_key: Optional[str] = None) -> Dict:
+        """
+        Adds a job to the queue
+
+        If a job with the same kind and dedupe key exists it is returned as is,
+        unless it has failed for good, in which case it is queued again.
+
+        Returns:
+            Dict with the job and 'created': True when a new run was queued
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            existing = None
+            if dedupe_key is not None:
+                existing = conn.execute(
+                    "SELECT * FROM job WHERE kind = ? AND dedupe_key = ?", (kind, dedupe_key)
+                ).fetchone()
+
+            if existing is not None and existing['status'] != 'failed':
+                conn.execute("COMMIT")
+                job = self._to_dict(existing)
+                job['created'] = False
+                return job
+
+            if existing is not None:
+                # Failed for good: give it a fresh set of attempts
+                job_id = existing['job_id']
+                conn.execute(
+                    "UPDATE job SET status = 'queued', attempts = 0, payload = ?, lease_owner = NULL, "
+                    "lease_expires_at = NULL, last_error = NULL, updated_at = ? WHERE job_id = ?",
+                    (json.dumps(payload or {}), now, job_id)
+                )
+            else:
+                job_id = str(uuid.uuid4())
+                conn.execute(
+                    "INSERT INTO job (job_id, kind, dedupe_key, payload, status, max_attempts, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, 'queued', ?, ?, ?)",
+                    (job_id, kind, dedupe_key, json.dumps(payload or {}), self.max_attempts, now, now)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        job = self.get(job_id)
+        job['created'] = True
+        return job
+
+    def claim(self, worker_id: str, kinds: Optional[List[str]] = None) -> Optional[Dict]:
+        """
+        Leases the oldest runnable job to worker_id
+
+        Runnable means queued, or running with an expired lease (its worker is gone).
+        Jobs that ran out of attempts are marked as failed instead.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # Jobs whose lease expired after their last attempt are given up on
+            conn.execute(
+                "UPDATE job SET status = 'failed', lease_owner = NULL, updated_at = ?, "
+                "last_error = COALESCE(last_error, 'lease expired') "
+                "WHERE status = 'running' AND lease_expires_at < ? AND attempts >= max_attempts",
+                (now, now)
+            )
+            query = ("SELECT * FROM job WHERE (status = 'queued' "
+                     "OR (status = 'running' AND lease_expires_at < ?))")
+            params: List[Any] = [now]
+            if kinds:
+                query += f" AND kind IN ({','.join('?' for _ in kinds)})"
+                params.extend(kinds)
+            query += " ORDER BY created_at LIMIT 1"
+            row = conn.execute(query, params).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            conn.execute(
+                "UPDATE job SET status = 'running', attempts = attempts + 1, lease_owner = ?, "
+                "lease_expires_at = ?, updated_at = ? WHERE job_id = ?",
+                (worker_id, now + self.lease_seconds, now, row['job_id'])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        return self.get(row['job_id'])
+
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        """Extends the lease; returns False if the job is no longer owned by worker_id"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE job SET lease_expires_at = ?, updated_at = ? "
+                "WHERE job_id = ? AND lease_owner = ? AND status = 'running'",
+                (now + self.lease_seconds, now, job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id: str, worker_id: str, result: Any = None) -> bool:
+        """Marks a leased job as done"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE job SET status = 'done', result = ?, lease_owner = NULL, lease_expires_at = NULL, "
+                "updated_at = ? WHERE job_id = ? AND lease_owner = ?",
+                (json.dumps(result, default=str), now, job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def progress(self, job_id: str, worker_id: str, progress: Any) -> bool:
+        """Stores the progress of a leased job in its result (until complete() replaces it)"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE job SET result = ?, updated_at = ? "
+                "WHERE job_id = ? AND lease_owner = ? AND status = 'running'",
+                (json.dumps(progress, default=str), now, job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, job_id: str, worker_id: str, error: str) -> bool:
+        """Releases a leased job after an error; it is retried until max_attempts"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE job SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END, "
+                "last_error = ?, lease_owner = NULL, lease_expires_at = NULL, updated_at = ? "
+                "WHERE job_id = ? AND lease_owner = ?",
+                (error, now, job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Returns a job by id"""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM job WHERE job_id = ?", (job_id,)).fetchone()
+        return self._to_dict(row)
+
+    def finished_since(self, since: float, kinds: Optional[List[str]] = None) -> List[Dict]:
+        """Jobs completed after a time (for processes that react to another process's jobs)"""
+        query = "SELECT * FROM job WHERE status = 'done' AND updated_at > ?"
+        params: List[Any] = [since]
+        if kinds:
+            query += f" AND kind IN ({','.join('?' for _ in kinds)})"
+            params.extend(kinds)
+        with closing(self._connect()) as conn:
+            rows = conn.execute(query + " ORDER BY updated_at", params).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs per status"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM job GROUP BY status").fetchall()
+        return {row['status']: row['n'] for row in rows}
+
+
+def report_progress(progress: Any) -> bool:
+    """Progress of the job running in this thread; no-op (False) outside a job"""
+    job = getattr(_current, "job", None)
+    if job is None:
+        return False
+    queue, job_id, worker_id = job
+    return queue.progress(job_id, worker_id, progress)
+
+
+class JobWorker:
+    """Polls the queue and runs jobs with bounded concurrency"""
+
+    def __init__(self, queue: JobQueue, handlers: Dict[str, Callable[[Dict], Any]],
+                 concurrency: int = JOB_CONCURRENCY, poll_seconds: float = JOB_POLL_SECONDS):
+        self.queue = queue
+        self.handlers = handlers
+        self.concurrency = max(1, concurrency)
+        self.poll_seconds = poll_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Starts the polling loop in a daemon thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="job-worker", daemon=True)
+        self._thread.start()
+        print(f"✓ Job worker {self.worker_id} started (concurrency {self.concurrency})")
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stops claiming new jobs; running jobs keep their lease until they finish"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            # Wait for a free slot before claiming, so leases are only taken when we can run them
+            if not self._slots.acquire(timeout=self.poll_seconds):
+                continue
+            try:
+                job = self.queue.claim(self.worker_id, kinds=list(self.handlers))
+            except Exception as e:
+                print(f"❌ Error claiming job: {str(e)}")
+                job = None
+
+            if job is None:
+                self._slots.release()
+                self._stop.wait(self.poll_seconds)
+                continue
+
+            threading.Thread(target=self._execute, args=(job,), name=f"job-{job['job_id'][:8]}", daemon=True).start()
+
+    def _execute(self, job: Dict):
+        """Runs one job while a side thread keeps its lease alive"""
+        done = threading.Event()
+
+        def keep_alive():
+            interval = max(1.0, self.queue.lease_seconds / 3)
+            while not done.wait(interval):
+                if not self.queue.heartbeat(job['job_id'], self.worker_id):
+                    print(f"Warning: lost lease on job {job['job_id']}")
+                    return
+
+        heartbeat = threading.Thread(target=keep_alive, daemon=True)
+        heartbeat.start()
+
+        print(f"\n▶ Running job {job['kind']} {job['job_id']} (attempt {job['attempts']})")
+        _current.job = (self.queue, job['job_id'], self.worker_id)
+        try:
+            result = self.handlers[job['kind']](job['payload'])
+            self.queue.complete(job['job_id'], self.worker_id, result)
+            print(f"✓ Completed job {job['job_id']}")
+        except Exception as e:
+            print(f"❌ Error in job {job['job_id']}: {str(e)}")
+            self.queue.fail(job['job_id'], self.worker_id, f"{datetime.now().isoformat()} {str(e)}")
+        finally:
+            _current.job = None
+            done.set()
+            self._slots.release()
@@ -0,0 +1,144 @@
+"""
+LANES.PY - Per-key serialized execution lanes for API routes
+Requests for the same key (e.g. the plant of a new activity) run one at a time,
+in arrival order; requests for different keys run in parallel, up to the
+route's admission limit (utils/admission.py). A lane only exists while a
+request holds or waits for it, so memory follows the keys in flight.
+
+When too many requests wait for one key (429) or the wait times out (503) the
+request is rejected right away with a Retry-After header, like admission.
+
+Lanes serialize within one API process: with several processes, requests for
+a key must reach the same process.
+
+Settings per lane set (NAME is the upper-case lane name, e.g. PLANT):
+    LANES_<NAME>_QUEUE          requests allowed to wait per key
+    LANES_<NAME>_TIMEOUT        seconds a request may wait for its key
+    LANES_<NAME>_RETRY_AFTER    seconds suggested to the client
+"""
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, Hashable
+from fastapi import HTTPException
+
+# This dictionary will hold { "lane set name": <KeyedLanes> }
+lane_sets = {}
+
+
+class _Lane:
+    """Lock of one key, with the number of requests holding or waiting for it"""
+
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class KeyedLanes:
+    """One FIFO lane per key; different keys never wait for each other"""
+
+    def __init__(self, name: str, max_queue: int, queue_timeout: float, retry_after: int):
+        self.name = name
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        # { key: _Lane } of the keys in flight
+        self._lanes: Dict[Hashable, _Lane] = {}
+
+        # Lane stats tracking
+        self.stats = {
+            "running": 0,
+            "waiting": 0,
+            "max_lanes": 0,
+            "max_lane_depth": 0,
+            "entered": 0,
+            "waited": 0,
+            "rejected_queue_full": 0,
+            "rejected_timeout": 0,
+            "wait_seconds_total": 0.0
+        }
+
+    def _reject(self, status_code: int, reason: str):
+        raise HTTPException(
+            status_code=status_code,
+            detail=f"{self.name} lane is busy: {reason}",
+            headers={"Retry-After": str(self.retry_after)}
+        )
+
+    @asynccontextmanager
+    async def lane(self, key: Hashable):
+        """Waits for the key's lane (or rejects) and holds it for the body of the block"""
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = _Lane()
+            self.stats["max_lanes"] = max(self.stats["max_lanes"], len(self._lanes))
+        lane.users += 1
+        try:
+            # Requests ahead (holding or waiting, even between a release and the next wakeup),
+            # counted only by lane.users and checked on every entry
+            ahead = lane.users - 1
+            if ahead > self.max_queue:
+                self.stats["rejected_queue_full"] += 1
+                self._reject(429, "too many requests waiting for the same key")
+
+            if ahead == 0:
+                # Free lane: acquire returns without yielding to the event loop
+                await lane.lock.acquire()
+            else:
+                self.stats["waiting"] += 1
+                self.stats["waited"] += 1
+                self.stats["max_lane_depth"] = max(self.stats["max_lane_depth"], lane.users)
+                wait_start = time.perf_counter()
+                try:
+                    await asyncio.wait_for(lane.lock.acquire(), timeout=self.queue_timeout)
+                except asyncio.TimeoutError:
+                    self.stats["rejected_timeout"] += 1
+                    self._reject(503, "timed out waiting for the same key")
+                finally:
+                    self.stats["waiting"] -= 1
+                    self.stats["wait_seconds_total"] += time.perf_counter() - wait_start
+
+            self.stats["entered"] += 1
+            self.stats["running"] += 1
+            try:
+                yield
+            finally:
+                self.stats["running"] -= 1
+                lane.lock.release()
+        finally:
+            lane.users -= 1
+            if lane.users == 0:
+                del self._lanes[key]
+
+    def metrics(self) -> Dict:
+        """Current stats, lane occupancy and the configured limits"""
+        depths = sorted((lane.users for lane in self._lanes.values()), reverse=True)
+        return {
+            **self.stats,
+            "wait_seconds_total": round(self.stats["wait_seconds_total"], 3),
+            "lanes": len(depths),
+            "lanes_with_waiters": sum(depth > 1 for depth in depths),
+            "deepest_lane": depths[0] if depths else 0,
+            "max_queue": self.max_queue
+        }
+
+
+def get_lanes(name: str, queue: int = 8, timeout: float = 30, retry_after: int = 5) -> KeyedLanes:
+    """Returns the lane set of a name, created from env settings on first use"""
+    if name not in lane_sets:
+        prefix = f"LANES_{name.upper()}"
+        lane_sets[name] = KeyedLanes(
+            name=name,
+            max_queue=int(os.getenv(f"{prefix}_QUEUE", queue)),
+            queue_timeout=float(os.getenv(f"{prefix}_TIMEOUT", timeout)),
+            retry_after=int(os.getenv(f"{prefix}_RETRY_AFTER", retry_after))
+        )
+    return lane_sets[name]
+
+
+def metrics() -> Dict:
+    """Stats of every lane set"""
+    return {name: lane_set.metrics() for name, lane_set in lane_sets.items()}
@@ -0,0 +1,334 @@
+"""
+RESILIENCE.PY - Resilient Supabase access
+Wraps the Supabase client so every `.execute()` of a table query or RPC goes
+through one policy, without changing the orchestrators' query code:
+
+- Timeout:   the call is abandoned after `timeout` seconds (DatabaseTimeout)
+- Retries:   failed reads are retried with full-jitter exponential backoff;
+             writes and RPCs are not retried unless their policy says so
+             (only transport errors and timeouts are retried: an error
+             response from PostgREST is an answer, not an outage)
+- Breaker:   after `DB_BREAKER_FAILURES` consecutive transport errors or
+             timeouts, calls fail fast with CircuitOpenError for
+             `DB_BREAKER_RESET_SECONDS`, then one trial call is let through
+- Hedging:   a read still running after the recent p`DB_HEDGE_PERCENTILE`
+             latency of its table gets a duplicate request; the first answer wins
+- Coalescing: identical concurrent reads (same table, columns, filters and
+             headers) share one in-flight request: the first caller runs it,
+             the others wait for its response (or its error). Responses are
+             shared, so callers must not modify `.data` in place
+
+Policies are per table ("schedule") or RPC ("rpc:run_daily_batch"), layered
+over the defaults below with DB_POLICIES, e.g.
+    DB_POLICIES='{"rpc:run_daily_batch": {"timeout": 300},
+                  "plant_activity_history": {"hedge": true, "retries": 3}}'
+Keys: timeout, retries, hedge, breaker (breaker group name; tables share the
+"supabase" breaker unless given their own).
+
+Settings:
+    DB_RESILIENCE_ENABLED       true | false (false: the bare client)
+    DB_READ_TIMEOUT_SECONDS     default timeout of table reads
+    DB_WRITE_TIMEOUT_SECONDS    default timeout of writes and RPCs
+    DB_READ_RETRIES             default retries of table reads
+    DB_RETRY_BASE_MS            backoff base (attempt n waits up to base * 2^n)
+    DB_HEDGE_READS              hedge table reads by default
+    DB_COALESCE_READS           share identical concurrent table reads
+    DB_HEDGE_PERCENTILE         latency percentile after which a read is hedged
+    DB_HEDGE_MIN_SAMPLES        latencies needed before hedging starts
+    DB_BREAKER_FAILURES         consecutive failures that open the breaker
+    DB_BREAKER_RESET_SECONDS    open time before a trial call
+    DB_WORKERS                  threads running the calls
+    DB_POLICIES                 JSON of per table / RPC overrides
+"""
+import os
+import json
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, Hashable, Optional
+import httpx
+
+DB_RESILIENCE_ENABLED = os.getenv("DB_RESILIENCE_ENABLED", "true").lower() == "true"
+DB_READ_TIMEOUT_SECONDS = float(os.getenv("DB_READ_TIMEOUT_SECONDS", 15))
+DB_WRITE_TIMEOUT_SECONDS = float(os.getenv("DB_WRITE_TIMEOUT_SECONDS", 120))
+DB_READ_RETRIES = int(os.getenv("DB_READ_RETRIES", 2))
+DB_RETRY_BASE_MS = float(os.getenv("DB_RETRY_BASE_MS", 100))
+DB_HEDGE_READS = os.getenv("DB_HEDGE_READS", "false").lower() == "true"
+DB_COALESCE_READS = os.getenv("DB_COALESCE_READS", "true").lower() == "true"
+DB_HEDGE_PERCENTILE = float(os.getenv("DB_HEDGE_PERCENTILE", 95))
+DB_HEDGE_MIN_SAMPLES = int(os.getenv("DB_HEDGE_MIN_SAMPLES", 20))
+DB_BREAKER_FAILURES = int(os.getenv("DB_BREAKER_FAILURES", 5))
+DB_BREAKER_RESET_SECONDS = float(os.getenv("DB_BREAKER_RESET_SECONDS", 30))
+DB_WORKERS = int(os.getenv("DB_WORKERS", 32))
+DB_POLICIES = json.loads(os.getenv("DB_POLICIES", "") or "{}")
+
+# Builder methods that make a table query a write
+WRITE_METHODS = {"insert", "upsert", "update", "delete"}
+LATENCY_SAMPLES = 200
+
+
+class DatabaseTimeout(TimeoutError):
+    """A call did not answer within its policy's timeout"""
+
+
+class CircuitOpenError(RuntimeError):
+    """The breaker is open: the backend failed repeatedly and is not called for now"""
+
+
+# Outages (worth a retry, counted by the breaker)
+RETRYABLE = (httpx.TransportError, DatabaseTimeout)
+
+
+def policy_for(name: str, kind: str) -> Dict[str, Any]:
+    """Defaults for the kind of call (read | write | rpc), overridden by DB_POLICIES[name]"""
+    read = kind == "read"
+    policy = {
+        "timeout": DB_READ_TIMEOUT_SECONDS if read else DB_WRITE_TIMEOUT_SECONDS,
+        "retries": DB_READ_RETRIES if read else 0,
+        "hedge": DB_HEDGE_READS and read,
+        "breaker": "supabase"
+    }
+    policy.update(DB_POLICIES.get(name, {}))
+    return policy
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half open (one trial) -> closed"""
+
+    def __init__(self, failures: int = DB_BREAKER_FAILURES, reset_seconds: float = DB_BREAKER_RESET_SECONDS):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._consecutive = 0
+        self._opened_at: Optional[float] = None
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self._opened_at >= self.reset_seconds else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_seconds or self._trial:
+                return False
+            self._trial = True
+            return True
+
+    def success(self):
+        with self._lock:
+            self._consecutive = 0
+            self._opened_at = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self._consecutive += 1
+            if self._trial or self._consecutive >= self.failures:
+                self._opened_at = time.monotonic()
+            self._trial = False
+
+
+class Resilience:
+    """Runs `.execute()` calls under their policy; shared by every wrapped client of the process"""
+
+    def __init__(self, workers: int = DB_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db")
+        self._lock = threading.Lock()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latencies: Dict[str, deque] = {}
+        self._inflight: Dict[Hashable, Future] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, name: str, field: str):
+        with self._lock:
+            counters = self.stats.setdefault(name, {"calls": 0, "errors": 0, "retries": 0, "timeouts": 0,
+                                                    "hedges": 0, "hedge_wins": 0, "rejected": 0,
+                                                    "coalesced": 0})
+            counters[field] += 1
+
+    def _breaker(self, group: str) -> CircuitBreaker:
+        with self._lock:
+            if group not in self._breakers:
+                self._breakers[group] = CircuitBreaker()
+            return self._breakers[group]
+
+    def _hedge_delay(self, name: str) -> Optional[float]:
+        """Recent p-th percentile latency of a table, None until there are enough samples"""
+        with self._lock:
+            samples = sorted(self._latencies.get(name, ()))
+        if len(samples) < DB_HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * DB_HEDGE_PERCENTILE / 100))]
+
+    def _record_latency(self, name: str, seconds: float):
+        with self._lock:
+            self._latencies.setdefault(name, deque(maxlen=LATENCY_SAMPLES)).append(seconds)
+
+    def _attempt(self, name: str, fn: Callable, timeout: float, hedge: bool):
+        """One call (plus its hedge), bounded by the timeout"""
+        started = time.monotonic()
+        deadline = started + timeout
+        futures = [self._executor.submit(fn)]
+        hedge_delay = self._hedge_delay(name) if hedge else None
+        if hedge_delay is not None and hedge_delay < timeout:
+            done, _ = wait(futures, timeout=hedge_delay)
+            if not done:
+                futures.append(self._executor.submit(fn))
+                self._count(name, "hedges")
+
+        first = futures[0]
+        error = None
+        while futures:
+            done, _ = wait(futures, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                self._count(name, "timeouts")
+                raise DatabaseTimeout(f"{name} did not answer within {timeout}s")
+            for future in done:
+                futures.remove(future)
+                if future.exception() is None:
+                    self._record_latency(name, time.monotonic() - started)
+                    if future is not first:
+                        self._count(name, "hedge_wins")
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+    def call(self, name: str, kind: str, fn: Callable):
+        """Executes fn (a builder's execute) under the policy of name"""
+        policy = policy_for(name, kind)
+        breaker = self._breaker(policy["breaker"])
+        self._count(name, "calls")
+        attempts = 1 + max(0, int(policy["retries"]))
+        for attempt in range(attempts):
+            if not breaker.allow():
+                self._count(name, "rejected")
+                raise CircuitOpenError(f"Database unavailable (breaker '{policy['breaker']}' open), {name} not called")
+            try:
+                result = self._attempt(name, fn, float(policy["timeout"]), bool(policy["hedge"]))
+            except RETRYABLE as e:
+                breaker.failure()
+                if attempt == attempts - 1:
+                    self._count(name, "errors")
+                    raise
+                self._count(name, "retries")
+                print(f"Warning: {name} failed ({type(e).__name__}), retry {attempt + 1}/{attempts - 1}")
+                time.sleep(random.uniform(0, DB_RETRY_BASE_MS * 2 ** attempt) / 1000)
+                continue
+            except Exception:
+                # An error response: the backend is up
+                breaker.success()
+                self._count(name, "errors")
+                raise
+            breaker.success()
+            return result
+
+    def read(self, name: str, key: Optional[Hashable], fn: Callable):
+        """Executes a table read, joining an identical read already in flight (same key) instead of sending it again"""
+        if key is None or not DB_COALESCE_READS:
+            return self.call(name, "read", fn)
+        with self._lock:
+            pending = self._inflight.get(key)
+            leader = pending is None
+            if leader:
+                pending = self._inflight[key] = Future()
+        if not leader:
+            self._count(name, "coalesced")
+            # The leader's call is bounded by its timeout and retries
+            return pending.result()
+
+        try:
+            result = self.call(name, "read", fn)
+        except BaseException as e:
+            pending.set_exception(e)
+            raise
+        else:
+            pending.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            stats = {name: dict(counters) for name, counters in self.stats.items()}
+            groups = list(self._breakers.items())
+            inflight = len(self._inflight)
+        coalesced = sum(counters["coalesced"] for counters in stats.values())
+        return {"breakers": {group: breaker.state for group, breaker in groups}, "coalesced": coalesced,
+                "inflight_reads": inflight, "calls": stats}
+
+
+class _Query:
+    """Query builder proxy: chains like the builder, routes execute() through Resilience"""
+
+    def __init__(self, resilience: Resilience, builder, name: str, kind: str):
+        self._resilience = resilience
+        self._builder = builder
+        self._name = name
+        self._kind = kind
+
+    def _read_key(self) -> Optional[Hashable]:
+        """Identity of a GET request (path, query string, headers); None when it cannot be told"""
+        request = getattr(self._builder, "request", None)
+        if request is None or getattr(request, "http_method", None) != "GET":
+            return None
+        return (str(request.path), str(request.params), tuple(sorted(request.headers.items())))
+
+    def execute(self):
+        if self._kind == "read":
+            return self._resilience.read(self._name, self._read_key(), self._builder.execute)
+        return self._resilience.call(self._name, self._kind, self._builder.execute)
+
+    def __getattr__(self, attr):
+        value = getattr(self._builder, attr)
+        kind = "write" if attr in WRITE_METHODS else self._kind
+        if hasattr(value, "execute"):
+            return _Query(self._resilience, value, self._name, kind)
+        if not callable(value):
+            return value
+
+        def chained(*args, **kwargs):
+            result = value(*args, **kwargs)
+            return _Query(self._resilience, result, self._name, kind) if hasattr(result, "execute") else result
+        return chained
+
+
+class ResilientClient:
+    """Supabase client whose table queries and RPCs run under their resilience policy"""
+
+    def __init__(self, client, resilience: Optional[Resilience] = None):
+        self._client = client
+        self._resilience = resilience or shared()
+
+    def table(self, name: str) -> _Query:
+        return _Query(self._resilience, self._client.table(name), name, "read")
+
+    def rpc(self, name: str, params: Optional[Dict] = None, *args, **kwargs) -> _Query:
+        return _Query(self._resilience, self._client.rpc(name, params or {}, *args, **kwargs), f"rpc:{name}", "rpc")
+
+    def __getattr__(self, attr):
+        return getattr(self._client, attr)
+
+
+_shared: Optional[Resilience] = None
+_shared_lock = threading.Lock()
+
+
+def shared() -> Resilience:
+    """The process-wide Resilience (breakers and latencies are per process)"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = Resilience()
+        return _shared
+
+
+def metrics() -> Optional[Dict]:
+    return _shared.metrics() if _shared is not None else None
@@ -4,8 +4,10 @@ Provides a reusable connection to the Supabase database.
 Import this module in other scripts to access the database.
 """
 import os
+import threading
 from dotenv import load_dotenv
 from supabase import create_client, Client
+from utils.resilience import ResilientClient, DB_RESILIENCE_ENABLED
 
 # Load environment variables
 load_dotenv()
@@ -15,10 +17,16 @@ load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 
+# One client per process: creating one costs ~100 ms and its HTTP pool is thread-safe
+_client = None
+_client_lock = threading.Lock()
+
 def get_client() -> Client:
     """
     Create and return a Supabase client instance for server-side scripts.
     Uses service_role key to bypass RLS.
+    The client is created once per process and shared; its table queries and
+    RPCs run with timeouts, retries and a circuit breaker (utils/resilience.py).
 
     Returns:
         Client: Authenticated Supabase client
@@ -36,13 +44,18 @@ def get_client() -> Client:
             f"SUPABASE_SERVICE_KEY: {'✓' if SUPABASE_SERVICE_KEY else '✗'}"
         )
     
-    try:
-        supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
-        print(f"✓ Supabase client created successfully!")
-        return supabase
-    except Exception as e:
-        print(f"Error creating Supabase client: {e}")
-        raise
+    global _client
+    with _client_lock:
+        if _client is not None:
+            return _client
+        try:
+            supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+            print(f"✓ Supabase client created successfully!")
+        except Exception as e:
+            print(f"Error creating Supabase client: {e}")
+            raise
+        _client = ResilientClient(supabase) if DB_RESILIENCE_ENABLED else supabase
+        return _client
 
 # Test connection when run directly
 if __name__ == "__main__":
@@ -0,0 +1,183 @@
+# backend/worker.py
+"""
+WORKER.PY - Batch worker process
+Runs the queued jobs (daily batch, activity imports, lookup changes, ...) outside the API process, so a batch's
+pandas work and large allocations never compete with request serving for the
+GIL or memory. The API only enqueues; jobs reach the worker through the local
+SQLite job queue (utils/job_queue.py), whose leases already make it safe for
+several processes to claim from.
+
+Modes (JOB_WORKER_MODE):
+    process     app.py starts the worker as a child process and restarts it
+                if it dies (default)
+    external    the API never runs jobs; run `python worker.py` as its own
+                service next to the API (same JOB_QUEUE_PATH)
+    inline      worker threads inside the API process (previous behaviour)
+
+Outside inline mode the jobs read and write the database directly: the worker
+keeps no state store (scripts/state_store.py), because it would not see the
+writes of the API process and would need a full reload before every job,
+which costs more than the batch's own read (see docs/DECISIONS.md). The API's
+state store is reconciled as soon as a job that wrote rows completes.
+
+Settings:
+    JOB_WORKER_MODE     process | external | inline
+    JOB_WORKER_NICE     niceness added to the worker process (CPU priority below the API)
+"""
+import os
+import time
+import signal
+import threading
+import multiprocessing
+from functools import partial
+from typing import Callable, Dict, Optional
+from dotenv import load_dotenv
+
+# Load environment variables from .env
+load_dotenv()
+
+from scripts.manager_daily import DailyBatch
+from scripts.activity_import import ActivityImport
+from scripts import dependencies, factor_pool
+from utils.supabase_client import get_client
+from utils.job_queue import JobQueue, JobWorker, JOB_POLL_SECONDS, report_progress
+
+JOB_WORKER_MODE = os.getenv("JOB_WORKER_MODE", "process")
+JOB_WORKER_NICE = int(os.getenv("JOB_WORKER_NICE", 10))
+
+
+# ============================================
+# JOB HANDLERS
+# ============================================
+def run_daily_batch_job(payload, state_store=None):
+    """Job handler: runs the daily batch for the job's logical run date (and timezone in rolling mode)"""
+    batch = DailyBatch(run_date=payload.get("run_date"), timezone=payload.get("timezone"), state_store=state_store)
+    return batch.run()
+
+
+def run_activity_import_job(payload, state_store=None):
+    """Job handler: imports an uploaded activity file; the running stats are the job's progress"""
+    path = payload["path"]
+    with open(path, newline='', encoding='utf-8-sig') as lines:
+        stats = ActivityImport(payload["user_id"], get_client(), state_store=state_store,
+                               progress=report_progress).run(lines, payload["format"])
+    # Kept until now so a retried job can read it again
+    os.remove(path)
+    return stats
+
+
+def run_lookup_change_job(payload, state_store=None):
+    """Job handler: recalculates the plants that depend on a changed lookup row"""
+    return dependencies.recompute(payload, get_client(), state_store=state_store, progress=report_progress)
+
+
+def handlers(state_store=None) -> Dict[str, Callable]:
+    """Job kind -> handler"""
+    return {
+        "daily_batch": partial(run_daily_batch_job, state_store=state_store),
+        "activity_import": partial(run_activity_import_job, state_store=state_store),
+        "lookup_change": partial(run_lookup_change_job, state_store=state_store)
+    }
+
+
+# ============================================
+# WORKER PROCESS
+# ============================================
+def run(stop_event=None):
+    """Runs jobs until stop_event is set (or SIGTERM / SIGINT when standalone)"""
+    stop_event = stop_event or threading.Event()
+    if JOB_WORKER_NICE and hasattr(os, "nice"):
+        os.nice(JOB_WORKER_NICE)
+
+    # No state store here: the jobs read the database (see the module docstring)
+    job_worker = JobWorker(JobQueue(), handlers=handlers())
+    job_worker.start()
+    # Not daemonic (it may start a factor process pool), so it also stops when the API process is gone
+    parent = multiprocessing.parent_process()
+    while not stop_event.wait(1):
+        if parent is not None and not parent.is_alive():
+            print("❌ API process is gone, stopping the job worker")
+            break
+    job_worker.stop(timeout=5)
+    factor_pool.shutdown()
+    print(f"✓ Job worker {job_worker.worker_id} stopped")
+
+
+class WorkerProcess:
+    """Child process running the job worker, supervised from the API process"""
+
+    def __init__(self, job_queue: JobQueue, on_job_done: Optional[Callable[[Dict], None]] = None,
+                 spawn: bool = True, poll_seconds: float = JOB_POLL_SECONDS):
+        self.job_queue = job_queue
+        self.spawn = spawn
+        self.on_job_done = on_job_done
+        self.poll_seconds = poll_seconds
+        self._context = multiprocessing.get_context("spawn")
+        self._process = None
+        self._process_stop = None
+        self._stop = threading.Event()
+        self.stats = {"started": 0, "restarts": 0, "jobs_done": 0}
+
+    def _spawn(self):
+        self._process_stop = self._context.Event()
+        self._process = self._context.Process(target=run, args=(self._process_stop,), name="job-worker", daemon=False)
+        self._process.start()
+        self.stats["started"] += 1
+        print(f"✓ Worker process {self._process.pid} started")
+
+    def start(self):
+        """Starts the worker process (spawn=False: only watches for jobs done by an external worker)"""
+        if self.spawn:
+            self._spawn()
+
+        def supervise():
+            since = time.time()
+            while not self._stop.wait(self.poll_seconds):
+                if self.spawn and not self._process.is_alive():
+                    print(f"❌ Worker process exited ({self._process.exitcode}), restarting")
+                    self.stats["restarts"] += 1
+                    self._spawn()
+                try:
+                    for job in self.job_queue.finished_since(since):
+                        since = max(since, job["updated_at"])
+                        self.stats["jobs_done"] += 1
+                        if self.on_job_done is not None:
+                            self.on_job_done(job)
+                except Exception as e:
+                    print(f"❌ Error watching jobs: {str(e)}")
+
+        threading.Thread(target=supervise, name="worker-supervisor", daemon=True).start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """
+        Asks the worker to stop claiming jobs and joins it (it is not daemonic);
+        a running job is resumed from its checkpoint later
+        """
+        self._stop.set()
+        if self._process is None:
+            return
+        self._process_stop.set()
+        self._process.join(timeout)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join(timeout)
+
+    def metrics(self) -> Dict:
+        return {
+            **self.stats,
+            "mode": JOB_WORKER_MODE,
+            "pid": self._process.pid if self._process is not None else None,
+            "alive": self._process.is_alive() if self._process is not None else None
+        }
+
+
+def main():
+    """Main execution function"""
+    stop_event = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stop_event.set())
+    run(stop_event)
+
+
+if __name__ == "__main__":
+    main()